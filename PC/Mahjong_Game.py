@@ -1,28 +1,30 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
+import os
+import queue
 import time
-import struct
 from UART_handler import UARTHandler
+from UART_worker import UARTWorker
+from UART_discovery import PortDiscovery
+from UART_codec import Ack, Board, Hint, Leaderboard, Time, decode, decode_as
+from UART_protocol import (CMD_START, CMD_RESET, CMD_SHUFFLE, CMD_SELECT, CMD_MATCH, CMD_GIVE_UP,
+                           CMD_HINT, CMD_SET_NAME, CMD_GET_TIME, CMD_GET_LEADERS, CMD_LOAD_BOARD,
+                           CMD_RESTORE_BOARD)
+from Mahjong_engine import MahjongBoard, MAX_SHUFFLES
+from Mahjong_client import start_device
+from Mahjong_dealer import solvable_deal, new_seed
+from Mahjong_hints import HintEngine
+from Mahjong_layouts import LAYOUTS, get_layout
+from Mahjong_renderer import BoardRenderer
+from Mahjong_clock import GameClock
+from Mahjong_scores import ScoreStore
+from Mahjong_recorder import GAVE_UP, LEFT, LOST, WON, GameLog, Recorder, Replay
+from Mahjong_trace import enable_from_env, tracer, traced
 
 # --- CONFIGURATION ---
-CMD_START = 0x01
-CMD_RESET = 0x02
-CMD_SHUFFLE = 0x03
-CMD_SELECT = 0x04
-CMD_MATCH = 0x05
-CMD_GIVE_UP = 0x07
-CMD_HINT = 0x08
-CMD_SET_NAME = 0x09
-CMD_GET_TIME = 0x0B
-CMD_GET_LEADERS = 0x0C
-
-PACKET_SIZE = 52  # 50 tiles + 1 byte CMD + 1 byte CRC
-TILE_W, TILE_H, SHADOW_OFFSET = 50, 65, 4
-
-TILE_GROUPS = {
-    0: ("Bamboo", "#66BB6A"), 1: ("Chars", "#EF5350"), 2: ("Circles", "#42A5F5"),
-    3: ("Winds", "#BDBDBD"), 4: ("Dragons", "#FFEE58"), 5: ("Flowers", "#AB47BC"), 6: ("Seasons", "#FFA726")
-}
+UI_POLL_MS = 10  # How often the Tk loop picks up finished UART requests
+CLOCK_TICK_MS = 250  # Local clock display refresh; the device is only asked every CLOCK_RESYNC_SEC
+STATS_REFRESH_MS = 500  # Trace overlay (F12) refresh
 
 # --- MAIN MENU ---
 class MainMenu(tk.Frame):
@@ -44,8 +46,8 @@ class MainMenu(tk.Frame):
         frame_layout = tk.Frame(self, bg="#f0f0f0")
         frame_layout.pack(pady=(5, 15))
         tk.Label(frame_layout, text="Layout:", font=("Arial", 12), bg="#f0f0f0").grid(row=0, column=0, padx=5)
-        self.layout_var = tk.StringVar(value="Square Pyramid")
-        self.combo_layout = ttk.Combobox(frame_layout, textvariable=self.layout_var, values=["Square Pyramid", "Triangle Pyramid"], state="readonly", width=19)
+        self.layout_var = tk.StringVar(value=LAYOUTS[0].name)
+        self.combo_layout = ttk.Combobox(frame_layout, textvariable=self.layout_var, values=[layout.name for layout in LAYOUTS], state="readonly", width=19)
         self.combo_layout.grid(row=0, column=1)
 
         # Обмеження вводу до 10 символів
@@ -59,9 +61,12 @@ class MainMenu(tk.Frame):
         self.port_var = tk.StringVar()
         self.combo_ports = ttk.Combobox(frame_port, textvariable=self.port_var, width=15, state="readonly")
         self.combo_ports.grid(row=0, column=0, padx=10)
+        self.combo_ports.bind("<<ComboboxSelected>>", self.pick_port)
+        self.port_picked = False
         
         tk.Button(frame_port, text="↻", command=self.refresh_ports).grid(row=0, column=1)
-        tk.Button(self, text="CONNECT & PLAY", command=self.connect, bg="#4CAF50", fg="white", font=("Arial", 14, "bold"), pady=10).pack(pady=40)
+        tk.Button(self, text="CONNECT & PLAY", command=self.connect, bg="#4CAF50", fg="white", font=("Arial", 14, "bold"), pady=10).pack(pady=(40, 10))
+        tk.Button(self, text="Replay last game", command=self.replay_last).pack()
 
     def limit_name(self, new_value):
         return len(new_value) <= 10
@@ -70,10 +75,19 @@ class MainMenu(tk.Frame):
         print(f"[{time.strftime('%H:%M:%S')}] {msg}")
 
     def refresh_ports(self):
-        ports = UARTHandler.list_available_ports()
-        self.combo_ports['values'] = ports
-        if ports: self.combo_ports.current(0)
-        else: self.port_var.set("No Ports Found")
+        # Cached list right away; the discovery thread rescans and calls show_ports if anything changed
+        self.show_ports(self.controller.discovery.snapshot())
+        self.controller.discovery.rescan()
+
+    def show_ports(self, ports):
+        # Detected boards are listed first, so the first entry is picked unless the user chose another
+        names = [info.device for info in ports]
+        self.combo_ports['values'] = names
+        if not names: self.port_var.set("No Ports Found")
+        elif not (self.port_picked and self.port_var.get() in names): self.combo_ports.current(0)
+
+    def pick_port(self, event=None):
+        self.port_picked = True
 
     def connect(self):
         self.log("Attempting to connect...")
@@ -87,48 +101,58 @@ class MainMenu(tk.Frame):
         if not port or port == "No Ports Found": 
             self.log("No port selected or available.")
             return
-            
-        self.controller.uart.port_name = port
-        if self.controller.uart.open_port():
-            self.log(f"Connected to {port}")
-            self.controller.uart.dtr_reset()
-            time.sleep(1.5)
-            
-            self.send_player_name(name)
-            
-            # Save Layout choice to the game view for later use
-            self.controller.game_view.layout_id = 1 if self.layout_var.get() == "Triangle Pyramid" else 0
-            
-            self.controller.game_view.player_name = name 
-            self.controller.show_game()
 
-    def send_player_name(self, name):
-        self.log(f"Registering player name: {name}")
-        self.controller.uart.reset_buffer()
-        
-        if self.controller.uart.send_name_packet(CMD_SET_NAME, name):
-            # Чекаємо 3-байтовий ACK від STM32
-            resp = self.controller.uart.read_packet_strictly(3, timeout_sec=1.0)
-            if resp and resp[0] == CMD_SET_NAME and resp[1] == 0x00:
-                self.log(f"Name '{name}' successfully saved to STM32 RAM.")
-            else:
-                self.log("Warning: STM32 did not acknowledge the name.")
-        else:
-            self.log("Failed to send name packet.")
+        layout_id = max(0, self.combo_layout.current())
+        self.lbl_status.config(text=f"Connecting to {port}...")
+        self.controller.discovery.claim(port)
+        # Opening, the DTR reset and its settle time all run on the UART thread
+        self.controller.uart_worker.call(
+            lambda uart: self.open_and_start(uart, port, name, layout_id),
+            lambda responses: self.on_connected(responses, port, name, layout_id))
 
-    def send_player_name(self, name):
+    def open_and_start(self, uart, port, name, layout_id):
+        # Runs on the UART worker thread
         self.log(f"Registering player name: {name}")
-        self.controller.uart.reset_buffer()
-        
-        if self.controller.uart.send_name_packet(CMD_SET_NAME, name):
-            # Чекаємо 3-байтовий ACK від STM32
-            resp = self.controller.uart.read_packet_strictly(3, timeout_sec=1.0)
-            if resp and resp[0] == CMD_SET_NAME and resp[1] == 0x00:
-                self.log(f"Name '{name}' successfully saved to STM32 RAM.")
-            else:
-                self.log("Warning: STM32 did not acknowledge the name.")
+        return start_device(uart, port, name, self.controller.game_view.deal_command(layout_id))
+
+    def on_connected(self, result, port, name, layout_id):
+        if result is None:
+            self.log(f"Failed to open {port}")
+            self.lbl_status.config(text=f"Failed to open {port}")
+            self.controller.discovery.release(port)
+            return
+
+        self.controller.device_key, responses = result
+
+        self.log(f"Connected to {port}")
+        self.lbl_status.config(text="Ready")
+        self.check_name_ack(name, responses[0])
+
+        # Save Layout choice to the game view for later use
+        self.controller.game_view.layout_id = layout_id
+
+        self.controller.game_view.player_name = name 
+        self.controller.show_game(responses[1:])
+
+    def replay_last(self):
+        # Read out and closed right away: the mapping would keep the log locked against the recorder
+        try:
+            with GameLog(self.controller.recorder.path) as log:
+                game = log.last_game()
+        except OSError:
+            game = None
+        if game is None:
+            messagebox.showinfo("Replay", "No recorded games yet.")
+            return
+        self.controller.show_replay(game)
+
+    def check_name_ack(self, name, resp):
+        # Чекаємо 3-байтовий ACK від STM32
+        ack = decode_as(resp, CMD_SET_NAME, Ack)
+        if ack and ack.ok:
+            self.log(f"Name '{name}' successfully saved to STM32 RAM.")
         else:
-            self.log("Failed to send name packet.")
+            self.log("Warning: STM32 did not acknowledge the name.")
 
 # --- GAME INTERFACE ---
 class GameInterface(tk.Frame):
@@ -136,17 +160,25 @@ class GameInterface(tk.Frame):
         super().__init__(parent)
         self.controller = controller
         self.timer_active = False
+        self.clock = GameClock()
+        self.clock_job = None
         self.current_board_data = None
-        self.hitboxes = []
         self.selected_index = None
+        self.board = MahjongBoard() # Local copy of the device rules, answers clicks instantly
+        self.hints = HintEngine(self.board)
+        self.recovering = False
         self.error_tiles = []
-        self.shuffles_left = 5
+        self.shuffles_left = MAX_SHUFFLES
         self.hint_tiles = []
+        self.replay = None # Replay on screen; the board takes no input meanwhile
         
         self.info_frame = tk.Frame(self, bg="#f0f0f0")
         self.info_frame.pack(fill=tk.X)
         self.timer_label = tk.Label(self.info_frame, text="Time: 00:00", font=("Arial", 12, "bold"), bg="#f0f0f0")
         self.timer_label.pack(side="left", padx=20)
+        self.stats_label = tk.Label(self.info_frame, font=("Consolas", 8), bg="#f0f0f0", anchor="w", justify="left")
+        self.stats_job = None
+        controller.bind("<F12>", self.toggle_stats)
 
         toolbar = tk.Frame(self, bg="#ddd", pady=10)
         toolbar.pack(fill=tk.X)
@@ -162,6 +194,7 @@ class GameInterface(tk.Frame):
         self.canvas = tk.Canvas(self, bg="#333333")
         self.canvas.pack(fill=tk.BOTH, expand=True)
         self.canvas.bind("<Button-1>", self.on_canvas_click)
+        self.renderer = BoardRenderer(self.canvas)
 
     def log(self, msg):
         print(f"[{time.strftime('%H:%M:%S')}] {msg}")
@@ -169,98 +202,164 @@ class GameInterface(tk.Frame):
     def exit_to_menu(self):
         self.log("Exiting to menu...")
         self.timer_active = False 
-        self.controller.uart.close_port()
+        self.replay = None
+        self.controller.recorder.end_game(LEFT)
+        self.controller.uart_worker.call(lambda uart: uart.close_port())
         self.controller.show_menu()
 
     def handle_error(self, retry_func, *args):
-        self.controller.uart_busy = False # Release lock on error
-        self.log("Communication error! Opening dialog...")
+        # Requests queued behind the failed one fail too; only the first starts the recovery.
+        # Short glitches were already retried by the handler, so this reconnects straight away
+        # (waiting a moment for a replugged cable) and only asks the user if that fails.
+        if self.recovering: return
+        self.recovering = True
+        self.log("Communication error! Reconnecting...")
+        self.controller.uart_worker.call(
+            self.reconnect_and_probe,
+            lambda result: self.on_reconnect(result, retry_func, *args))
+
+    def reconnect_and_probe(self, uart):
+        # Runs on the UART worker thread: (reopened?, device timer or None)
+        if not uart.reconnect():
+            return False, None
+        resp = uart.exchange(CMD_GET_TIME, 0x00, 0.5)
+        reading = decode_as(resp, CMD_GET_TIME, Time)
+        return True, reading.seconds if reading else None
+
+    def on_reconnect(self, result, retry_func, *args):
+        ok, device_seconds = result
+        if not ok:
+            self.log("Reconnection failed.")
+            self.ask_retry(retry_func, *args)
+            return
+
+        self.log("Reconnected! Retrying...")
+        self.clock.request_resync()
+        # A device that lost power comes back with a fresh timer: give it the name and the board back
+        if self.timer_active and (device_seconds is None or device_seconds + 2 < self.clock.seconds()):
+            self.restore_session(retry_func, *args)
+        else:
+            self.recovering = False
+            retry_func(*args)
+
+    def ask_retry(self, retry_func, *args):
         answer = messagebox.askretrycancel(
-            "Connection Lost", 
+            "Connection Lost",
             "STM32 is not responding. Check the cable and click 'Retry' to continue."
         )
+        self.recovering = False
         if answer:
-            if self.controller.uart.reconnect():
-                self.log("Reconnected! Retrying...")
-                retry_func(*args)
-            else:
-                self.log("Reconnection failed.")
-                self.handle_error(retry_func, *args)
+            self.handle_error(retry_func, *args)
         else:
             self.log("User chose to exit to menu.")
             self.exit_to_menu()
+
+    def restore_session(self, retry_func, *args):
+        self.log("STM32 lost the game, restoring it")
+        # The device continues the game clock and the shuffle count from ours, so a win is timed
+        # and limited the same as without the reconnect
+        layout_mode = getattr(self, 'layout_id', 0)
+        shuffles_used = MAX_SHUFFLES - self.shuffles_left
+        session = (layout_mode, bytes(self.board.tiles), self.clock.seconds(), shuffles_used)
+        self.send_transaction([(CMD_SET_NAME, getattr(self, 'player_name', ""), 1.0),
+                               (CMD_RESTORE_BOARD, session, 2.0)],
+                              lambda responses: self.on_session_restored(responses, shuffles_used, retry_func, *args))
+
+    def on_session_restored(self, responses, shuffles_used, retry_func, *args):
+        if decode_as(responses[1], CMD_RESTORE_BOARD, Board):
+            self.recovering = False
+            self.log("Session restored")
+            self.update_shuffle_counter(MAX_SHUFFLES - shuffles_used)  # What the device accepted
+            retry_func(*args)
+        else:
+            self.log("Failed to restore the session")
+            self.ask_retry(retry_func, *args)
     
-    def validate_response(self, cmd_sent, response, expected_size):
-        if not response or response[0] != cmd_sent or len(response) != expected_size:
-            return False, None
-        return True, response
+    def send_command(self, cmd, data, timeout_sec, callback):
+        # Queue the command on the UART thread; `callback(resp)` runs later on the Tk thread.
+        # Returns the UARTRequest (its `rtt` is set by the time the callback runs)
+        return self.controller.uart_worker.command(cmd, data, timeout_sec, callback)
+
+    def send_transaction(self, commands, callback):
+        # Several commands in one burst on the UART thread; `callback(responses)` runs on the Tk thread
+        return self.controller.uart_worker.transaction(commands, callback)
+
+    def deal_command(self, layout_id):
+        # New games use a PC-dealt board that is always winnable; the seed reproduces it
+        self.deal_seed = new_seed()
+        tiles, _ = solvable_deal(self.deal_seed, layout_id)
+        return (CMD_LOAD_BOARD, (layout_id, tiles), 2.0)
 
     def send_reset_command(self):
-        self.log("CMD_RESET sent")
+        if self.replay: return
+        self.log("CMD_RESET + CMD_LOAD_BOARD sent")
         self.timer_active = False 
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        if not self.controller.uart.send_packet(CMD_RESET, 0x00):
-            self.handle_error(self.send_reset_command)
-            return
-        
-        resp = self.controller.uart.read_packet_strictly(3, timeout_sec=1.0)
-        self.controller.uart_busy = False
-        
-        if self.validate_response(CMD_RESET, resp, 2)[0]:
-            self.log("CMD_RESET acknowledged - Waiting for board...")
-            self.after(500, self.send_start_command)
+        layout_mode = getattr(self, 'layout_id', 0)
+        self.send_transaction([(CMD_RESET, 0x00, 1.0), self.deal_command(layout_mode)], self.on_reset_responses)
+
+    def on_reset_responses(self, responses):
+        reset_resp, start_resp = responses
+        if decode_as(reset_resp, CMD_RESET, Ack):
+            self.log("CMD_RESET acknowledged")
+            self.on_load_response(start_resp)
         else:
             self.log("No valid response to CMD_RESET")
             self.handle_error(self.send_reset_command)
 
     def send_start_command(self):
         self.log("CMD_START sent - Waiting for board...")
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
         layout_mode = getattr(self, 'layout_id', 0)
-        if not self.controller.uart.send_packet(CMD_START, layout_mode):
-            self.handle_error(self.send_start_command)
-            return
-        
-        resp = self.controller.uart.read_packet_strictly(PACKET_SIZE, timeout_sec=10.0)
-        self.controller.uart_busy = False
-        
-        valid, payload = self.validate_response(CMD_START, resp, 51)
-        if valid:
+        self.send_command(CMD_START, layout_mode, 10.0, self.on_start_response)
+
+    def on_load_response(self, resp):
+        # The device echoes the loaded board; if it rejected it (or doesn't know the command)
+        # let it deal one itself
+        if decode_as(resp, CMD_LOAD_BOARD, Board):
+            self.log(f"Deal {self.deal_seed} loaded")
+            self.on_start_response(resp, CMD_LOAD_BOARD)
+        else:
+            self.log("Board not loaded, falling back to CMD_START")
+            self.deal_seed = None
+            self.send_start_command()
+
+    def on_start_response(self, resp, cmd=CMD_START):
+        board = decode_as(resp, cmd, Board)
+        if board:
             self.log("Board received successfully!")
             self.selected_index = None
-            self.update_shuffle_counter(5)
-            self.draw_pyramid(payload[1:])
+            self.update_shuffle_counter(MAX_SHUFFLES)
+            self.board.load(board.tiles, getattr(self, 'layout_id', 0))
+            self.controller.recorder.start_game(getattr(self, 'layout_id', 0),
+                                                self.deal_seed if cmd == CMD_LOAD_BOARD else None, board.tiles)
+            self.hints.rebuild()
+            self.draw_pyramid(board.tiles)
             
             self.timer_active = True
+            self.clock.start() # Device restarted its timer when it answered CMD_START
             self.update_clock()
         else:
             self.log("Failed to receive valid board after CMD_START")
             self.handle_error(self.send_start_command)
 
     def send_shuffle_command(self):
+        if self.replay: return
         self.log("CMD_SHUFFLE sent")
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        if not self.controller.uart.send_packet(CMD_SHUFFLE, 0x00):
-            self.handle_error(self.send_shuffle_command)
-            return
+        request = self.send_command(CMD_SHUFFLE, 0x00, 4.0,
+                                    lambda resp: [self.controller.recorder.answer(CMD_SHUFFLE, resp, request.rtt),
+                                                  self.on_shuffle_response(resp)])
 
-        resp = self.controller.uart.read_packet_strictly(PACKET_SIZE, timeout_sec=4.0)
-        self.controller.uart_busy = False
-        
-        if resp and len(resp) == 51: 
+    def on_shuffle_response(self, resp):
+        reply = decode(resp, CMD_SHUFFLE)
+        if isinstance(reply, Board):
             self.log("New board received after shuffle")
             self.update_shuffle_counter(self.shuffles_left - 1)
             self.selected_index = None
-            self.draw_pyramid(resp[1:])
+            self.board.load(reply.tiles)
+            self.hints.rebuild()
+            self.draw_pyramid(reply.tiles)
             self.check_game_over()
         else:
-            if resp and len(resp) == 2 and resp[1] == 0xFF:
+            if isinstance(reply, Ack) and reply.refused:
                 self.check_game_over()
                 self.log("Shuffle limit reached")
                 messagebox.showwarning("Shuffle", "Limit reached!")
@@ -269,115 +368,122 @@ class GameInterface(tk.Frame):
                 self.log("Failed to receive valid response after CMD_SHUFFLE")
                 self.handle_error(self.send_shuffle_command)
 
+    def select_tile(self, index):
+        # Decided locally right away; the device confirms with CMD_SELECT in the background
+        if not self.board.select(index):
+            self.error_tiles.append(index)
+            self.draw_pyramid(self.current_board_data)
+            self.after(500, self.clear_blink)
+            return
+        self.selected_index = index
+        self.draw_pyramid(self.current_board_data)
+        self.send_select_command(index)
+
     def send_select_command(self, index):
         self.log(f"CMD_SELECT sent for index {index}")
-        
-        # Lock the door
-        self.controller.uart_busy = True 
-        try:
-            self.controller.uart.reset_buffer()
-            if self.controller.uart.send_packet(CMD_SELECT, index):
-                resp = self.controller.uart.read_packet_strictly(3, timeout_sec=2.0)
-                
-                # Keep all your existing success/error logic here) ...
-                if resp and resp[0] == CMD_SELECT:
-                    if resp[1] == 0x00:
-                        self.selected_index = index if self.selected_index != index else None
-                        self.draw_pyramid(self.current_board_data)
-                    else:
-                        self.error_tiles.append(index)
-                        self.draw_pyramid(self.current_board_data)
-                        
-                        # ---> FIX: Change clear_errors to clear_blink <---
-                        self.after(500, self.clear_blink) 
-                else:
-                    self.handle_error(lambda: self.send_select_command(index))
-            else:
-                self.handle_error(lambda: self.send_select_command(index))
-                
-        finally:
-            # Unlock the door
-            self.controller.uart_busy = False
+        request = self.send_command(CMD_SELECT, index, 2.0,
+                                    lambda resp: [self.controller.recorder.answer(CMD_SELECT, resp, request.rtt, index),
+                                                  self.on_select_response(index, resp)])
+
+    def on_select_response(self, index, resp):
+        ack = decode_as(resp, CMD_SELECT, Ack)
+        if ack:
+            if not ack.ok:
+                # Device disagrees: roll the selection back
+                self.log(f"STM32 rejected selection of {index}")
+                if self.selected_index == index: self.selected_index = None
+                self.show_error_blink([index])
+        else:
+            self.handle_error(self.send_select_command, index)
 
-    def send_match_command(self, index):
-        self.log(f"CMD_MATCH sent for index {index}")
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        if not self.controller.uart.send_packet(CMD_MATCH, index):
-            self.handle_error(self.send_match_command, index)
+    def match_tiles(self, first, index):
+        # Optimistic match: the pair disappears now, CMD_MATCH confirms (or undoes) it later
+        self.selected_index = None
+        t1, t2 = self.board.tiles[first], self.board.tiles[index]
+        self.board.active_selection = first
+        if not self.board.match(index):
+            self.show_error_blink([first, index])
             return
-        
-        resp = self.controller.uart.read_packet_strictly(3, timeout_sec=1.0)
-        self.controller.uart_busy = False
-        
-        valid, payload = self.validate_response(CMD_MATCH, resp, 2)
-        if valid:
-            if payload[1] == 0x01: 
-                temp_board = bytearray(self.current_board_data)
-                temp_board[self.selected_index] = 0x00
-                temp_board[index] = 0x00
-                self.current_board_data = bytes(temp_board)
-                self.selected_index = None
-                self.draw_pyramid(self.current_board_data)
-                self.check_game_over()
-                if all(val == 0 for val in self.current_board_data): 
-                    self.timer_active = False # Stop clock on win
-                    self.after(500, lambda: self.show_end_game_popup("VICTORY!", "You cleared the board!", "#2E7D32", is_victory=True))
+        self.hints.removed(first, index)
+        self.current_board_data = bytes(self.board.tiles)
+        self.draw_pyramid(self.current_board_data)
+        self.send_match_command(first, index, t1, t2)
+
+    def send_match_command(self, first, index, t1, t2):
+        self.log(f"CMD_MATCH sent for index {index}")
+        request = self.send_command(CMD_MATCH, index, 1.0,
+                                    lambda resp: [self.controller.recorder.answer(CMD_MATCH, resp, request.rtt, first, index),
+                                                  self.on_match_response(first, index, t1, t2, resp)])
+
+    def retry_match(self, first, index, t1, t2):
+        # After a reconnect the device selection may be gone: send SELECT + MATCH as one burst
+        self.log(f"Retrying match {first} + {index}")
+        self.board.remove(first, index)
+        self.hints.removed(first, index)
+        self.current_board_data = bytes(self.board.tiles)
+        self.draw_pyramid(self.current_board_data)
+        request = self.send_transaction([(CMD_SELECT, first, 2.0), (CMD_MATCH, index, 1.0)],
+                                        lambda responses: [self.controller.recorder.answer(CMD_MATCH, responses[1], request.rtt,
+                                                                                           first, index),
+                                                           self.on_match_response(first, index, t1, t2, responses[1])])
+
+    def on_match_response(self, first, index, t1, t2, resp):
+        ack = decode_as(resp, CMD_MATCH, Ack)
+        if ack and ack.matched:
+            if self.board.is_cleared(): 
+                self.timer_active = False # Stop clock on win
+                self.clock.stop()  # The win time recorded below must not keep counting
+                self.controller.recorder.end_game(WON)
+                self.after(500, lambda: self.show_end_game_popup("VICTORY!", "You cleared the board!", "#2E7D32", is_victory=True))
             else:
-                old_idx = self.selected_index
-                self.selected_index = None
-                self.show_error_blink([old_idx, index])
+                self.check_game_over()
+            return
+
+        # Device refused the pair (or never answered): put the tiles back
+        self.board.restore(first, t1, index, t2)
+        self.hints.restored(first, index)
+        self.current_board_data = bytes(self.board.tiles)
+        if ack:
+            self.log(f"STM32 rejected match {first} + {index}, rolling back")
+            self.show_error_blink([first, index])
         else:
-            self.handle_error(self.send_match_command, index)
+            self.draw_pyramid(self.current_board_data)
+            self.handle_error(self.retry_match, first, index, t1, t2)
 
     def request_hint(self):
-        self.log("CMD_HINT sent")
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        if not self.controller.uart.send_packet(CMD_HINT, 0x00):
-            self.handle_error(self.request_hint)
-            return
-
-        resp = self.controller.uart.read_packet_strictly(4, timeout_sec=1.5)
-        self.controller.uart_busy = False
-        
-        valid, payload = self.validate_response(CMD_HINT, resp, 3)
-        if valid:
-            idx1, idx2 = payload[1], payload[2]
-            if idx1 == 100:
-                messagebox.showinfo("Hint", "No pairs left!")
-            else:
-                self.show_hint_blink([idx1, idx2])
+        # Answered locally from the hint engine, no serial round trip
+        if self.replay: return
+        hint = self.hints.best()
+        self.controller.recorder.hint(hint)
+        self.log(f"Hint: {hint}")
+        if hint is None:
+            messagebox.showinfo("Hint", "No pairs left!")
         else:
-            self.handle_error(self.request_hint)
+            self.show_hint_blink(list(hint))
 
     def send_giveup_command(self):
+        if self.replay: return
         self.timer_active = False
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        if self.controller.uart.send_packet(CMD_GIVE_UP, 0x00):
-            resp = self.controller.uart.read_packet_strictly(3, timeout_sec=1.0)
-            self.controller.uart_busy = False
-            if resp: self.exit_to_menu()
-        else:
-            self.handle_error(self.send_giveup_command)
+        self.clock.stop()
+        self.controller.recorder.end_game(GAVE_UP)
+        self.send_command(CMD_GIVE_UP, 0x00, 1.0, self.on_giveup_response)
+
+    def on_giveup_response(self, resp):
+        if resp: self.exit_to_menu()
 
     def check_game_over(self):
         if self.shuffles_left > 0: return
-
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        if self.controller.uart.send_packet(CMD_HINT, 0x00):
-            resp = self.controller.uart.read_packet_strictly(4, timeout_sec=1.5)
-            self.controller.uart_busy = False
-            valid, payload = self.validate_response(CMD_HINT, resp, 3)
-            if valid and payload[1] == 100: 
-                self.timer_active = False # Stop clock on lose
-                self.show_end_game_popup("GAME OVER", "No moves left & no shuffles.", "#D32F2F")
+        if self.hints.has_moves(): return
+        # Locally stuck: let the device confirm before ending the game
+        self.send_command(CMD_HINT, 0x00, 1.5, self.on_game_over_hint)
+
+    def on_game_over_hint(self, resp):
+        hint = decode_as(resp, CMD_HINT, Hint)
+        if hint and not hint.found: 
+            self.timer_active = False # Stop clock on lose
+            self.clock.stop()
+            self.controller.recorder.end_game(LOST)
+            self.show_end_game_popup("GAME OVER", "No moves left & no shuffles.", "#D32F2F")
 
     def show_end_game_popup(self, title, message, color, is_victory=False):
         popup = tk.Toplevel(self)
@@ -392,32 +498,18 @@ class GameInterface(tk.Frame):
         
         # ---> NEW: Draw Leaderboard if Victory <---
         if is_victory:
-            leaders = self.fetch_leaderboard()
-            if leaders:
-                lb_frame = tk.Frame(popup, bg="#f0f0f0")
-                lb_frame.pack(pady=10, fill=tk.BOTH, expand=True, padx=20)
-                
-                tk.Label(lb_frame, text="🏆 TOP 10 PLAYERS 🏆", font=("Arial", 12, "bold"), bg="#f0f0f0", fg="#FFA000").pack(pady=(0, 5))
-                
-                # Create a Treeview table
-                columns = ("rank", "name", "time")
-                tree = ttk.Treeview(lb_frame, columns=columns, show="headings", height=10)
-                tree.heading("rank", text="#")
-                tree.heading("name", text="Player Name")
-                tree.heading("time", text="Time (s)")
-                
-                tree.column("rank", width=30, anchor="center")
-                tree.column("name", width=150, anchor="w")
-                tree.column("time", width=80, anchor="center")
-                tree.pack(fill=tk.BOTH, expand=True)
-                
-                # Populate the table
-                for i, (name, p_time) in enumerate(leaders):
-                    display_time = f"{p_time} s" if p_time < 999999 else "---"
-                    disp_name = name if name and name != "---" else "Empty Slot"
-                    tree.insert("", "end", values=(i+1, disp_name, display_time))
+            scores = self.controller.scores
+            scores.record_game(self.controller.device_key, getattr(self, 'player_name', ""), self.clock.seconds(),
+                               getattr(self, 'layout_id', 0), self.deal_seed)
+            # The cached table shows up at once; the device's copy replaces it only if it changed
+            lb_frame = tk.Frame(popup, bg="#f0f0f0")
+            lb_frame.pack(pady=10, fill=tk.BOTH, expand=True, padx=20)
+            cached = scores.leaderboard(self.controller.device_key)
+            if cached:
+                self.fill_leaderboard(lb_frame, cached)
             else:
-                tk.Label(popup, text="Failed to load leaderboard.", fg="red", bg="#f0f0f0").pack(pady=10)
+                tk.Label(lb_frame, text="Loading leaderboard...", font=("Arial", 10, "italic"), bg="#f0f0f0").pack(pady=10)
+            self.fetch_leaderboard(lambda leaders: self.on_leaderboard(lb_frame, leaders, bool(cached)))
 
         # Buttons
         btn_frame = tk.Frame(popup, bg="#f0f0f0")
@@ -427,45 +519,106 @@ class GameInterface(tk.Frame):
                   command=lambda: [popup.destroy(), self.send_reset_command()]).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Menu", width=10, bg="#607D8B", fg="white",
                   command=lambda: [popup.destroy(), self.exit_to_menu()]).pack(side=tk.LEFT, padx=5)
+
+    def on_leaderboard(self, lb_frame, leaders, showing_cache):
+        if self.sync_leaderboard(leaders) or (leaders is None and not showing_cache):
+            self.fill_leaderboard(lb_frame, leaders)
+
+    def sync_leaderboard(self, leaders):
+        # True when the device's leaderboard differs from the local copy (which is then updated)
+        if leaders is None or self.controller.device_key is None:
+            return False
+        return self.controller.scores.sync(self.controller.device_key, leaders)
+
+    def fill_leaderboard(self, lb_frame, leaders):
+        if not lb_frame.winfo_exists(): return # Popup was closed before the data arrived
+        for child in lb_frame.winfo_children(): child.destroy()
+
+        if not leaders:
+            tk.Label(lb_frame, text="Failed to load leaderboard.", fg="red", bg="#f0f0f0").pack(pady=10)
+            return
+
+        tk.Label(lb_frame, text="🏆 TOP 10 PLAYERS 🏆", font=("Arial", 12, "bold"), bg="#f0f0f0", fg="#FFA000").pack(pady=(0, 5))
+        
+        # Create a Treeview table
+        columns = ("rank", "name", "time")
+        tree = ttk.Treeview(lb_frame, columns=columns, show="headings", height=10)
+        tree.heading("rank", text="#")
+        tree.heading("name", text="Player Name")
+        tree.heading("time", text="Time (s)")
+        
+        tree.column("rank", width=30, anchor="center")
+        tree.column("name", width=150, anchor="w")
+        tree.column("time", width=80, anchor="center")
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        # Populate the table
+        for i, entry in enumerate(leaders):
+            display_time = "---" if entry.empty else f"{entry.seconds} s"
+            disp_name = entry.name if entry.name and entry.name != "---" else "Empty Slot"
+            tree.insert("", "end", values=(i+1, disp_name, display_time))
         
     def update_clock(self):
+        if self.clock_job is not None:
+            self.after_cancel(self.clock_job) # Never run two clock loops after a restart
+            self.clock_job = None
         if not self.timer_active:
             return 
-            
-        #Lock: If UART is busy drawing the board or clicking tiles, skip this second.
-        if not self.controller.uart_busy:
-            elapsed_seconds = self.controller.get_timer_from_stm32()
-            
-            if elapsed_seconds is not None:
-                mins = elapsed_seconds // 60
-                secs = elapsed_seconds % 60
-                self.timer_label.config(text=f"Time: {mins:02d}:{secs:02d}")
+
+        self.show_time(self.clock.seconds())
+        # Occasional background poll to correct drift; clicks overtake it
+        if self.clock.needs_resync():
+            self.clock.begin_resync()
+            self.controller.get_timer_from_stm32(self.on_time_sample)
         
-        self.after(1000, self.update_clock)
+        self.clock_job = self.after(CLOCK_TICK_MS, self.update_clock)
+
+    def on_time_sample(self, elapsed_seconds):
+        if elapsed_seconds is not None and self.timer_active:
+            self.clock.sync(elapsed_seconds)
+            self.show_time(self.clock.seconds())
+
+    def show_time(self, elapsed_seconds):
+        text = f"Time: {elapsed_seconds // 60:02d}:{elapsed_seconds % 60:02d}"
+        if self.timer_label.cget("text") != text:
+            self.timer_label.config(text=text)
 
     def update_shuffle_counter(self, count):
         self.shuffles_left = max(0, count)
         self.lbl_shuffles.config(text=f"Attempts: {self.shuffles_left}", fg="red" if self.shuffles_left == 0 else "black")
         self.btn_shuffle.config(state="disabled" if self.shuffles_left == 0 else "normal")
 
+    def toggle_stats(self, event=None):
+        # F12: live trace counters under the clock (turns tracing on if it was off)
+        if self.stats_job is not None:
+            self.after_cancel(self.stats_job)
+            self.stats_job = None
+            self.stats_label.pack_forget()
+            return
+        tracer.enable()
+        self.stats_label.pack(side="left", fill=tk.X, expand=True)
+        self.update_stats()
+
+    def update_stats(self):
+        self.stats_label.config(text=tracer.overlay_text())
+        self.stats_job = self.after(STATS_REFRESH_MS, self.update_stats)
+
+    @traced("ui.canvas_click")
     def on_canvas_click(self, event):
-        if not self.current_board_data or self.controller.uart_busy:
-            return # Ignore clicks if the line is busy!
+        if not self.current_board_data or self.replay:
+            return
             
-        clicked_idx = -1
-        for hb in reversed(self.hitboxes):
-            x1, y1, x2, y2, idx = hb
-            if x1 <= event.x <= x2 and y1 <= event.y <= y2:
-                clicked_idx = idx; break
+        clicked_idx = self.renderer.hit_test(event.x, event.y)
         if clicked_idx == -1: return
-        
+
+        # Rules run locally, so the board reacts in the same frame; commands queue up in click order
         if self.selected_index is None:
-            self.send_select_command(clicked_idx)
+            self.select_tile(clicked_idx)
         elif clicked_idx == self.selected_index:
             self.selected_index = None
             self.draw_pyramid(self.current_board_data)
         else:
-            self.send_match_command(clicked_idx)
+            self.match_tiles(self.selected_index, clicked_idx)
 
     def show_error_blink(self, indices):
         self.error_tiles = indices
@@ -485,170 +638,99 @@ class GameInterface(tk.Frame):
         self.hint_tiles = []
         if self.current_board_data: self.draw_pyramid(self.current_board_data)
 
+    @traced("ui.draw_pyramid")
     def draw_pyramid(self, data):
-        self.canvas.delete("all")
-        self.hitboxes = []
+        # Incremental: only tiles whose content or highlight changed are touched on the canvas
         self.current_board_data = data
-        self.update_idletasks()
-        cx, cy = self.canvas.winfo_width()/2, self.canvas.winfo_height()/2
-        
-        def draw_tile(idx, gx, gy, z, ox, oy):
-            if idx >= len(data) or data[idx] == 0: return
-            val_byte = data[idx]
-            gid, val = (val_byte >> 5) & 0x07, val_byte & 0x1F
-            name, color = TILE_GROUPS.get(gid, ("?", "white"))
-            
-            x = start_x + (gx + ox) * TILE_W - (z * SHADOW_OFFSET)
-            y = start_y + (gy + oy) * TILE_H - (z * SHADOW_OFFSET)
-            self.hitboxes.append((x, y, x+TILE_W, y+TILE_H, idx))
-
-            border, b_w = ("black", 1)
-            if idx == self.selected_index: border, b_w = "cyan", 3
-            if idx in self.error_tiles: border, b_w = "red", 3
-            if idx in self.hint_tiles: border, b_w = "yellow", 4
-
-            self.canvas.create_rectangle(x+4, y+4, x+TILE_W+4, y+TILE_H+4, fill="#1a1a1a", outline="")
-            self.canvas.create_rectangle(x, y, x+TILE_W, y+TILE_H, fill="#f0f0f0", outline=border, width=b_w)
-            self.canvas.create_rectangle(x+2, y+2, x+TILE_W-2, y+TILE_H-2, fill=color, outline="")
-            self.canvas.create_text(x+TILE_W/2, y+TILE_H/2-5, text=str(val), font=("Arial", 14, "bold"))
-            self.canvas.create_text(x+TILE_W/2, y+TILE_H-10, text=name[:3], font=("Arial", 7))
-
-        i = 0
-        layout_mode = getattr(self, 'layout_id', 0)
-        
-        if layout_mode == 0:
-            # Default Square Layout
-            start_x, start_y = cx - (2.5 * TILE_W), cy - (2.5 * TILE_H)
-            for r in range(5):
-                for c in range(5): draw_tile(i, c, r, 0, 0, 0); i += 1
-            for r in range(4):
-                for c in range(4): draw_tile(i, c, r, 1, 0.5, 0.5); i += 1
-            for r in range(3):
-                for c in range(3): draw_tile(i, c, r, 2, 1, 1); i += 1
-        else:
-            # Symmetrical Triangle Pyramid Layout
-            start_x = cx - (TILE_W / 2.0)  # Perfectly center the peak
-            start_y = cy - (3.5 * TILE_H)  # Perfectly vertically center the 7 rows
-            
-            for layer in range(4):
-                num_rows = 7 - (2 * layer)
-                for row in range(num_rows):
-                    num_cols = row + 1
-                    for col in range(num_cols):
-                        if i >= 50: break
-                        
-                        # Use the exact math from your test_pyramid.py!
-                        x_offset = col - (row / 2.0)
-                        y_offset = layer + row
-                        
-                        # Pass x_offset to gx, y_offset to gy, layer to z, and 0 to ox/oy
-                        draw_tile(i, x_offset, y_offset, layer, 0, 0)
-                        i += 1
-
-    def fetch_leaderboard(self):
-        self.log("Fetching leaderboard from STM32...")
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        # Send the request
-        if not self.controller.uart.send_packet(CMD_GET_LEADERS, 0x00):
-            self.controller.uart_busy = False
-            return None
-            
-        # Read the 202-byte response (1 CMD + 200 DATA + 1 CRC)
-        resp = self.controller.uart.read_packet_strictly(202, timeout_sec=2.0)
-        self.controller.uart_busy = False
-        
-        if resp and len(resp) == 201 and resp[0] == CMD_GET_LEADERS:
-            payload = resp[1:] # Strip the CMD byte
-            leaders = []
-            
-            for i in range(10):
-                chunk = payload[i*20 : (i+1)*20]
-                # Unpack: 16-byte string (16s) and 4-byte unsigned int (I)
-                name_raw, play_time = struct.unpack('<16sI', chunk)
-                name = name_raw.decode('utf-8', errors='ignore').strip('\x00')
-                leaders.append((name, play_time))
-                
-            return leaders
-            
-        self.log("Failed to receive or parse leaderboard packet.")
-        return None
+        layout = get_layout(getattr(self, 'layout_id', 0))
+        self.renderer.sync(data, layout, self.selected_index, self.error_tiles, self.hint_tiles)
 
-    def fetch_leaderboard(self):
+    def fetch_leaderboard(self, callback):
         self.log("Fetching leaderboard from STM32...")
-        self.controller.uart_busy = True
-        self.controller.uart.reset_buffer()
-        
-        # Send the request
-        if not self.controller.uart.send_packet(CMD_GET_LEADERS, 0x00):
-            self.controller.uart_busy = False
-            return None
-            
-        # Read the 202-byte response (1 CMD + 200 DATA + 1 CRC)
-        resp = self.controller.uart.read_packet_strictly(202, timeout_sec=2.0)
-        self.controller.uart_busy = False
-        
-        if resp and len(resp) == 201 and resp[0] == CMD_GET_LEADERS:
-            payload = resp[1:] # Strip the CMD byte
-            leaders = []
-            
-            for i in range(10):
-                chunk = payload[i*20 : (i+1)*20]
-                # Unpack: 16-byte string (16s) and 4-byte unsigned int (I)
-                name_raw, play_time = struct.unpack('<16sI', chunk)
-                name = name_raw.decode('utf-8', errors='ignore').strip('\x00')
-                leaders.append((name, play_time))
-                
-            return leaders
-            
+        # The response is 202 bytes (1 CMD + 200 DATA + 1 CRC)
+        self.send_command(CMD_GET_LEADERS, 0x00, 2.0,
+                          lambda resp: callback(self.parse_leaderboard(resp)))
+
+    def parse_leaderboard(self, resp):
+        board = decode_as(resp, CMD_GET_LEADERS, Leaderboard)
+        if board:
+            return board.entries
+
         self.log("Failed to receive or parse leaderboard packet.")
         return None
 
 # --- APP CONTROLLER ---
 class MahjongApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, uart=None, scores=None, probe_all=False):
         super().__init__()
         self.title("STM32 Mahjong")
         self.geometry("900x750")
-        self.uart = UARTHandler()
-        self.uart_busy = False # UART Lock to prevent ghost packets
+        self.uart = uart if uart is not None else UARTHandler()  # Any UARTHandler, e.g. the emulator's
+        # All serial I/O runs on this thread; finished requests come back through ui_events
+        self.ui_events = queue.Queue()
+        self.uart_worker = UARTWorker(self.uart, lambda callback, result: self.ui_events.put((callback, result)))
+        self.uart_worker.start()
+        self.scores = scores if scores is not None else ScoreStore()  # Local leaderboard cache and history
+        self.recorder = Recorder()  # Every game played goes to the recording log
+        self.device_key = None  # Which board the cache entries belong to; set on connect
         self.container = tk.Frame(self)
         self.container.pack(fill="both", expand=True)
         self.menu_view = MainMenu(self.container, self)
         self.game_view = GameInterface(self.container, self)
+        # Port list and board detection run in the background; changes come back through ui_events.
+        # Only ST-LINK ports are probed unless `probe_all` (MAHJONG_PROBE_ALL=1 when run directly)
+        self.discovery = PortDiscovery(self.uart, lambda ports: self.ui_events.put((self.menu_view.show_ports, ports)),
+                                       probe_all=probe_all)
+        self.discovery.start()
         self.show_menu()
+        self.process_uart_events()
+
+    def process_uart_events(self):
+        while True:
+            try:
+                callback, result = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            callback(result)
+        self.after(UI_POLL_MS, self.process_uart_events)
 
     def show_menu(self):
+        self.discovery.release(self.uart.port_name)
         self.game_view.pack_forget()
         self.menu_view.pack(fill="both", expand=True)
         self.menu_view.refresh_ports()
 
-    def show_game(self):
+    def show_game(self, startup_responses):
+        # The RESET + START answers were already collected in the connect burst
+        self.menu_view.pack_forget()
+        self.game_view.pack(fill="both", expand=True)
+        self.game_view.on_reset_responses(startup_responses)
+        # Warm the leaderboard cache in the background so the victory popup never waits for it
+        self.game_view.fetch_leaderboard(self.game_view.sync_leaderboard)
+
+    def show_replay(self, game, speed=1.0):
         self.menu_view.pack_forget()
         self.game_view.pack(fill="both", expand=True)
-        self.after(1000, self.game_view.send_reset_command)
+        Replay(self.game_view, game, speed).start()
 
-    def get_timer_from_stm32(self):
+    def get_timer_from_stm32(self, callback):
         if not self.uart.is_connected():
-            return None
-            
-        self.uart_busy = True # Lock UART while checking time
-        self.uart.reset_buffer()
-        
-        if self.uart.send_packet(CMD_GET_TIME, 0x00):
-            raw_response = self.uart.read_packet_strictly(52, timeout_sec=0.5)
-            self.uart_busy = False # Release Lock
-            
-            if raw_response and len(raw_response) == 51: 
-                if raw_response[0] == CMD_GET_TIME:
-                    time_bytes = raw_response[1:5]
-                    seconds = int.from_bytes(time_bytes, byteorder='big')
-                    return seconds
-                    
-        self.uart_busy = False # Release Lock on fail
-        return None
+            tracer.count("clock.poll_failed")
+            callback(None)  # Same failure path as a poll that got no answer
+            return
+
+        started = tracer.mark()
+
+        def on_time(raw_response):
+            tracer.finish("clock.poll", started)
+            reading = decode_as(raw_response, CMD_GET_TIME, Time)
+            seconds = reading.seconds if reading else None
+            if seconds is None: tracer.count("clock.poll_failed")
+            callback(seconds)
+
+        self.uart_worker.poll(CMD_GET_TIME, 0x00, 0.5, on_time)
     
 if __name__ == "__main__":
-    app = MahjongApp()
-    app.mainloop()
\ No newline at end of file
+    enable_from_env()
+    app = MahjongApp(probe_all=bool(os.environ.get("MAHJONG_PROBE_ALL")))
+    app.mainloop()
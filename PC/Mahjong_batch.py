@@ -0,0 +1,154 @@
+# NumPy board batches: N boards as an N x 50 uint8 array (the packed firmware bytes), with the
+# rules evaluated for the whole batch at once. Used for bulk simulation and screening where
+# the per-tile Python rules in Mahjong_engine are too slow.
+
+import numpy as np
+
+from Mahjong_engine import MAX_SHUFFLES, TOTAL_PIECES, new_deck
+from Mahjong_layouts import get_layout
+
+EMPTY = TOTAL_PIECES  # Padding column that is always empty, for "no tile there"
+
+
+class LayoutArrays:
+    # Index arrays for one layout: covering tiles (padded to a rectangle) and side neighbours
+    def __init__(self, layout):
+        width = max(len(above) for above in layout.above)
+        self.above = np.full((layout.size, width), EMPTY, dtype=np.intp)
+        for i, above in enumerate(layout.above):
+            self.above[i, :len(above)] = above
+        self.left = np.array([i if i >= 0 else EMPTY for i in layout.left], dtype=np.intp)
+        self.right = np.array([i if i >= 0 else EMPTY for i in layout.right], dtype=np.intp)
+
+
+_ARRAYS = {}
+
+
+def layout_arrays(layout_id):
+    if layout_id not in _ARRAYS:
+        _ARRAYS[layout_id] = LayoutArrays(get_layout(layout_id))
+    return _ARRAYS[layout_id]
+
+
+def match_keys(tiles):
+    # Tiles match iff keys are equal: bonus groups 5/6 collapse to the bare group byte
+    group = (tiles >> 5) & 0x07
+    return np.where((group == 5) | (group == 6), tiles & 0xE0, tiles)
+
+
+class BoardBatch:
+    def __init__(self, tiles, layout_id=0):
+        # Own, writable copy: the batch is changed in place, and bytes / frombuffer input is read-only
+        if isinstance(tiles, (bytes, bytearray, memoryview)):
+            tiles = np.frombuffer(tiles, dtype=np.uint8)
+        self.tiles = np.array(tiles, dtype=np.uint8, copy=True).reshape(-1, TOTAL_PIECES)
+        self.layout_id = layout_id
+        self.arrays = layout_arrays(layout_id)
+
+    @classmethod
+    def from_boards(cls, boards, layout_id=0):
+        return cls(np.frombuffer(b"".join(bytes(b[:TOTAL_PIECES]) for b in boards), dtype=np.uint8), layout_id)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def board(self, row):
+        return bytes(self.tiles[row])
+
+    # --- Rules, for every board at once ---
+
+    def present(self):
+        return self.tiles != 0
+
+    def exposed(self):
+        # is_tile_exposed: present, nothing on top, and not flanked on both sides
+        present = self.present()
+        padded = np.concatenate([present, np.zeros((len(present), 1), dtype=bool)], axis=1)
+        covered = padded[:, self.arrays.above].any(axis=2)
+        flanked = padded[:, self.arrays.left] & padded[:, self.arrays.right]
+        return present & ~covered & ~flanked
+
+    def key_counts(self, exposed=None):
+        # N x 256: how many exposed tiles each board has per match key
+        exposed = self.exposed() if exposed is None else exposed
+        rows = np.repeat(np.arange(len(self.tiles)), TOTAL_PIECES).reshape(-1, TOTAL_PIECES)
+        flat = rows[exposed] * 256 + match_keys(self.tiles)[exposed]
+        return np.bincount(flat, minlength=len(self.tiles) * 256).reshape(-1, 256)
+
+    def candidates(self, exposed=None):
+        # Exposed tiles that have at least one exposed partner
+        exposed = self.exposed() if exposed is None else exposed
+        counts = self.key_counts(exposed)
+        rows = np.arange(len(self.tiles))[:, None]
+        return exposed & (counts[rows, match_keys(self.tiles)] >= 2)
+
+    def pair_counts(self, exposed=None):
+        counts = self.key_counts(exposed).astype(np.int64)
+        return (counts * (counts - 1) // 2).sum(axis=1)
+
+    def has_moves(self):
+        return self.candidates().any(axis=1)
+
+    def cleared(self):
+        return ~self.present().any(axis=1)
+
+    def first_pairs(self):
+        # cmd_hint order for every board: lowest candidate i, then its lowest partner j > i.
+        # Returns (i, j) arrays with -1 where a board has no pair.
+        exposed = self.exposed()
+        cand = self.candidates(exposed)
+        found = cand.any(axis=1)
+        first = cand.argmax(axis=1)
+        keys = match_keys(self.tiles)
+        rows = np.arange(len(self.tiles))
+        partner = exposed & (keys == keys[rows, first][:, None]) & (np.arange(TOTAL_PIECES) > first[:, None])
+        second = partner.argmax(axis=1)
+        return np.where(found, first, -1), np.where(found, second, -1)
+
+    # --- Changes ---
+
+    def remove(self, rows, first, second):
+        self.tiles[rows, first] = 0
+        self.tiles[rows, second] = 0
+
+    def shuffle(self, rows, rng):
+        # cmd_shuffle for the given rows: present tiles are permuted among the present positions.
+        # Absent positions sort last in both orders, so zeros land on zeros.
+        tiles = self.tiles[rows]
+        present = tiles != 0
+        order = np.argsort(np.where(present, rng.random(tiles.shape), 2.0), axis=1)
+        slots = np.argsort(~present, axis=1, kind="stable")
+        shuffled = np.empty_like(tiles)
+        np.put_along_axis(shuffled, slots, np.take_along_axis(tiles, order, axis=1), axis=1)
+        self.tiles[rows] = shuffled
+
+
+def deal_batch(count, rng, layout_id=0):
+    # count fresh deals (a random permutation of the deck per row)
+    deck = np.frombuffer(bytes(new_deck()), dtype=np.uint8)
+    order = np.argsort(rng.random((count, TOTAL_PIECES)), axis=1)
+    return BoardBatch(deck[order], layout_id)
+
+
+def play_first(batch, rng, max_shuffles=MAX_SHUFFLES):
+    # Plays every board with the device hint order, shuffling when stuck, like the simulator's
+    # "first" strategy. Returns (won, moves, shuffles) arrays.
+    moves = np.zeros(len(batch), dtype=np.int32)
+    shuffles = np.zeros(len(batch), dtype=np.int32)
+    active = np.ones(len(batch), dtype=bool)
+    while active.any():
+        rows = np.flatnonzero(active)
+        sub = BoardBatch(batch.tiles[rows], batch.layout_id)
+        first, second = sub.first_pairs()
+        ok = first >= 0
+        sub.remove(np.flatnonzero(ok), first[ok], second[ok])
+        moves[rows[ok]] += 1
+
+        stuck = ~ok & sub.present().any(axis=1)
+        can_shuffle = stuck & (shuffles[rows] < max_shuffles)
+        sub.shuffle(np.flatnonzero(can_shuffle), rng)
+        shuffles[rows[can_shuffle]] += 1
+
+        batch.tiles[rows] = sub.tiles
+        active[rows[~ok & ~can_shuffle]] = False
+    return batch.cleared(), moves, shuffles
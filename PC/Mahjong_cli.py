@@ -0,0 +1,137 @@
+# Command line front end of Mahjong_client; never imports Tk.
+#
+#   python Mahjong_cli.py ports [--probe-all]
+#   python Mahjong_cli.py --port COM3 play --games 20 --layout 1
+#   python Mahjong_cli.py --emulator leaders
+#   python Mahjong_cli.py --port COM3 shell < moves.txt
+#
+# Shell commands (one per line): new [layout], select I, match I, pair I J, hint, device-hint,
+# shuffle, time, board, leaders, giveup, quit
+
+import argparse
+import shlex
+import sys
+import time
+
+from Mahjong_client import MahjongClient
+from Mahjong_layouts import LAYOUTS
+from UART_discovery import PROBE_WINDOW, PortDiscovery
+from UART_handler import UARTHandler
+
+
+def make_client(args):
+    if args.emulator:
+        from Mahjong_emulator import EMULATOR_PORT, EmulatedUART, Faults, VirtualDevice
+        faults = Faults(args.latency, seed=args.seed)
+        return MahjongClient(EmulatedUART(VirtualDevice(args.seed), faults, EMULATOR_PORT, args.baud))
+    return MahjongClient(port=args.port, baudrate=args.baud)
+
+
+def print_leaders(entries, out):
+    if entries is None:
+        out.write("no answer\n")
+        return
+    for rank, entry in enumerate(entries, 1):
+        out.write(f"{rank:>2}  {entry.name or '---':<16}{'---' if entry.empty else entry.seconds:>8}\n")
+
+
+def cmd_ports(args, out):
+    discovery = PortDiscovery(UARTHandler(baudrate=args.baud), probe_all=args.probe_all)
+    discovery.scan()
+    deadline = time.monotonic() + PROBE_WINDOW * 3
+    while time.monotonic() < deadline and any(info.probed and info.is_board is None for info in discovery.snapshot()):
+        time.sleep(0.05)
+    discovery.stop()
+    for info in discovery.snapshot():
+        kind = {True: "board", False: "-", None: "?"}[info.is_board] if info.probed else "skip"
+        out.write(f"{info.device:<20}{kind:<7}{info.description}\n")
+
+
+def cmd_play(client, args, out):
+    outcomes = {}
+    pairs = 0
+    started = time.perf_counter()
+    for n in range(args.games):
+        if n and not client.new_game(args.layout):
+            out.write("could not start a new game\n")
+            break
+        outcome = client.play(quick=args.quick)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        pairs += client.pairs_removed
+        out.write(f"game {n + 1}: {outcome}, {client.pairs_removed} pairs, seed {client.seed}\n")
+        if outcome == "no answer": break
+    elapsed = time.perf_counter() - started
+    out.write(f"{outcomes}  {pairs} pairs in {elapsed:.2f} s ({pairs * 2 / elapsed:.0f} moves/s)\n")
+
+
+def run_shell_line(client, words, out):
+    # One shell command; False to stop
+    command, args = words[0], [int(word) for word in words[1:]]
+    if command == "quit":
+        return False
+    if command == "new": result = client.new_game(*args)
+    elif command == "select": result = client.select(*args)
+    elif command == "match": result = client.match(*args)
+    elif command == "pair": result = client.pair(*args)
+    elif command == "hint": result = client.hint()
+    elif command == "device-hint": result = client.device_hint()
+    elif command == "shuffle": result = client.shuffle()
+    elif command == "time": result = client.elapsed()
+    elif command == "giveup": result = client.give_up()
+    elif command == "board":
+        result = " ".join(f"{i}:{tile:02X}" for i, tile in enumerate(client.board.tiles) if tile)
+    elif command == "leaders":
+        print_leaders(client.leaderboard(), out)
+        return True
+    else:
+        result = f"unknown command {command!r}"
+    out.write(f"{result}\n")
+    if client.won: out.write("board cleared\n")
+    return True
+
+
+def cmd_shell(client, source, out):
+    for line in source:
+        words = shlex.split(line, comments=True)
+        if not words: continue
+        try:
+            if not run_shell_line(client, words, out): break
+        except (TypeError, ValueError) as e:
+            out.write(f"error: {e}\n")
+        out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play the Mahjong board from the command line.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--port", default="COM3", help="serial port of the board")
+    target.add_argument("--emulator", action="store_true", help="use the in-process emulator")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--name", default="Player1")
+    parser.add_argument("--layout", type=int, default=0, choices=range(len(LAYOUTS)))
+    parser.add_argument("--seed", type=int, help="emulator: seed for the device")
+    parser.add_argument("--latency", type=float, default=0.0, help="emulator: seconds added to every answer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ports = sub.add_parser("ports", help="list serial ports and which ones have a board")
+    ports.add_argument("--probe-all", action="store_true", help="also probe ports that are not ST-LINK")
+    sub.add_parser("leaders", help="print the device leaderboard")
+    play = sub.add_parser("play", help="play whole games automatically")
+    play.add_argument("--games", type=int, default=1)
+    play.add_argument("--quick", action="store_true", help="first legal pair instead of the checked hint")
+    sub.add_parser("shell", help="read commands from stdin")
+    args = parser.parse_args(argv)
+
+    if args.command == "ports":
+        cmd_ports(args, sys.stdout)
+        return
+
+    with make_client(args) as client:
+        if not client.connect(args.name, args.layout):
+            sys.exit(f"No board answering on {client.uart.port_name}")
+        if args.command == "leaders": print_leaders(client.leaderboard(), sys.stdout)
+        elif args.command == "play": cmd_play(client, args, sys.stdout)
+        else: cmd_shell(client, sys.stdin, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# Headless client: the game flow of MainMenu / GameInterface without Tk, as a blocking API for
+# scripts, kiosks and load tests. Every call is one request (or one burst) on the caller's thread.
+# A local copy of the rules turns down impossible moves without a round trip, and answers hints.
+# Methods return None when the device did not answer.
+#
+#   client = MahjongClient(port="COM3")
+#   client.connect("Ann", layout_id=1)
+#   client.play()
+
+from Mahjong_dealer import new_seed, solvable_deal
+from Mahjong_engine import MahjongBoard, MAX_SHUFFLES
+from Mahjong_hints import HintEngine
+from UART_codec import Ack, Board, Hint, Leaderboard, Time, decode, decode_as
+from UART_discovery import wait_ready
+from UART_handler import UARTHandler
+from UART_protocol import (CMD_START, CMD_RESET, CMD_SHUFFLE, CMD_SELECT, CMD_MATCH, CMD_GIVE_UP, CMD_HINT,
+                           CMD_SET_NAME, CMD_GET_TIME, CMD_GET_LEADERS, CMD_LOAD_BOARD)
+
+
+def start_device(uart, port, name, deal):
+    # Blocking (the game runs it on its UART worker thread): open and reset the board, then name,
+    # reset and the first (PC-dealt) board in a single burst as soon as the firmware answers a probe.
+    # (device key, responses), or None if the port won't open
+    uart.close_port()  # Reconnecting a board that is still open
+    uart.port_name = port
+    if not uart.open_port():
+        return None
+    uart.dtr_reset()
+    uart.reset_buffer()
+    wait_ready(uart)
+    responses = uart.pipeline([(CMD_SET_NAME, name, 1.0), (CMD_RESET, 0x00, 1.0), deal])
+    return uart.device_key(), responses
+
+
+class MahjongClient:
+    def __init__(self, uart=None, port="COM3", baudrate=115200):
+        self.uart = uart if uart is not None else UARTHandler(port, baudrate)
+        self.board = MahjongBoard()
+        self.hints = HintEngine(self.board)
+        self.layout_id = 0
+        self.seed = None  # Seed of the current PC-dealt board; None if the device dealt it
+        self.device_key = None
+        self.name_saved = False
+        self.shuffles_left = MAX_SHUFFLES
+        self.pairs_removed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.uart.close_port()
+
+    # --- Game flow ---
+
+    def connect(self, name="Player1", layout_id=0, port=None):
+        # Open + reset the board, register the name and start a game; False if that failed
+        result = start_device(self.uart, port or self.uart.port_name, name, self.deal(layout_id))
+        if result is None:
+            return False
+        self.device_key, responses = result
+        ack = decode_as(responses[0], CMD_SET_NAME, Ack)
+        self.name_saved = bool(ack and ack.ok)
+        return self._load(responses[2], CMD_LOAD_BOARD) or self._start_on_device()
+
+    def deal(self, layout_id, seed=None):
+        # The LOAD_BOARD command for a fresh always-winnable deal
+        self.layout_id = layout_id
+        self.seed = new_seed() if seed is None else seed
+        tiles, _ = solvable_deal(self.seed, layout_id)
+        return (CMD_LOAD_BOARD, (layout_id, tiles), 2.0)
+
+    def new_game(self, layout_id=None, seed=None):
+        # RESET + a new board in one burst, like the game's Reset button
+        layout_id = self.layout_id if layout_id is None else layout_id
+        responses = self.uart.pipeline([(CMD_RESET, 0x00, 1.0), self.deal(layout_id, seed)])
+        if decode_as(responses[0], CMD_RESET, Ack) is None:
+            return False
+        return self._load(responses[1], CMD_LOAD_BOARD) or self._start_on_device()
+
+    def _start_on_device(self):
+        # Board rejected (or firmware without CMD_LOAD_BOARD): let the device deal
+        self.seed = None
+        return self._load(self.uart.exchange(CMD_START, self.layout_id, 10.0), CMD_START)
+
+    def _load(self, resp, cmd):
+        board = decode_as(resp, cmd, Board)
+        if board is None:
+            return False
+        self.board.load(board.tiles, self.layout_id)
+        self.hints.rebuild()
+        self.shuffles_left = MAX_SHUFFLES
+        self.pairs_removed = 0
+        return True
+
+    # --- Moves ---
+
+    def select(self, index):
+        if not self.board.is_tile_exposed(index):
+            return False
+        ack = decode_as(self.uart.exchange(CMD_SELECT, index, 2.0), CMD_SELECT, Ack)
+        if ack is None:
+            return None
+        if ack.ok: self.board.select(index)
+        return ack.ok
+
+    def match(self, index):
+        # Pairs `index` with the selected tile
+        first = self.board.active_selection
+        if not self.board.can_match(first, index):
+            return False
+        ack = decode_as(self.uart.exchange(CMD_MATCH, index, 1.0), CMD_MATCH, Ack)
+        return self._matched(first, index, ack)
+
+    def pair(self, first, second):
+        # SELECT + MATCH as one burst
+        if not self.board.can_match(first, second):
+            return False
+        responses = self.uart.pipeline([(CMD_SELECT, first, 2.0), (CMD_MATCH, second, 1.0)])
+        select = decode_as(responses[0], CMD_SELECT, Ack)
+        if select and select.ok: self.board.select(first)
+        return self._matched(first, second, decode_as(responses[1], CMD_MATCH, Ack))
+
+    def resync_pair(self, first, second):
+        # After a MATCH whose answer was lost: a SELECT on the first tile tells whether the device
+        # removed the pair (refused: the tile is gone) or not (then the MATCH is sent again)
+        ack = decode_as(self.uart.exchange(CMD_SELECT, first, 2.0), CMD_SELECT, Ack)
+        if ack is None:
+            return None
+        if not ack.ok:
+            return self._matched(first, second, Ack(CMD_MATCH, 0x01))
+        self.board.select(first)
+        return self.match(second)
+
+    def _matched(self, first, second, ack):
+        # cmd_match clears the device selection on a match or a mismatch; a refused second tile keeps it
+        if ack is None or not ack.refused: self.board.active_selection = -1
+        if ack is None:
+            return None
+        if ack.matched:
+            self.board.remove(first, second)
+            self.hints.removed(first, second)
+            self.pairs_removed += 1
+        return ack.matched
+
+    def shuffle(self):
+        # True with a new board, False once the device refuses (limit reached)
+        reply = decode(self.uart.exchange(CMD_SHUFFLE, 0x00, 4.0), CMD_SHUFFLE)
+        if isinstance(reply, Board):
+            self.board.load(reply.tiles)
+            self.hints.rebuild()
+            self.shuffles_left -= 1
+            return True
+        if isinstance(reply, Ack) and reply.refused:
+            self.shuffles_left = 0
+            return False
+        return None
+
+    def hint(self):
+        # Local hint (a pair that keeps the board winnable), no round trip
+        return self.hints.best()
+
+    def device_hint(self):
+        hint = decode_as(self.uart.exchange(CMD_HINT, 0x00, 1.5), CMD_HINT, Hint)
+        return None if hint is None else hint.pair
+
+    def give_up(self):
+        ack = decode_as(self.uart.exchange(CMD_GIVE_UP, 0x00, 1.0), CMD_GIVE_UP, Ack)
+        return None if ack is None else ack.ok
+
+    # --- Queries ---
+
+    def elapsed(self):
+        reading = decode_as(self.uart.exchange(CMD_GET_TIME, 0x00, 0.5), CMD_GET_TIME, Time)
+        return None if reading is None else reading.seconds
+
+    def leaderboard(self):
+        board = decode_as(self.uart.exchange(CMD_GET_LEADERS, 0x00, 2.0), CMD_GET_LEADERS, Leaderboard)
+        return None if board is None else board.entries
+
+    @property
+    def won(self):
+        return self.board.is_cleared()
+
+    @property
+    def stuck(self):
+        return not self.won and not self.hints.has_moves() and self.shuffles_left <= 0
+
+    def play(self, quick=False):
+        # Plays the current board to the end: "won", "stuck", "rejected" (the device refused a pair
+        # the local rules allow: the two copies of the board disagree) or "no answer". `quick` takes
+        # the first legal pair instead of the solver-checked hint (much faster, may paint itself into a corner)
+        while not self.won:
+            candidate = next(self.hints.pairs(), None) if quick else self.hint()
+            if candidate is None:
+                shuffled = self.shuffle() if self.shuffles_left > 0 else False
+                if not shuffled:
+                    return "stuck" if shuffled is False else "no answer"
+                continue
+            matched = self.pair(*candidate)
+            if matched is None:
+                matched = self.resync_pair(*candidate)
+            if matched is None:
+                return "no answer"
+            if not matched:
+                return "rejected"
+        return "won"
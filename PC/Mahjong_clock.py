@@ -0,0 +1,57 @@
+import time
+
+CLOCK_RESYNC_SEC = 60.0  # How often the local clock is checked against CMD_GET_TIME
+
+
+class GameClock:
+    # Local stand-in for the device game timer. The firmware restarts its timer when it answers
+    # CMD_START, so the PC starts counting at the same moment and only needs an occasional
+    # CMD_GET_TIME sample to correct drift.
+    def __init__(self, resync_interval=CLOCK_RESYNC_SEC):
+        self.resync_interval = resync_interval
+        self.started_at = None
+        self.stopped_at = None
+        self.last_sync = None
+
+    def start(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.started_at = now
+        self.stopped_at = None
+        self.last_sync = now
+
+    def stop(self, now=None):
+        if self.started_at is not None and self.stopped_at is None:
+            self.stopped_at = time.monotonic() if now is None else now
+
+    def is_running(self):
+        return self.started_at is not None and self.stopped_at is None
+
+    def elapsed(self, now=None):
+        if self.started_at is None: return 0.0
+        if self.stopped_at is not None: now = self.stopped_at
+        elif now is None: now = time.monotonic()
+        return max(0.0, now - self.started_at)
+
+    def seconds(self, now=None):
+        return int(self.elapsed(now))
+
+    def request_resync(self):
+        # E.g. after a reconnect: the next tick asks the device again
+        self.last_sync = None
+
+    def begin_resync(self, now=None):
+        # A sample is on its way: don't ask again until the interval has passed
+        self.last_sync = time.monotonic() if now is None else now
+
+    def needs_resync(self, now=None):
+        if not self.is_running(): return False
+        if self.last_sync is None: return True
+        now = time.monotonic() if now is None else now
+        return now - self.last_sync >= self.resync_interval
+
+    def sync(self, device_seconds, now=None):
+        # The device counts whole seconds: keep the local estimate while it is inside the same second
+        now = time.monotonic() if now is None else now
+        if self.is_running() and not device_seconds <= self.elapsed(now) < device_seconds + 1:
+            self.started_at = now - (device_seconds + 0.5)
+        self.last_sync = now
@@ -0,0 +1,102 @@
+# Deals that are always winnable. The board is built backwards: pairs of positions are filled
+# in the reverse of a removal order, each pair onto spots that are free at that moment, so
+# playing the pairs back in the opposite order clears the board. Same packed format and
+# same tile multiset as the firmware deck; every deal is reproducible from its seed.
+
+import random
+
+from Mahjong_engine import DECK_SPEC, TOTAL_PIECES, new_deck, tile_group
+from Mahjong_layouts import get_layout
+
+MAX_DEAL_ATTEMPTS = 100  # Restarts allowed when the random fill paints itself into a corner
+
+
+class DealPlan:
+    # Per-layout bitmask tables for the backwards fill (bit i = position i filled)
+    def __init__(self, layout):
+        self.size = size = layout.size
+        bit = lambda i: 1 << i if i >= 0 else 0
+        self.above = [sum(1 << a for a in layout.above[i]) for i in range(size)]
+        self.left = [bit(layout.left[i]) for i in range(size)]
+        self.right = [bit(layout.right[i]) for i in range(size)]
+        # Positions a tile rests on (the ones it covers), and the rest of its row
+        self.rests_on = [sum(1 << j for j in range(size) if i in layout.above[j]) for i in range(size)]
+        self.row = [sum(1 << j for j, coord in enumerate(layout.coords) if coord[:2] == layout.coords[i][:2])
+                    for i in range(size)]
+        # Positions whose fill rules can change when i is filled
+        self.near = [self.left[i] | self.right[i] | sum(1 << j for j in range(size) if self.rests_on[j] >> i & 1)
+                     for i in range(size)]
+
+    def exposed(self, filled, i):
+        sides = self.left[i] | self.right[i]
+        return not (filled & self.above[i]) and not (self.left[i] and self.right[i] and filled & sides == sides)
+
+    def can_fill(self, filled, i):
+        # Filling i must never strand an empty spot: everything under it is filled already,
+        # and in its row it grows the filled run from one end (or starts it)
+        if filled >> i & 1 or filled & self.rests_on[i] != self.rests_on[i]: return False
+        left_full, right_full = filled & self.left[i], filled & self.right[i]
+        if left_full and right_full: return False
+        return not filled & self.row[i] or bool(left_full or right_full)
+
+    def removal_order(self, rng):
+        # Position pairs in the order they can be played, or None if this attempt got stuck
+        filled = 0
+        placed = []
+        for _ in range(self.size // 2):
+            firsts = [i for i in range(self.size) if self.can_fill(filled, i)]
+            rng.shuffle(firsts)
+            for a in firsts:
+                with_a = filled | (1 << a)
+                seconds = [b for b in set(firsts) | set(i for i in range(self.size) if self.near[a] >> i & 1)
+                           if self.can_fill(with_a, b) and self.exposed(with_a | (1 << b), a)
+                           and self.exposed(with_a | (1 << b), b)]
+                if seconds:
+                    b = rng.choice(sorted(seconds))
+                    filled = with_a | (1 << b)
+                    placed.append((a, b))
+                    break
+            else:
+                return None
+        placed.reverse()
+        return placed
+
+
+_PLANS = {}
+
+
+def deal_plan(layout_id):
+    if layout_id not in _PLANS:
+        _PLANS[layout_id] = DealPlan(get_layout(layout_id))
+    return _PLANS[layout_id]
+
+
+def deck_pairs(rng):
+    # The firmware deck split into 25 matching pairs (bonus groups pair up across values)
+    pairs, deck = [], new_deck()
+    for group, *_ in DECK_SPEC:
+        tiles = [t for t in deck if tile_group(t) == group]
+        if group in (5, 6): rng.shuffle(tiles)
+        pairs.extend(zip(tiles[::2], tiles[1::2]))
+    rng.shuffle(pairs)
+    return pairs
+
+
+def solvable_deal(seed, layout_id=0):
+    # (tiles, removal order) for this seed; the order is one winning line
+    rng = random.Random(seed)
+    plan = deal_plan(layout_id)
+    for _ in range(MAX_DEAL_ATTEMPTS):
+        order = plan.removal_order(rng)
+        if order is not None: break
+    else:
+        raise RuntimeError(f"could not build a deal for layout {layout_id}")
+
+    tiles = bytearray(TOTAL_PIECES)
+    for (a, b), (t1, t2) in zip(order, deck_pairs(rng)):
+        tiles[a], tiles[b] = t1, t2
+    return bytes(tiles), order
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(32)
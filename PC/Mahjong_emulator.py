@@ -0,0 +1,421 @@
+# Software stand-in for the STM32 board: the firmware command loop (Core/Src/main.c) and rules
+# (command_list.c, game_save.c) behind the same byte protocol, reachable either in-process
+# (LoopbackSerial, a drop-in for serial.Serial) or through a pseudo-terminal (PtyBridge, Linux).
+# Latency, byte loss and corruption can be injected on the device -> PC direction.
+#
+#   python Mahjong_emulator.py --pty --latency 0.003 --drop 0.001   # prints the port to open
+#   python Mahjong_emulator.py --gui                                # the game against the emulator
+
+import argparse
+import collections
+import os
+import random
+import struct
+import threading
+import time
+
+import serial
+
+from Mahjong_engine import (MahjongBoard, MAX_SHUFFLES, TOTAL_PIECES, deal, new_deck,
+                            shuffle_remaining, tiles_match)
+from UART_framing import RESTORE, xor_crc
+from UART_handler import UARTHandler
+from UART_protocol import (CMD_START, CMD_RESET, CMD_SHUFFLE, CMD_SELECT, CMD_MATCH, CMD_GIVE_UP, CMD_HINT,
+                           CMD_SET_NAME, CMD_GET_TIME, CMD_GET_LEADERS, CMD_LOAD_BOARD, CMD_RESTORE_BOARD, NO_HINT,
+                           SHORT_ERROR)
+
+MAX_SCORES = 10
+EMPTY_SCORE = ("---", 999999)  # Load_HighScores on a blank flash page
+DEFAULT_NAME = "Player1"
+PAYLOAD_TIMEOUT = 0.5  # HAL_UART_Receive timeout for the SET_NAME / LOAD_BOARD / RESTORE_BOARD payload
+EMULATOR_PORT = "EMULATOR"
+
+
+class VirtualDevice:
+    # Firmware state and command handling. Requests are taken in 3-byte chunks like the
+    # HAL_UART_Receive_IT loop; a chunk with a bad CRC is dropped without an answer.
+    def __init__(self, seed=None, clock=time.monotonic):
+        self.rng = random.Random(seed)  # Stands in for rand()
+        self.clock = clock
+        self.leaderboard = [EMPTY_SCORE] * MAX_SCORES  # Survives reboots (flash)
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.bad_frames = 0
+        self.powered = True
+        self.reboot()
+
+    def reboot(self):
+        # DTR reset: RAM state is lost, the leaderboard is not
+        self.board = MahjongBoard(layout_id=0)
+        self.shuffle_count = 0
+        self.player_name = DEFAULT_NAME
+        self.timer_started = None
+        self.rx = bytearray()
+        self.payload = None  # (command, data byte, length, deadline) while a payload is awaited
+
+    def unplug(self):
+        # USB power is gone: nothing is answered until plug_in(), which boots from scratch
+        self.powered = False
+
+    def plug_in(self):
+        self.reboot()
+        self.powered = True
+
+    # --- Byte stream ---
+
+    def process(self, data=b""):
+        # Takes whatever the PC wrote and returns the bytes the device answers with.
+        # Call with no data to let a payload wait time out.
+        with self.lock:
+            if not self.powered:
+                return b""
+            self.rx += data
+            out = bytearray()
+            while True:
+                if self.payload is not None:
+                    cmd, arg, length, deadline = self.payload
+                    if len(self.rx) >= length:
+                        body = bytes(self.rx[:length])
+                        del self.rx[:length]
+                    elif self.clock() > deadline:
+                        body = None
+                        self.rx.clear()
+                    else:
+                        break
+                    self.payload = None
+                    out += self._finish_payload(cmd, arg, body)
+                    continue
+                if len(self.rx) < 3:
+                    break
+                frame = bytes(self.rx[:3])
+                del self.rx[:3]
+                if xor_crc(frame[:2]) != frame[2]:
+                    self.bad_frames += 1
+                    continue
+                self.frames += 1
+                out += self.handle(frame[0], frame[1])
+            return bytes(out)
+
+    def _reply(self, cmd, data, length=3):
+        packet = bytearray(length)
+        packet[0] = cmd
+        packet[1:1 + len(data)] = data
+        packet[-1] = xor_crc(packet[:-1])
+        return bytes(packet)
+
+    def _expect(self, cmd, arg, length):
+        self.payload = (cmd, arg, length, self.clock() + PAYLOAD_TIMEOUT)
+        return b""
+
+    # --- Commands (the switch in main.c) ---
+
+    def handle(self, cmd, data):
+        board = self.board
+        if cmd == CMD_START:
+            self.generate(data)
+            self.timer_started = self.clock()
+            return self._reply(cmd, board.tiles, 52)
+        if cmd == CMD_RESET:
+            self.reset()
+            return self._reply(cmd, b"\x00")
+        if cmd == CMD_SHUFFLE:
+            if self.shuffle_count >= MAX_SHUFFLES:
+                return self._reply(cmd, bytes([SHORT_ERROR]))
+            shuffle_remaining(board.tiles, self.rng)
+            self.shuffle_count += 1
+            board.active_selection = -1
+            return self._reply(cmd, board.tiles, 52)
+        if cmd == CMD_SELECT:
+            return self._reply(cmd, b"\x00" if board.select(data) else bytes([0xFF]))
+        if cmd == CMD_MATCH:
+            return self._reply(cmd, bytes([self.match(data)]))
+        if cmd == CMD_GIVE_UP:
+            self.reset()
+            return self._reply(cmd, b"\x00")
+        if cmd == CMD_HINT:
+            pair = board.find_hint()
+            return self._reply(cmd, bytes(pair) if pair else bytes([NO_HINT]), 4)
+        if cmd == CMD_SET_NAME:
+            if 0 < data <= 10:
+                return self._expect(cmd, data, data + 1)
+            return self._reply(cmd, b"\x00")
+        if cmd == CMD_LOAD_BOARD:
+            return self._expect(cmd, data, TOTAL_PIECES + 1)
+        if cmd == CMD_RESTORE_BOARD:
+            return self._expect(cmd, data, RESTORE.size + 1)
+        if cmd == CMD_GET_TIME:
+            return self._reply(cmd, struct.pack(">I", self.seconds()), 52)
+        if cmd == CMD_GET_LEADERS:
+            table = b"".join(struct.pack("<16sI", name.encode("ascii", "ignore")[:15], score)
+                             for name, score in self.leaderboard)
+            return self._reply(cmd, table, 202)
+        return self._reply(cmd, b"\x00")  # Unknown command: tx_packet[1] stays 0
+
+    def _finish_payload(self, cmd, arg, body):
+        valid = body is not None and xor_crc(body[:-1]) == body[-1]
+        if cmd == CMD_SET_NAME:
+            if valid:
+                self.player_name = body[:-1].decode("ascii", "ignore")[:15]
+            return self._reply(cmd, b"\x00")
+        # CMD_LOAD_BOARD: any part of the firmware deck (a fresh deal or a game in progress);
+        # CMD_RESTORE_BOARD also carries the time and shuffles to continue from
+        if not valid:
+            return self._reply(cmd, bytes([SHORT_ERROR]))
+        board, seconds, shuffles_used = body[:-1], 0, 0
+        if cmd == CMD_RESTORE_BOARD:
+            board, seconds, shuffles_used = RESTORE.unpack(board)
+        tiles = collections.Counter(tile for tile in board if tile)
+        if shuffles_used > MAX_SHUFFLES or tiles - collections.Counter(new_deck()):
+            return self._reply(cmd, bytes([SHORT_ERROR]))
+        self.board.load(board, self._layout(arg))
+        self.shuffle_count = shuffles_used  # cmd_board_loaded(); load() already dropped the selection
+        self.timer_started = self.clock() - seconds  # Timer_Start() / Timer_Resume()
+        return self._reply(cmd, self.board.tiles, 52)
+
+    # --- Rules that differ from MahjongBoard ---
+
+    @staticmethod
+    def _layout(data):
+        # The firmware only tells the square layout (0) from everything else
+        return 0 if data == 0 else 1
+
+    def generate(self, data):
+        self.board.load(deal(self.rng), self._layout(data))
+
+    def reset(self):
+        self.shuffle_count = 0
+        self.generate(self.board.layout_id)
+
+    def match(self, index):
+        # cmd_match: an invalid second tile keeps the selection, a mismatch clears it
+        board = self.board
+        first = board.active_selection
+        if first == -1 or index == first or not board.is_tile_exposed(index):
+            return 0xFF
+        board.active_selection = -1
+        if not tiles_match(board.tiles[first], board.tiles[index]):
+            return 0
+        board.remove(first, index)
+        if board.is_cleared():
+            self.add_high_score(self.player_name, self.seconds())
+        return 1
+
+    def seconds(self):
+        return 0 if self.timer_started is None else int(self.clock() - self.timer_started)
+
+    def add_high_score(self, name, seconds):
+        # Add_HighScore: one entry per name, kept only if it is an improvement, sorted by time
+        scores = self.leaderboard
+        for n, (entry, best) in enumerate(scores):
+            if entry == name:
+                if seconds >= best: return
+                scores = scores[:n] + scores[n + 1:] + [(scores[-1][0], EMPTY_SCORE[1])]
+                break
+        for n, (_, best) in enumerate(scores):
+            if seconds < best:
+                scores = scores[:n] + [(name, seconds)] + scores[n:MAX_SCORES - 1]
+                break
+        self.leaderboard = scores
+
+
+class Faults:
+    # What the line does to the device's answers: delay (fixed + random jitter), then
+    # each byte is lost or gets one bit flipped with the given probabilities
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0, corrupt_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.rng = random.Random(seed)
+        self.dropped = 0
+        self.corrupted = 0
+
+    def delay(self):
+        return self.latency + (self.rng.uniform(0.0, self.jitter) if self.jitter else 0.0)
+
+    def mangle(self, data):
+        if not self.drop_rate and not self.corrupt_rate:
+            return data
+        out = bytearray()
+        for byte in data:
+            roll = self.rng.random()
+            if roll < self.drop_rate:
+                self.dropped += 1
+            elif roll < self.drop_rate + self.corrupt_rate:
+                self.corrupted += 1
+                out.append(byte ^ (1 << self.rng.randrange(8)))
+            else:
+                out.append(byte)
+        return bytes(out)
+
+
+class LoopbackSerial:
+    # The subset of serial.Serial that UARTHandler uses, wired straight to a VirtualDevice.
+    # Answers become readable after the injected delay plus their time on the wire.
+    def __init__(self, device, faults=None, baudrate=115200, timeout=0.1):
+        self.device = device
+        self.faults = faults or Faults()
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self._dtr = True
+        self._pending = collections.deque()  # (ready_at, bytes)
+        self._rx = bytearray()
+        self._cond = threading.Condition()
+
+    def _byte_time(self, count):
+        return count * 10.0 / self.baudrate if self.baudrate else 0.0
+
+    def write(self, data):
+        if not self.is_open or not self.device.powered: raise serial.SerialException("port gone")
+        answer = self.device.process(bytes(data))
+        self._queue(answer, self._byte_time(len(data)))
+        return len(data)
+
+    def _queue(self, answer, sent_in=0.0):
+        if not answer: return
+        ready = time.monotonic() + sent_in + self.faults.delay() + self._byte_time(len(answer))
+        with self._cond:
+            self._pending.append((ready, self.faults.mangle(answer)))
+            self._cond.notify_all()
+
+    def _collect(self):
+        now = time.monotonic()
+        self._queue(self.device.process())  # Lets an unfinished payload time out on the device
+        while self._pending and self._pending[0][0] <= now:
+            self._rx += self._pending.popleft()[1]
+        return self._pending[0][0] - now if self._pending else None
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            self._collect()
+            return len(self._rx)
+
+    def readinto(self, buffer):
+        deadline = time.monotonic() + (self.timeout or 0.0)
+        with self._cond:
+            while True:
+                if not self.is_open or not self.device.powered: raise serial.SerialException("port gone")
+                next_in = self._collect()
+                if self._rx:
+                    count = min(len(buffer), len(self._rx))
+                    buffer[:count] = self._rx[:count]
+                    del self._rx[:count]
+                    return count
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return 0
+                self._cond.wait(min(left, next_in) if next_in is not None else left)
+
+    def read(self, size=1):
+        buffer = bytearray(size)
+        return bytes(buffer[:self.readinto(buffer)])
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._pending.clear()
+            self._rx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    @property
+    def dtr(self):
+        return self._dtr
+
+    @dtr.setter
+    def dtr(self, value):
+        # Rising edge after a low pulse reboots the board (what the DTR reset wiring does)
+        if value and not self._dtr:
+            self.device.reboot()
+            self.reset_input_buffer()
+        self._dtr = bool(value)
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+
+class EmulatedUART(UARTHandler):
+    # UARTHandler whose only port is the in-process emulator
+    def __init__(self, device=None, faults=None, port=EMULATOR_PORT, baudrate=115200):
+        super().__init__(port, baudrate)
+        self.device = device or VirtualDevice()
+        self.faults = faults
+
+    def list_available_ports(self):
+        return [self.port_name] if self.device.powered else []
+
+    def open_port(self):
+        return self.attach(LoopbackSerial(self.device, self.faults, self.baudrate))
+
+    def sibling(self, port):
+        return EmulatedUART(self.device, self.faults, port, self.baudrate)
+
+
+class PtyBridge(threading.Thread):
+    # Serves a VirtualDevice on a pseudo-terminal, so anything that opens a serial port by
+    # name (pyserial, the debug scripts, another process) can talk to it. Linux/macOS only.
+    def __init__(self, device=None, faults=None):
+        import tty
+        super().__init__(name="pty-device", daemon=True)
+        self.device = device or VirtualDevice()
+        self.faults = faults or Faults()
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.slave = slave
+        self.port_name = os.ttyname(slave)
+        self.running = True
+
+    def run(self):
+        import select
+        while self.running:
+            readable, _, _ = select.select([self.master], [], [], PAYLOAD_TIMEOUT / 5)
+            data = os.read(self.master, 4096) if readable else b""
+            answer = self.device.process(data)
+            if answer:
+                delay = self.faults.delay()
+                if delay: time.sleep(delay)
+                os.write(self.master, self.faults.mangle(answer))
+
+    def stop(self):
+        self.running = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a virtual Mahjong STM32 board.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--pty", action="store_true", help="serve the device on a pseudo-terminal (default)")
+    mode.add_argument("--gui", action="store_true", help="start the game connected to an in-process device")
+    parser.add_argument("--seed", type=int, help="seed for the device's rand()")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay, up to this many seconds")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of losing each answer byte")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability of flipping a bit in each answer byte")
+    args = parser.parse_args(argv)
+
+    device = VirtualDevice(args.seed)
+    faults = Faults(args.latency, args.jitter, args.drop, args.corrupt, args.seed)
+    if args.gui:
+        from Mahjong_Game import MahjongApp
+        MahjongApp(uart=EmulatedUART(device, faults), probe_all=True).mainloop()  # Its port has no VID
+        return
+
+    bridge = PtyBridge(device, faults)
+    bridge.start()
+    print(f"Virtual device on {bridge.port_name} (Ctrl+C to stop)")
+    try:
+        while bridge.is_alive():
+            bridge.join(1.0)
+    except KeyboardInterrupt:
+        bridge.stop()
+    print(f"{device.frames} frames handled, {device.bad_frames} with a bad CRC")
+
+
+if __name__ == "__main__":
+    main()
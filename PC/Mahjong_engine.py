@@ -0,0 +1,123 @@
+# Python mirror of the firmware rules (STM/mahjong-game/Core/Src/command_list.c) and deck (Game_engine.c).
+# The UI uses it to answer clicks and hints locally; the STM32 stays the authority and
+# the UI rolls back whenever the device disagrees.
+
+from Mahjong_layouts import get_layout
+
+TOTAL_PIECES = 50
+MAX_SHUFFLES = 5
+
+# (group, first value, kinds, copies) as filled in by add_tiles() in Mahjong_Generate_New_Layout
+DECK_SPEC = ((0, 1, 6, 4), (2, 1, 4, 4), (4, 1, 1, 2), (5, 1, 4, 2))
+
+
+def tile_group(tile):
+    # Group lives in the top 3 bits, value in the low 5
+    return (tile >> 5) & 0x07
+
+
+def tiles_match(t1, t2):
+    # Same group AND (bonus group 5/6 OR exactly the same tile)
+    g1, g2 = tile_group(t1), tile_group(t2)
+    return g1 == g2 and (g1 == 5 or g1 == 6 or t1 == t2)
+
+
+def pack_tile(group, value):
+    return ((group & 0x07) << 5) | (value & 0x1F)
+
+
+def new_deck():
+    # Unshuffled deck in add_tiles() order
+    return bytearray(pack_tile(group, start + v)
+                     for group, start, kinds, copies in DECK_SPEC
+                     for v in range(kinds) for _ in range(copies))
+
+
+def deal(rng):
+    # Mahjong_Generate_New_Layout: Fisher-Yates over the whole deck (rng stands in for rand())
+    tiles = new_deck()
+    for i in range(len(tiles) - 1, 0, -1):
+        j = rng.randrange(i + 1)
+        tiles[i], tiles[j] = tiles[j], tiles[i]
+    return tiles
+
+
+def shuffle_remaining(tiles, rng):
+    # cmd_shuffle: Fisher-Yates over the tiles still present, written back to the same positions
+    ids = [i for i, tile in enumerate(tiles) if tile]
+    left = [tiles[i] for i in ids]
+    for i in range(len(left) - 1, 0, -1):
+        j = rng.randrange(i + 1)
+        left[i], left[j] = left[j], left[i]
+    for i, tile in zip(ids, left):
+        tiles[i] = tile
+
+
+class MahjongBoard:
+    def __init__(self, data=None, layout_id=0):
+        self.layout_id = layout_id
+        self.layout = get_layout(layout_id)
+        self.tiles = bytearray(TOTAL_PIECES)
+        self.active_selection = -1
+        if data is not None:
+            self.load(data, layout_id)
+
+    def load(self, data, layout_id=None):
+        if layout_id is not None:
+            self.layout_id = layout_id
+            self.layout = get_layout(layout_id)
+        self.tiles[:] = bytes(data[:TOTAL_PIECES]).ljust(TOTAL_PIECES, b"\x00")
+        self.active_selection = -1
+
+    # --- Rules ---
+
+    def is_tile_present(self, index):
+        return 0 <= index < TOTAL_PIECES and self.tiles[index] != 0
+
+    def is_tile_exposed(self, index):
+        # Nothing on top, and at least one free side (left or right)
+        if not self.is_tile_present(index): return False
+        tiles, layout = self.tiles, self.layout
+        for above in layout.above[index]:
+            if tiles[above]: return False
+        left, right = layout.left[index], layout.right[index]
+        return not (left >= 0 and tiles[left] and right >= 0 and tiles[right])
+
+    def can_match(self, first, second):
+        return (first != second and self.is_tile_exposed(first) and self.is_tile_exposed(second)
+                and tiles_match(self.tiles[first], self.tiles[second]))
+
+    def select(self, index):
+        # Mirrors cmd_select
+        if not self.is_tile_exposed(index): return False
+        self.active_selection = index
+        return True
+
+    def match(self, index):
+        # Mirrors cmd_match: an invalid second tile (nothing selected, the selected tile itself,
+        # a blocked tile) is refused and keeps the selection; a mismatch clears it, a match also
+        # removes the pair
+        first = self.active_selection
+        if first == -1 or index == first or not self.is_tile_exposed(index): return False
+        self.active_selection = -1
+        if not tiles_match(self.tiles[first], self.tiles[index]): return False
+        self.remove(first, index)
+        return True
+
+    def remove(self, first, second):
+        self.tiles[first] = self.tiles[second] = 0
+
+    def restore(self, first, t1, second, t2):
+        self.tiles[first], self.tiles[second] = t1, t2
+
+    def find_hint(self):
+        # Mirrors cmd_hint: first exposed matching pair, or None
+        exposed = [i for i in range(TOTAL_PIECES) if self.is_tile_exposed(i)]
+        for n, i in enumerate(exposed):
+            for j in exposed[n + 1:]:
+                if tiles_match(self.tiles[i], self.tiles[j]):
+                    return i, j
+        return None
+
+    def is_cleared(self):
+        return not any(self.tiles)
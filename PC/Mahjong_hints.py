@@ -0,0 +1,73 @@
+# Local hint engine: exposed tiles bucketed by match key, kept up to date as pairs come and go,
+# and candidate pairs ranked with a short solver lookahead instead of "first pair found".
+
+from itertools import combinations
+
+from Mahjong_solver import Solver, layout_masks, match_key
+
+HINT_NODE_BUDGET = 2000  # Solver states one hint may look at before falling back to the heuristic
+
+
+class HintEngine:
+    def __init__(self, board):
+        self.board = board
+        self.rebuild()
+
+    def rebuild(self):
+        # Full scan: only for a new board (start, reset, shuffle)
+        self.layout = self.board.layout
+        self.exposed = {}  # match key -> set of exposed indices
+        self.filed = {}    # index -> key it is filed under
+        for idx in range(self.layout.size):
+            self._refresh(idx)
+
+    def _refresh(self, idx):
+        key = self.filed.pop(idx, None)
+        if key is not None:
+            bucket = self.exposed[key]
+            bucket.discard(idx)
+            if not bucket: del self.exposed[key]
+        if self.board.is_tile_exposed(idx):
+            key = match_key(self.board.tiles[idx])
+            self.exposed.setdefault(key, set()).add(idx)
+            self.filed[idx] = key
+
+    def removed(self, first, second):
+        # After a match: only the pair and the tiles they cover or flank can change
+        blocks = self.layout.blocks
+        for idx in {first, second, *blocks[first], *blocks[second]}:
+            self._refresh(idx)
+
+    # Rolling a pair back touches exactly the same tiles
+    restored = removed
+
+    def pairs(self):
+        for bucket in self.exposed.values():
+            if len(bucket) >= 2:
+                yield from combinations(sorted(bucket), 2)
+
+    def has_moves(self):
+        return any(len(bucket) >= 2 for bucket in self.exposed.values())
+
+    def best(self):
+        # Pair to suggest, or None. Candidates are ordered by how many tiles they free (then by
+        # how much sits under them); the first one that keeps the board winnable is the hint.
+        candidates = list(self.pairs())
+        if not candidates: return None
+
+        masks = layout_masks(self.board.layout_id)
+        state = sum(1 << i for i, tile in enumerate(self.board.tiles) if tile)
+        free = sum(1 << i for i in self.filed)
+
+        def rank(pair):
+            i, j = pair
+            bits = (1 << i) | (1 << j)
+            freed = masks.refresh(state & ~bits, free, bits) & ~free
+            return freed.bit_count(), ((masks.below[i] | masks.below[j]) & state).bit_count()
+        candidates.sort(key=rank, reverse=True)
+
+        solver = Solver(self.board.tiles, self.board.layout_id, max_nodes=HINT_NODE_BUDGET)
+        for first, second in candidates:
+            if solver.wins_after(first, second): return first, second
+            if solver.exhausted: break
+        return candidates[0]
@@ -0,0 +1,121 @@
+# Layout geometry, computed once per layout and shared by the renderer, hit-testing and the rules.
+# Tile indices follow the firmware order (layer by layer, row by row), so index i here is board byte i.
+
+from array import array
+
+
+class Layout:
+    # cells: (layer, row, col, gx, gy) per tile index, gx/gy in tile units on screen.
+    # above(l, r, c): coordinates on layer l+1 that cover the tile (same rule as is_tile_exposed).
+    # origin: the grid point that lands on the canvas centre.
+    def __init__(self, name, cells, above, origin):
+        self.name = name
+        self.size = len(cells)
+        self.origin = origin
+        self.coords = tuple((l, r, c) for l, r, c, _, _ in cells)
+        self.grid = tuple((gx, gy, l) for l, r, c, gx, gy in cells)  # (gx, gy, z)
+
+        index_of = {coord: i for i, coord in enumerate(self.coords)}
+        self.index_of = index_of
+
+        # Compact per-index arrays; -1 means "no tile there"
+        self.left = array("b", (index_of.get((l, r, c - 1), -1) for l, r, c in self.coords))
+        self.right = array("b", (index_of.get((l, r, c + 1), -1) for l, r, c in self.coords))
+        self.above = tuple(
+            tuple(index_of[pos] for pos in above(l, r, c) if pos in index_of)
+            for l, r, c in self.coords)
+        # Inverse of the above: tiles whose exposure depends on this one (it covers or flanks them)
+        self.blocks = tuple(
+            tuple(j for j in range(self.size)
+                  if i in self.above[j] or self.left[j] == i or self.right[j] == i)
+            for i in range(self.size))
+
+        self._positions_key = None
+        self._positions = ()
+        self._hit_grid = None
+
+    def get_index(self, l, r, c):
+        return self.index_of.get((l, r, c), -1)
+
+    def screen_positions(self, cx, cy, tile_w, tile_h, shadow):
+        # Top-left canvas corner of every tile; recomputed only when the canvas centre moves
+        key = (cx, cy, tile_w, tile_h, shadow)
+        if key != self._positions_key:
+            ox, oy = self.origin
+            self._positions = tuple(
+                (cx + (gx - ox) * tile_w - z * shadow, cy + (gy - oy) * tile_h - z * shadow)
+                for gx, gy, z in self.grid)
+            self._positions_key = key
+            self._hit_grid = None
+        return self._positions
+
+    def hit_grid(self, cx, cy, tile_w, tile_h, shadow):
+        # Spatial index matching screen_positions(); rebuilt together with it
+        positions = self.screen_positions(cx, cy, tile_w, tile_h, shadow)
+        if self._hit_grid is None:
+            self._hit_grid = HitGrid(positions, tile_w, tile_h)
+        return self._hit_grid
+
+
+class HitGrid:
+    # Buckets of half a tile: every bucket lists the tiles overlapping it, topmost first,
+    # so a lookup checks a handful of candidates instead of scanning the whole board.
+    # Presence is read from the live tile bytes, so removed (or restored) tiles need no update here.
+    def __init__(self, positions, tile_w, tile_h):
+        self.positions = positions
+        self.tile_w, self.tile_h = tile_w, tile_h
+        self.cell_w, self.cell_h = tile_w / 2.0, tile_h / 2.0
+        self.x0 = min((x for x, _ in positions), default=0)
+        self.y0 = min((y for _, y in positions), default=0)
+
+        buckets = {}
+        for idx in range(len(positions) - 1, -1, -1):
+            x, y = positions[idx]
+            col0, row0 = self._cell(x, y)
+            col1, row1 = self._cell(x + tile_w, y + tile_h)
+            for col in range(col0, col1 + 1):
+                for row in range(row0, row1 + 1):
+                    buckets.setdefault((col, row), []).append(idx)
+        self.buckets = {cell: tuple(indices) for cell, indices in buckets.items()}
+
+    def _cell(self, x, y):
+        return int((x - self.x0) // self.cell_w), int((y - self.y0) // self.cell_h)
+
+    def query(self, x, y, tiles):
+        # Topmost present tile under the point, or -1
+        for idx in self.buckets.get(self._cell(x, y), ()):
+            if tiles[idx]:
+                tx, ty = self.positions[idx]
+                if tx <= x <= tx + self.tile_w and ty <= y <= ty + self.tile_h:
+                    return idx
+        return -1
+
+
+def _square_pyramid():
+    # 5x5, 4x4, 3x3; each layer sits half a tile in from the one below
+    cells = []
+    for layer, side in enumerate((5, 4, 3)):
+        for r in range(side):
+            for c in range(side):
+                cells.append((layer, r, c, c + layer * 0.5, r + layer * 0.5))
+    above = lambda l, r, c: ((l + 1, r - 1, c - 1), (l + 1, r - 1, c), (l + 1, r, c - 1), (l + 1, r, c))
+    return Layout("Square Pyramid", cells, above, origin=(2.5, 2.5))
+
+
+def _triangle_pyramid():
+    # Triangles of 7, 5, 3 and 1 rows, row r holding r+1 tiles
+    cells = []
+    for layer in range(4):
+        for r in range(7 - 2 * layer):
+            for c in range(r + 1):
+                cells.append((layer, r, c, c - r / 2.0, layer + r))
+    above = lambda l, r, c: ((l + 1, r - 1, c - 1), (l + 1, r - 1, c))
+    return Layout("Triangle Pyramid", cells, above, origin=(0.5, 3.5))
+
+
+# Indexed by the layout id sent with CMD_START
+LAYOUTS = (_square_pyramid(), _triangle_pyramid())
+
+
+def get_layout(layout_id):
+    return LAYOUTS[layout_id] if 0 <= layout_id < len(LAYOUTS) else LAYOUTS[0]
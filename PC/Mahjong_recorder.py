@@ -0,0 +1,285 @@
+# Game recording: every game played is appended to a binary log of fixed-size records (start,
+# board, select, match, shuffle, hint, end), kept in memory and written out in batches so the
+# command path only pays for one struct.pack. The reader memory-maps the log and walks it with
+# struct.iter_unpack, without copying the file; a replay drives the game view from a recording.
+#
+#   python Mahjong_recorder.py summary
+#   python Mahjong_recorder.py replay --game -1 --speed 4
+
+import argparse
+import atexit
+import collections
+import mmap
+import os
+import re
+import struct
+import time
+
+from Mahjong_engine import MAX_SHUFFLES, TOTAL_PIECES
+from UART_codec import Ack, Board, decode
+from UART_protocol import CMD_SELECT, CMD_MATCH, CMD_SHUFFLE, CMD_HINT, COMMAND_NAMES, NO_HINT, SHORT_ERROR
+
+DEFAULT_PATH = os.environ.get("MAHJONG_RECORD", os.path.join(os.path.expanduser("~"), ".mahjong_games.bin"))
+FLUSH_BYTES = 64 * 1024  # Buffered records are written once they reach this size (and at the end of a game)
+
+# One record: ms since the game started, kind, three small arguments and 8 bytes of extra data.
+# Commands use their CMD code as the kind: a/b are the tile indices, c the device's status byte.
+RECORD = struct.Struct("<IBBBB8s")
+GAME_INFO = struct.Struct("<II")  # Extra data of a GAME record: deal seed, unix time
+RTT = struct.Struct("<I4x")        # Extra data of a command record: send -> answer in microseconds (no queueing)
+BOARD_CHUNK = 8                    # Tiles per BOARD record
+
+GAME = 0x80   # a = layout, c = 1 if the seed reproduces the deal
+BOARD = 0x81  # a = chunk number, extra = tiles [a*8, a*8+8); follows GAME and every new shuffle board
+END = 0x82    # c = outcome
+
+NO_ANSWER = 0xFE  # Status of a command the device never answered
+LEFT, WON, LOST, GAVE_UP = range(4)
+OUTCOMES = {LEFT: "left", WON: "won", LOST: "lost", GAVE_UP: "gave up"}
+
+
+def board_log_path(port, base=DEFAULT_PATH):
+    # Separate log per board when several are played at once
+    root, ext = os.path.splitext(base)
+    return f"{root}.{re.sub(r'[^A-Za-z0-9]+', '_', port).strip('_')}{ext}"
+
+
+class Recorder:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.buffer = bytearray()
+        self.started = None  # monotonic time of the open game's start; None between games
+        atexit.register(self.close)
+
+    def _ms(self):
+        return int((time.monotonic() - self.started) * 1000.0)
+
+    def _add(self, kind, a=0, b=0, c=0, extra=b"", ms=None):
+        self.buffer += RECORD.pack(self._ms() if ms is None else ms, kind, a, b, c, extra)
+        if len(self.buffer) >= FLUSH_BYTES: self.flush()
+
+    def _board(self, tiles):
+        tiles = bytes(tiles)
+        for chunk, at in enumerate(range(0, len(tiles), BOARD_CHUNK)):
+            self._add(BOARD, chunk, 0, 0, tiles[at:at + BOARD_CHUNK])
+
+    def start_game(self, layout_id, seed, tiles):
+        if self.started is not None: self.end_game(LEFT)
+        self.started = time.monotonic()
+        self._add(GAME, layout_id, 0, seed is not None, GAME_INFO.pack(seed or 0, int(time.time())), ms=0)
+        self._board(tiles)
+
+    def answer(self, cmd, resp, rtt, a=0, b=0):
+        # A device answer to SELECT / MATCH / SHUFFLE; `rtt` is the handler's send -> answer time
+        # (UARTRequest.rtt), None without an answer
+        if self.started is None: return
+        reply = decode(resp, cmd)
+        status = reply.status if isinstance(reply, Ack) else 0 if reply is not None else NO_ANSWER
+        self._add(cmd, a, b, status, RTT.pack(min(int((rtt or 0.0) * 1e6), 0xFFFFFFFF)))
+        if isinstance(reply, Board): self._board(reply.tiles)
+
+    def hint(self, pair):
+        # Hints are answered locally; no pair is recorded as NO_HINT
+        if self.started is None: return
+        first, second = pair if pair else (NO_HINT, NO_HINT)
+        self._add(CMD_HINT, first, second)
+
+    def end_game(self, outcome):
+        if self.started is None: return
+        self._add(END, 0, 0, outcome)
+        self.started = None
+        self.flush()
+
+    def flush(self):
+        if not self.buffer: return
+        with open(self.path, "ab") as f:
+            f.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        self.end_game(LEFT)
+        self.flush()
+
+
+GameRecord = collections.namedtuple("GameRecord", "layout_id seed started tiles events outcome")
+# One recorded command; `tiles` is the new board for a shuffle, else None
+Event = collections.namedtuple("Event", "ms kind a b status rtt_us tiles")
+
+
+class GameLog:
+    # Read-only view of a log file. A record cut short by a crash at the end is ignored.
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.count = size // RECORD.size
+
+    def close(self):
+        if self.map: self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def records(self, start=0):
+        # (ms, kind, a, b, c, extra) straight from the mapped file, from record `start` on
+        return RECORD.iter_unpack(memoryview(self.map)[start * RECORD.size:self.count * RECORD.size])
+
+    def games(self, start=0):
+        game = None
+        for ms, kind, a, b, c, extra in self.records(start):
+            if kind == GAME:
+                if game is not None: yield self._finish(game, LEFT)
+                seed, started = GAME_INFO.unpack(extra)
+                game = {"layout_id": a, "seed": seed if c else None, "started": started,
+                        "tiles": bytearray(), "events": []}
+                board = game["tiles"]
+            elif game is None:
+                continue
+            elif kind == BOARD:
+                if board is not None: board += extra
+            elif kind == END:
+                yield self._finish(game, c)
+                game = None
+            else:
+                rtt = RTT.unpack(extra)[0] if kind != CMD_HINT else 0
+                board = bytearray() if kind == CMD_SHUFFLE and c == 0 else None
+                game["events"].append([ms, kind, a, b, c, rtt, board])
+        if game is not None: yield self._finish(game, LEFT)
+
+    def last_game(self):
+        # Found from the end of the file, so it costs the same however long the log is
+        for n in range(self.count - 1, -1, -1):
+            if self.map[n * RECORD.size + 4] == GAME:
+                return next(self.games(n))
+        return None
+
+    @staticmethod
+    def _finish(game, outcome):
+        events = [Event(ms, kind, a, b, c, rtt, bytes(tiles[:TOTAL_PIECES]) if tiles is not None else None)
+                  for ms, kind, a, b, c, rtt, tiles in game["events"]]
+        return GameRecord(game["layout_id"], game["seed"], game["started"], bytes(game["tiles"][:TOTAL_PIECES]),
+                          events, outcome)
+
+    def summary(self):
+        # Whole-log figures in one pass over the records
+        kinds = collections.Counter()
+        outcomes = collections.Counter()
+        rtt_total = collections.Counter()
+        matched = no_answer = hints_empty = refused = 0
+        game_ms = 0
+        for ms, kind, a, b, c, extra in self.records():
+            kinds[kind] += 1
+            if kind == END:
+                outcomes[c] += 1
+                game_ms += ms
+            elif kind == GAME or kind == BOARD:
+                continue
+            elif kind == CMD_HINT:
+                hints_empty += a == NO_HINT
+            else:
+                rtt_total[kind] += RTT.unpack_from(extra)[0]
+                if c == NO_ANSWER: no_answer += 1
+                elif kind == CMD_MATCH and c == 0x01: matched += 1
+                elif kind == CMD_SHUFFLE and c == SHORT_ERROR: refused += 1
+        commands = {COMMAND_NAMES[kind]: {"count": kinds[kind], "mean_rtt_ms": round(rtt_total[kind] / kinds[kind] / 1000.0, 3)}
+                    for kind in (CMD_SELECT, CMD_MATCH, CMD_SHUFFLE) if kinds[kind]}
+        return {
+            "records": self.count,
+            "games": kinds[GAME],
+            "outcomes": {OUTCOMES[k]: n for k, n in sorted(outcomes.items())},
+            "commands": commands,
+            "matches_accepted": matched,
+            "unanswered": no_answer,
+            "hints": kinds[CMD_HINT],
+            "hints_without_pair": hints_empty,
+            "shuffle_refusals": refused,
+            "mean_game_s": round(game_ms / 1000.0 / sum(outcomes.values()), 1) if outcomes else None,
+        }
+
+
+class Replay:
+    # Plays a recorded game on a GameInterface with its own timing (sped up by `speed`).
+    # The view ignores clicks and buttons while view.replay is set; exit_to_menu clears it.
+    def __init__(self, view, game, speed=1.0):
+        self.view = view
+        self.game = game
+        self.speed = speed
+        self.position = 0
+
+    def start(self):
+        view = self.view
+        view.replay = self
+        view.timer_active = False
+        view.layout_id = self.game.layout_id
+        view.selected_index = None
+        view.board.load(self.game.tiles, self.game.layout_id)
+        view.update_shuffle_counter(MAX_SHUFFLES)
+        view.show_time(0)
+        view.draw_pyramid(self.game.tiles)
+        self.schedule(0)
+
+    def schedule(self, now_ms):
+        if self.position < len(self.game.events):
+            delay = max(0, self.game.events[self.position].ms - now_ms) / self.speed
+            self.view.after(int(delay), self.step)
+
+    def step(self):
+        view = self.view
+        if view.replay is not self: return  # Left the replay
+        event = self.game.events[self.position]
+        self.position += 1
+        if event.kind == CMD_SELECT and event.status == 0x00:
+            view.selected_index = event.a
+        elif event.kind == CMD_MATCH and event.status == 0x01:
+            view.selected_index = None
+            view.board.remove(event.a, event.b)
+        elif event.kind == CMD_SHUFFLE and event.tiles:
+            view.selected_index = None
+            view.board.load(event.tiles)
+            view.update_shuffle_counter(view.shuffles_left - 1)
+        elif event.kind == CMD_HINT and event.a != NO_HINT:
+            view.show_hint_blink([event.a, event.b])
+        view.show_time(event.ms // 1000)
+        view.draw_pyramid(bytes(view.board.tiles))
+        self.schedule(event.ms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or replay recorded Mahjong games.")
+    parser.add_argument("action", choices=("summary", "list", "replay"))
+    parser.add_argument("log", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--game", type=int, default=-1, help="replay: game number in the log (negative counts from the end)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay: playback speed factor")
+    args = parser.parse_args(argv)
+
+    with GameLog(args.log) as log:
+        if args.action == "summary":
+            started = time.perf_counter()
+            summary = log.summary()
+            for key, value in summary.items():
+                print(f"{key:<20}{value}")
+            print(f"scanned {log.count} records in {time.perf_counter() - started:.2f} s")
+            return
+        games = list(log.games())
+    if args.action == "list":
+        for n, game in enumerate(games):
+            moves = sum(1 for e in game.events if e.kind == CMD_MATCH and e.status == 0x01)
+            length = game.events[-1].ms / 1000.0 if game.events else 0.0
+            print(f"{n:>5}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(game.started))}  layout {game.layout_id}  "
+                  f"seed {game.seed}  {moves:>2} pairs  {length:>7.1f} s  {OUTCOMES[game.outcome]}")
+    else:
+        if not games:
+            parser.error("no games in the log")
+        from Mahjong_Game import MahjongApp
+        app = MahjongApp()
+        app.show_replay(games[args.game], args.speed)
+        app.mainloop()
+
+
+if __name__ == "__main__":
+    main()
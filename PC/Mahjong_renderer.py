@@ -0,0 +1,104 @@
+# Retained-mode board renderer: canvas items are created once per board and then only
+# re-configured (outline, colours, text, hidden) for the tiles whose state actually changed.
+
+TILE_W, TILE_H, SHADOW_OFFSET = 50, 65, 4
+
+TILE_GROUPS = {
+    0: ("Bamboo", "#66BB6A"), 1: ("Chars", "#EF5350"), 2: ("Circles", "#42A5F5"),
+    3: ("Winds", "#BDBDBD"), 4: ("Dragons", "#FFEE58"), 5: ("Flowers", "#AB47BC"), 6: ("Seasons", "#FFA726")
+}
+
+OUTLINE_NORMAL = ("black", 1)
+OUTLINE_SELECTED = ("cyan", 3)
+OUTLINE_ERROR = ("red", 3)
+OUTLINE_HINT = ("yellow", 4)
+
+
+def tile_look(tile):
+    gid, val = (tile >> 5) & 0x07, tile & 0x1F
+    name, color = TILE_GROUPS.get(gid, ("?", "white"))
+    return color, str(val), name[:3]
+
+
+class BoardRenderer:
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.layout = None
+        self.positions = ()
+        self.hit_grid = None
+        self.items = []      # Per index: (shadow, face, fill, value_text, group_text)
+        self.tiles = b""     # Tile bytes currently shown
+        self.outlines = []   # Per index: outline currently applied
+        self.centre = None
+        canvas.bind("<Configure>", self.on_resize, add="+")
+
+    def build(self, data, layout):
+        # Full rebuild: only for a new board/layout or a canvas resize
+        canvas = self.canvas
+        canvas.delete("all")
+        canvas.update_idletasks()
+        self.centre = (canvas.winfo_width() / 2, canvas.winfo_height() / 2)
+        self.layout = layout
+        self.positions = layout.screen_positions(self.centre[0], self.centre[1], TILE_W, TILE_H, SHADOW_OFFSET)
+        self.hit_grid = layout.hit_grid(self.centre[0], self.centre[1], TILE_W, TILE_H, SHADOW_OFFSET)
+        self.items = []
+        self.outlines = [OUTLINE_NORMAL] * layout.size
+        self.tiles = bytes(data[:layout.size]).ljust(layout.size, b"\x00")
+
+        # Index order is bottom layer first, so upper tiles stack on top
+        for idx, (x, y) in enumerate(self.positions):
+            tile = self.tiles[idx]
+            color, value, group = tile_look(tile)
+            state = "normal" if tile else "hidden"
+            border, b_w = OUTLINE_NORMAL
+            self.items.append((
+                canvas.create_rectangle(x+4, y+4, x+TILE_W+4, y+TILE_H+4, fill="#1a1a1a", outline="", state=state),
+                canvas.create_rectangle(x, y, x+TILE_W, y+TILE_H, fill="#f0f0f0", outline=border, width=b_w, state=state),
+                canvas.create_rectangle(x+2, y+2, x+TILE_W-2, y+TILE_H-2, fill=color, outline="", state=state),
+                canvas.create_text(x+TILE_W/2, y+TILE_H/2-5, text=value, font=("Arial", 14, "bold"), state=state),
+                canvas.create_text(x+TILE_W/2, y+TILE_H-10, text=group, font=("Arial", 7), state=state),
+            ))
+
+    def on_resize(self, event):
+        if self.layout is not None and (event.width / 2, event.height / 2) != self.centre:
+            tiles, outlines = self.tiles, self.outlines
+            self.build(tiles, self.layout)
+            for idx, outline in enumerate(outlines):
+                if outline != OUTLINE_NORMAL: self._set_outline(idx, outline)
+
+    def sync(self, data, layout, selected=None, errors=(), hints=()):
+        # Bring the canvas in line with the given state, touching only what differs
+        if layout is not self.layout:
+            self.build(data, layout)
+
+        canvas = self.canvas
+        for idx in range(layout.size):
+            tile = data[idx] if idx < len(data) else 0
+            if tile != self.tiles[idx]:
+                shadow, face, fill, value, group = self.items[idx]
+                if tile:
+                    color, text, name = tile_look(tile)
+                    canvas.itemconfigure(fill, fill=color)
+                    canvas.itemconfigure(value, text=text)
+                    canvas.itemconfigure(group, text=name)
+                for item in self.items[idx]:
+                    canvas.itemconfigure(item, state="normal" if tile else "hidden")
+        self.tiles = bytes(data[:layout.size]).ljust(layout.size, b"\x00")
+
+        for idx in range(layout.size):
+            outline = OUTLINE_NORMAL
+            if idx == selected: outline = OUTLINE_SELECTED
+            if idx in errors: outline = OUTLINE_ERROR
+            if idx in hints: outline = OUTLINE_HINT
+            if outline != self.outlines[idx]:
+                self._set_outline(idx, outline)
+
+    def _set_outline(self, idx, outline):
+        border, b_w = outline
+        self.canvas.itemconfigure(self.items[idx][1], outline=border, width=b_w)
+        self.outlines[idx] = outline
+
+    def hit_test(self, x, y):
+        # Topmost tile under the point, or -1
+        if self.hit_grid is None: return -1
+        return self.hit_grid.query(x, y, self.tiles)
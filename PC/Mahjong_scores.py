@@ -0,0 +1,127 @@
+# Local score store (SQLite). Keeps the last leaderboard read from every board, so the victory
+# popup can show it without touching the UART, and an unlimited history of results: games won
+# on this PC plus every new entry seen in a device leaderboard. A device leaderboard is only
+# rewritten when its content hash changes.
+
+import hashlib
+import os
+import sqlite3
+import time
+
+from UART_codec import LeaderEntry
+
+DEFAULT_PATH = os.environ.get("MAHJONG_SCORES", os.path.join(os.path.expanduser("~"), ".mahjong_scores.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,      -- USB serial number, or the port name when there is none
+    board_hash TEXT,               -- hash of the cached leaderboard
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS device_leaders (
+    device_id INTEGER NOT NULL REFERENCES devices(id),
+    rank INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (device_id, rank)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    device_id INTEGER REFERENCES devices(id),
+    player TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    layout_id INTEGER,             -- NULL for results only known from a device leaderboard
+    seed INTEGER,
+    source TEXT NOT NULL,          -- 'game' (won here) or 'device' (read from a leaderboard)
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_player ON scores(player, seconds);
+CREATE INDEX IF NOT EXISTS scores_layout ON scores(layout_id, seconds);
+CREATE INDEX IF NOT EXISTS scores_device ON scores(device_id, player, seconds);
+"""
+
+
+def board_hash(entries):
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in entries:
+        digest.update(f"{entry.name}\0{entry.seconds}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ScoreStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self._device_ids = {}
+
+    def close(self):
+        self.db.close()
+
+    def device_id(self, key):
+        if key not in self._device_ids:
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO devices(key) VALUES (?)", (key,))
+            self._device_ids[key] = self.db.execute("SELECT id FROM devices WHERE key = ?", (key,)).fetchone()[0]
+        return self._device_ids[key]
+
+    # --- Device leaderboards ---
+
+    def leaderboard(self, key):
+        # Cached leaderboard of a board, best first; empty if it was never synced
+        rows = self.db.execute("SELECT name, seconds FROM device_leaders WHERE device_id = ? ORDER BY rank",
+                               (self.device_id(key),))
+        return [LeaderEntry(name, seconds) for name, seconds in rows]
+
+    def sync(self, key, entries):
+        # Stores a freshly read leaderboard; False (and no writes) when it matches the cache
+        device = self.device_id(key)
+        new_hash = board_hash(entries)
+        if self.db.execute("SELECT board_hash FROM devices WHERE id = ?", (device,)).fetchone()[0] == new_hash:
+            return False
+
+        old = self.leaderboard(key)
+        now = time.time()
+        with self.db:
+            self.db.execute("DELETE FROM device_leaders WHERE device_id = ?", (device,))
+            self.db.executemany("INSERT INTO device_leaders VALUES (?, ?, ?, ?)",
+                                [(device, rank, e.name, e.seconds) for rank, e in enumerate(entries)])
+            self.db.execute("UPDATE devices SET board_hash = ?, synced_at = ? WHERE id = ?", (new_hash, now, device))
+            # Entries the cache didn't have are new results, unless they were already recorded as games
+            # (the device's timer can differ from the PC clock by a second)
+            seen = [(e.name, e.seconds) for e in old]
+            for entry in entries:
+                if entry.empty: continue
+                if (entry.name, entry.seconds) in seen:
+                    seen.remove((entry.name, entry.seconds))
+                    continue
+                known = self.db.execute("SELECT 1 FROM scores WHERE device_id = ? AND player = ? "
+                                        "AND seconds BETWEEN ? AND ?",
+                                        (device, entry.name, entry.seconds - 1, entry.seconds + 1)).fetchone()
+                if not known:
+                    self.db.execute("INSERT INTO scores(device_id, player, seconds, source, recorded_at) "
+                                    "VALUES (?, ?, ?, 'device', ?)", (device, entry.name, entry.seconds, now))
+        return True
+
+    # --- History ---
+
+    def record_game(self, key, player, seconds, layout_id=None, seed=None):
+        with self.db:
+            self.db.execute("INSERT INTO scores(device_id, player, seconds, layout_id, seed, source, recorded_at) "
+                            "VALUES (?, ?, ?, ?, ?, 'game', ?)",
+                            (self.device_id(key) if key else None, player, seconds, layout_id, seed, time.time()))
+
+    def best_times(self, layout_id=None, limit=10):
+        # (player, seconds, layout_id, recorded_at), fastest first; all layouts when layout_id is None
+        where, args = ("WHERE layout_id = ?", (layout_id,)) if layout_id is not None else ("", ())
+        return self.db.execute(f"SELECT player, seconds, layout_id, recorded_at FROM scores {where} "
+                               "ORDER BY seconds LIMIT ?", args + (limit,)).fetchall()
+
+    def player_history(self, player, limit=None):
+        # (seconds, layout_id, source, recorded_at), newest first
+        return self.db.execute("SELECT seconds, layout_id, source, recorded_at FROM scores WHERE player = ? "
+                               "ORDER BY recorded_at DESC LIMIT ?", (player, limit or -1)).fetchall()
+
+    def player_best(self, player, layout_id=None):
+        where, args = ("AND layout_id = ?", (layout_id,)) if layout_id is not None else ("", ())
+        return self.db.execute(f"SELECT MIN(seconds) FROM scores WHERE player = ? {where}", (player,) + args).fetchone()[0]
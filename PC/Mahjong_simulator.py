@@ -0,0 +1,242 @@
+# Headless batch simulator: deals boards the way the firmware does (deck + Fisher-Yates, shuffles
+# of the remaining tiles up to MAX_SHUFFLES), plays them with a chosen strategy across all cores
+# and streams one record per game to disk.
+#
+#   python Mahjong_simulator.py --games 1000000 --layout all --strategy first greedy --out runs.jsonl
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+from Mahjong_engine import MAX_SHUFFLES, deal, shuffle_remaining
+from Mahjong_layouts import LAYOUTS
+from Mahjong_solver import Solver, layout_masks, match_key
+
+FIELDS = ("seed", "layout", "strategy", "won", "moves", "shuffles", "tiles_left", "deal_solvable")
+CHUNK_GAMES = 500  # Games per pool task: big enough to amortise the IPC, small enough to stream
+DEAL_NODE_BUDGET = 20000  # Solver states per deal for --check-deal (None in the record if exceeded)
+
+
+class SimGame:
+    # Bitmask copy of one game. Exposure depends only on which positions are filled, so a
+    # shuffle (same positions, new tiles) keeps the free set and only re-reads the keys.
+    def __init__(self, tiles, layout_id):
+        self.layout_id = layout_id
+        self.masks = layout_masks(layout_id)
+        self.tiles = tiles
+        self.state = sum(1 << i for i, tile in enumerate(tiles) if tile)
+        self.free = self.masks.exposed(self.state)
+        self.read_keys()
+
+    def read_keys(self):
+        self.keys = [match_key(tile) for tile in self.tiles]
+
+    def pairs(self):
+        # Free matching pairs, lowest index first (the order cmd_hint finds them in)
+        free = [i for i in range(len(self.tiles)) if self.free >> i & 1]
+        keys = self.keys
+        for n, i in enumerate(free):
+            for j in free[n + 1:]:
+                if keys[i] == keys[j]:
+                    yield i, j
+
+    def remove(self, i, j):
+        pair = (1 << i) | (1 << j)
+        self.state &= ~pair
+        self.free = self.masks.refresh(self.state, self.free, pair)
+        self.tiles[i] = self.tiles[j] = 0
+
+    def freed_by(self, i, j):
+        pair = (1 << i) | (1 << j)
+        return (self.masks.refresh(self.state & ~pair, self.free, pair) & ~self.free).bit_count()
+
+
+# --- Strategies: pick the next pair (or None) ---
+
+def play_first(game, rng):
+    # What the device hint would suggest
+    return next(game.pairs(), None)
+
+
+def play_random(game, rng):
+    pairs = list(game.pairs())
+    return rng.choice(pairs) if pairs else None
+
+
+def play_greedy(game, rng):
+    # Pair that frees the most tiles
+    return max(game.pairs(), key=lambda pair: game.freed_by(*pair), default=None)
+
+
+def play_solver(game, rng):
+    # Follow a winning line when the solver finds one, otherwise fall back to greedy
+    plan = getattr(game, "plan", None)
+    if plan is None:
+        plan = Solver(game.tiles, game.layout_id, max_nodes=DEAL_NODE_BUDGET).solve() or []
+        game.plan = plan
+    while plan:
+        i, j = plan.pop(0)
+        if game.free >> i & 1 and game.free >> j & 1 and game.keys[i] == game.keys[j]:
+            return i, j
+    return play_greedy(game, rng)
+
+
+STRATEGIES = {"first": play_first, "random": play_random, "greedy": play_greedy, "solver": play_solver}
+
+
+def play(seed, layout_id, strategy, max_shuffles=MAX_SHUFFLES, check_deal=False):
+    rng = random.Random(seed)
+    tiles = deal(rng)
+    record = {"seed": seed, "layout": layout_id, "strategy": strategy, "won": False,
+              "moves": 0, "shuffles": 0, "tiles_left": 0, "deal_solvable": None}
+    if check_deal:
+        solver = Solver(tiles, layout_id, max_nodes=DEAL_NODE_BUDGET)
+        solvable = solver.solve() is not None
+        record["deal_solvable"] = None if solver.exhausted else solvable
+
+    game = SimGame(tiles, layout_id)
+    pick = STRATEGIES[strategy]
+    while game.state:
+        pair = pick(game, rng)
+        if pair is not None:
+            game.remove(*pair)
+            record["moves"] += 1
+        elif record["shuffles"] < max_shuffles:
+            shuffle_remaining(game.tiles, rng)
+            game.read_keys()
+            game.plan = None
+            record["shuffles"] += 1
+        else:
+            break
+    record["won"] = not game.state
+    record["tiles_left"] = game.state.bit_count()
+    return record
+
+
+def play_vectorised(start, count, layout_id, max_shuffles, check_deal):
+    # "first" strategy for a whole chunk through NumPy (optional dependency). The chunk draws
+    # from one generator seeded with its first seed, so single games can't be replayed by seed.
+    import numpy as np
+    from Mahjong_batch import deal_batch, play_first
+
+    rng = np.random.default_rng(start)
+    batch = deal_batch(count, rng, layout_id)
+    deals = batch.tiles.copy()
+    won, moves, shuffles = play_first(batch, rng, max_shuffles)
+    left = (batch.tiles != 0).sum(axis=1)
+    records = []
+    for row in range(count):
+        solvable = None
+        if check_deal:
+            solver = Solver(deals[row].tobytes(), layout_id, max_nodes=DEAL_NODE_BUDGET)
+            found = solver.solve() is not None
+            solvable = None if solver.exhausted else found
+        records.append({"seed": start + row, "layout": layout_id, "strategy": "first", "won": bool(won[row]),
+                        "moves": int(moves[row]), "shuffles": int(shuffles[row]), "tiles_left": int(left[row]),
+                        "deal_solvable": solvable})
+    return records
+
+
+def run_chunk(task):
+    start, count, layout_id, strategy, max_shuffles, check_deal, vectorised = task
+    if vectorised and strategy == "first":
+        return play_vectorised(start, count, layout_id, max_shuffles, check_deal)
+    return [play(seed, layout_id, strategy, max_shuffles, check_deal) for seed in range(start, start + count)]
+
+
+def make_tasks(games, seed, layouts, strategies, max_shuffles, check_deal, vectorised=False, chunk=CHUNK_GAMES):
+    # Every (layout, strategy) pair plays the same seeds, so results compare deal for deal
+    for layout_id in layouts:
+        for strategy in strategies:
+            for start in range(seed, seed + games, chunk):
+                yield (start, min(chunk, seed + games - start), layout_id, strategy, max_shuffles, check_deal,
+                       vectorised)
+
+
+class Summary:
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, record):
+        row = self.rows.setdefault((record["layout"], record["strategy"]),
+                                   {"games": 0, "wins": 0, "moves": 0, "shuffles": 0, "win_shuffles": 0,
+                                    "solvable": 0, "checked": 0})
+        row["games"] += 1
+        row["moves"] += record["moves"]
+        row["shuffles"] += record["shuffles"]
+        if record["won"]:
+            row["wins"] += 1
+            row["win_shuffles"] += record["shuffles"]
+        if record["deal_solvable"] is not None:
+            row["checked"] += 1
+            row["solvable"] += record["deal_solvable"]
+
+    def report(self, out=sys.stdout):
+        out.write(f"{'layout':<18}{'strategy':<10}{'games':>10}{'win %':>8}{'moves':>8}{'shuffles':>10}"
+                  f"{'shuf/win':>10}{'solvable %':>12}\n")
+        for (layout_id, strategy), row in sorted(self.rows.items()):
+            games, wins = row["games"], row["wins"]
+            solvable = f"{100.0 * row['solvable'] / row['checked']:.1f}" if row["checked"] else "-"
+            out.write(f"{LAYOUTS[layout_id].name:<18}{strategy:<10}{games:>10}{100.0 * wins / games:>8.1f}"
+                      f"{row['moves'] / games:>8.1f}{row['shuffles'] / games:>10.2f}"
+                      f"{(row['win_shuffles'] / wins if wins else 0):>10.2f}{solvable:>12}\n")
+
+
+class RecordWriter:
+    # JSON lines, or CSV when the file name ends in .csv
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.csv = None
+        if path.endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, fieldnames=FIELDS)
+            self.csv.writeheader()
+
+    def write(self, records):
+        if self.csv: self.csv.writerows(records)
+        else: self.file.writelines(json.dumps(record) + "\n" for record in records)
+
+    def close(self):
+        self.file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deal and play Mahjong boards offline.")
+    parser.add_argument("--games", type=int, default=10000, help="games per layout and strategy")
+    parser.add_argument("--layout", default="all", help="layout id, or 'all'")
+    parser.add_argument("--strategy", nargs="+", default=["first"], choices=sorted(STRATEGIES))
+    parser.add_argument("--max-shuffles", type=int, default=MAX_SHUFFLES)
+    parser.add_argument("--seed", type=int, default=0, help="first seed; game k uses seed + k")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--check-deal", action="store_true", help="also run the solver on every fresh deal")
+    parser.add_argument("--vectorised", action="store_true",
+                        help="play the 'first' strategy through NumPy batches (much faster, needs numpy)")
+    parser.add_argument("--out", help="stream every game to this .jsonl/.csv file")
+    args = parser.parse_args(argv)
+
+    layouts = range(len(LAYOUTS)) if args.layout == "all" else [int(args.layout)]
+    tasks = make_tasks(args.games, args.seed, layouts, args.strategy, args.max_shuffles, args.check_deal,
+                       args.vectorised, CHUNK_GAMES * 10 if args.vectorised else CHUNK_GAMES)
+    total = args.games * len(layouts) * len(args.strategy)
+    summary = Summary()
+    writer = RecordWriter(args.out) if args.out else None
+    started, done = time.monotonic(), 0
+
+    with Pool(args.workers) as pool:
+        for records in pool.imap_unordered(run_chunk, tasks):
+            for record in records: summary.add(record)
+            if writer: writer.write(records)
+            done += len(records)
+            rate = done / max(time.monotonic() - started, 1e-9)
+            sys.stderr.write(f"\r{done}/{total} games, {rate:.0f}/s")
+    sys.stderr.write("\n")
+    if writer: writer.close()
+    summary.report()
+
+
+if __name__ == "__main__":
+    main()
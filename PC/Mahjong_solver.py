@@ -0,0 +1,236 @@
+# Exhaustive solvability check for a dealt board (50-byte format, same rules as the firmware).
+# The board is a bitmask of present tiles; the search is a DFS over removable pairs with
+# memoised dead states, forced "safe" moves and a dead-end test on how the keys can still pair up.
+
+import itertools
+
+from Mahjong_engine import TOTAL_PIECES, tile_group
+from Mahjong_layouts import get_layout
+
+MAX_PAIRING_COMBOS = 3  # Pairing choices tried per state by the dead-end test
+NODE_BUDGET = 2500      # Default states for solve() / is_solvable(): about 60 ms at most, then "unknown"
+
+
+def match_key(tile):
+    # Tiles match iff their keys are equal: bonus groups 5/6 match anything in the group
+    group = tile_group(tile)
+    return 0x100 | group if group in (5, 6) else tile
+
+
+def _bits(mask):
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        yield bit.bit_length() - 1
+
+
+class LayoutMasks:
+    # Bitmask form of the layout tables: what covers each tile, its two side neighbours,
+    # and which tiles it can be blocking (so exposure is only rechecked around a removed pair)
+    def __init__(self, layout):
+        self.size = layout.size
+        self.above = [sum(1 << a for a in layout.above[i]) for i in range(layout.size)]
+        self.sides = [(1 << layout.left[i]) | (1 << layout.right[i]) if layout.left[i] >= 0 and layout.right[i] >= 0 else 0
+                      for i in range(layout.size)]
+        self.blocks = [sum(1 << j for j in layout.blocks[i]) for i in range(layout.size)]
+
+        # Everything stacked over a tile, directly or through other tiles (upper layers come later)
+        cover = list(self.above)
+        for i in range(layout.size - 1, -1, -1):
+            for a in _bits(self.above[i]):
+                cover[i] |= cover[a]
+        self.cover = cover
+        self.below = [sum(1 << j for j in range(layout.size) if cover[j] >> i & 1) for i in range(layout.size)]
+        self.pairing_cache = {}
+
+    def is_exposed(self, state, i):
+        sides = self.sides[i]
+        return not (state & self.above[i]) and not (sides and state & sides == sides)
+
+    def exposed(self, state, candidates=None):
+        # Mask of the free tiles among candidates (default: the whole board)
+        result = 0
+        todo = state if candidates is None else state & candidates
+        while todo:
+            bit = todo & -todo
+            todo ^= bit
+            if self.is_exposed(state, bit.bit_length() - 1):
+                result |= bit
+        return result
+
+    def refresh(self, state, free, removed):
+        # Free set after `removed` left the board: only the tiles they were blocking can change
+        touched = 0
+        for i in _bits(removed):
+            touched |= self.blocks[i]
+        return (free & state) | self.exposed(state, touched & ~free)
+
+    def pairings(self, tiles):
+        # Ways to pair off the remaining tiles of one key, each pair given as (pair mask, tiles
+        # that have to go before it). A pair can't be taken while one of its tiles sits
+        # (transitively) on the other, and the pairs of one key can't wait on each other in a
+        # circle. Depends only on positions, so it is cached.
+        if tiles in self.pairing_cache: return self.pairing_cache[tiles]
+        cover = self.cover
+
+        def match_up(idx):
+            if not idx:
+                yield ()
+                return
+            x = idx[0]
+            for n in range(1, len(idx)):
+                y = idx[n]
+                if cover[y] >> x & 1 or cover[x] >> y & 1: continue
+                for rest in match_up(idx[1:n] + idx[n + 1:]):
+                    yield (((1 << x) | (1 << y), cover[x] | cover[y]),) + rest
+
+        result = tuple(pairs for pairs in match_up(list(_bits(tiles))) if not has_cycle(pairs))
+        self.pairing_cache[tiles] = result
+        return result
+
+
+def has_cycle(pairs):
+    # A pair can go once no other remaining pair has a tile on top of it; peel those off
+    # until nothing moves. Anything left over waits on itself.
+    union = 0
+    for pair, _ in pairs:
+        union |= pair
+    while pairs:
+        waiting = [(pair, under) for pair, under in pairs if union & under]
+        if len(waiting) == len(pairs):
+            return True
+        for pair, under in pairs:
+            if not union & under: union &= ~pair
+        pairs = waiting
+    return False
+
+
+_MASKS = {}
+
+
+def layout_masks(layout_id):
+    if layout_id not in _MASKS:
+        _MASKS[layout_id] = LayoutMasks(get_layout(layout_id))
+    return _MASKS[layout_id]
+
+
+class Solver:
+    # Exposure only grows as tiles are removed, so the free set is carried down the search and
+    # updated around each removed pair instead of being recomputed for the whole board.
+    # The pruning (safe moves, the dead-end test) assumes a position reachable by legal play from
+    # a full deal: for an arbitrary set of tiles the answers are not guaranteed.
+    # With max_nodes set, a search that runs out of states answers None / False with
+    # `exhausted` set, which means "unknown", not "unsolvable"; states are only memoised as dead
+    # by a search that looked at all of their moves.
+    def __init__(self, board, layout_id=0, max_nodes=None):
+        self.masks = layout_masks(layout_id)
+        keys = [match_key(t) if t else None for t in bytes(board[:TOTAL_PIECES])]
+        self.start = sum(1 << i for i, key in enumerate(keys) if key is not None)
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.exhausted = False  # True when max_nodes stopped the search before an answer: nothing is known
+        self.dead = set()
+
+        key_masks = {}
+        for i, key in enumerate(keys):
+            if key is not None:
+                key_masks[key] = key_masks.get(key, 0) | (1 << i)
+        self.key_masks = tuple(key_masks.values())
+
+    def solve(self):
+        # Winning sequence of (i, j) pairs, or None if there is none
+        if any(mask.bit_count() % 2 for mask in self.key_masks):
+            return None
+        moves = []
+        return moves if self._search(self.start, self.masks.exposed(self.start), moves) else None
+
+    def wins_after(self, first, second):
+        # Can the board still be cleared once this pair is taken? Calls share the memo (and max_nodes)
+        pair = (1 << first) | (1 << second)
+        state = self.start & ~pair
+        return self._search(state, self.masks.refresh(state, self.masks.exposed(self.start), pair), [])
+
+    def _is_dead_end(self, state):
+        # Dead if some key can't be paired off at all, or if every way of pairing the keys
+        # makes the pairs wait on each other in a circle
+        pairings = self.masks.pairings
+        forced, choices, combos = (), [], 1
+        for mask in self.key_masks:
+            left = state & mask
+            if not left: continue
+            options = pairings(left)
+            if not options: return True
+            if len(options) == 1:
+                forced += options[0]
+            elif combos * len(options) <= MAX_PAIRING_COMBOS:
+                choices.append(options)
+                combos *= len(options)
+        for chosen in itertools.product(*choices):
+            if not has_cycle(forced + sum(chosen, ())):
+                return False
+        return True
+
+    def _search(self, state, free, moves):
+        if not state:
+            return True
+        if state in self.dead:
+            return False
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            self.exhausted = True
+            return False
+        if self._is_dead_end(state):
+            self.dead.add(state)
+            return False
+
+        # Safe move: every remaining tile of a key is free -> clear them all, no branching needed
+        # (removing tiles never blocks anything, and these tiles only pair among themselves)
+        for mask in self.key_masks:
+            left = state & mask
+            if left and left & free == left:
+                tiles = list(_bits(left))
+                moves.extend(zip(tiles[::2], tiles[1::2]))
+                if self._search(state & ~left, self.masks.refresh(state & ~left, free, left), moves):
+                    return True
+                del moves[len(moves) - len(tiles) // 2:]
+                if not self.exhausted: self.dead.add(state)
+                return False
+
+        # Try first the pairs with the most tiles underneath them
+        below = self.masks.below
+        candidates = []
+        for mask in self.key_masks:
+            tiles = list(_bits(free & mask))
+            for n, i in enumerate(tiles):
+                for j in tiles[n + 1:]:
+                    candidates.append((((below[i] | below[j]) & state).bit_count(), i, j))
+        candidates.sort(reverse=True)
+
+        dead = self.dead
+        for _, i, j in candidates:
+            pair = (1 << i) | (1 << j)
+            if state & ~pair in dead:
+                continue
+            moves.append((i, j))
+            if self._search(state & ~pair, self.masks.refresh(state & ~pair, free, pair), moves):
+                return True
+            moves.pop()
+            if self.exhausted:
+                return False  # Not all moves were tried: the state is not known to be dead
+
+        self.dead.add(state)
+        return False
+
+    def verdict(self):
+        # True / False after solve(), or None ("unknown") when the node budget ran out first
+        solved = self.solve() is not None
+        return None if self.exhausted and not solved else solved
+
+
+def solve(board, layout_id=0, max_nodes=NODE_BUDGET):
+    return Solver(board, layout_id, max_nodes).solve()
+
+
+def is_solvable(board, layout_id=0, max_nodes=NODE_BUDGET):
+    # True, False, or None if max_nodes states were not enough to tell
+    return Solver(board, layout_id, max_nodes).verdict()
@@ -0,0 +1,199 @@
+# Station mode: one PC drives many boards at once (tournament tables). Every board has its own
+# UARTHandler and UARTWorker thread, so a slow or unplugged board only ever delays itself; the
+# results of all of them come back to the Tk loop through one queue. The main window is a compact
+# overview (state, tiles left, clock, link latency and errors per board); any board opens in its
+# own window with the normal game view.
+#
+#   python Mahjong_station.py COM3 COM4 COM5 --names Ann Bob Cid
+#   python Mahjong_station.py --emulators 16 --latency 0.002
+
+import argparse
+import queue
+import tkinter as tk
+
+from Mahjong_client import start_device
+from Mahjong_Game import GameInterface, MahjongApp
+from Mahjong_layouts import LAYOUTS, get_layout
+from Mahjong_recorder import Recorder, board_log_path
+from Mahjong_renderer import tile_look
+from Mahjong_scores import ScoreStore
+from UART_handler import UARTHandler
+from UART_worker import UARTWorker
+
+OVERVIEW_REFRESH_MS = 500
+COLUMNS = 4
+MINI_W, MINI_H, MINI_SHADOW = 12, 16, 2  # Tile size on the overview minimaps
+
+
+class BoardSession:
+    # One board: its UART, its worker thread and a game view in a window of its own.
+    # Stands in for MahjongApp as the GameInterface's controller.
+    def __init__(self, station, uart, name, layout_id=0):
+        self.station = station
+        self.uart = uart
+        self.port = uart.port_name
+        self.name = name
+        self.layout_id = layout_id
+        self.scores = station.scores
+        self.recorder = Recorder(board_log_path(self.port))
+        self.device_key = None
+        self.state = "idle"
+        self.uart_worker = UARTWorker(uart, station.dispatch)
+        self.uart_worker.start()
+
+        self.window = tk.Toplevel(station)
+        self.window.title(f"{self.port} - {name}")
+        self.window.geometry("900x750")
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)  # Closing only hides it
+        self.window.withdraw()
+        self.game_view = GameInterface(self.window, self)
+        self.game_view.pack(fill="both", expand=True)
+
+    # Same clock poll as the single-board app, on this board's worker
+    get_timer_from_stm32 = MahjongApp.get_timer_from_stm32
+
+    def bind(self, sequence, func):
+        self.window.bind(sequence, func)
+
+    def connect(self):
+        self.state = "connecting"
+        deal = self.game_view.deal_command(self.layout_id)
+        self.uart_worker.call(lambda uart: start_device(uart, self.port, self.name, deal), self.on_connected)
+
+    def on_connected(self, result):
+        if result is None:
+            self.state = "failed"
+            return
+        self.device_key, responses = result
+        self.game_view.layout_id = self.layout_id
+        self.game_view.player_name = self.name
+        self.show_game(responses[1:])
+
+    def show_game(self, startup_responses):
+        self.state = "playing"
+        self.game_view.on_reset_responses(startup_responses)
+        self.game_view.fetch_leaderboard(self.game_view.sync_leaderboard)
+
+    def show_menu(self):
+        # The game view's "Exit": the port is already being closed, just hide the board
+        self.state = "closed"
+        self.window.withdraw()
+
+    def open_window(self):
+        self.window.deiconify()
+        self.window.lift()
+
+    def status(self):
+        view = self.game_view
+        if self.state != "playing": return self.state
+        if view.recovering: return "reconnecting"
+        if view.board.is_cleared(): return "won"
+        return "playing" if view.timer_active else "stopped"
+
+    def stop(self):
+        self.uart_worker.stop()
+
+
+class BoardCard(tk.Frame):
+    # Overview cell: minimap of the remaining tiles plus the board's game and link figures
+    def __init__(self, parent, session):
+        super().__init__(parent, bd=1, relief=tk.GROOVE, bg="#f0f0f0", padx=4, pady=4)
+        self.session = session
+        self.drawn = None
+        header = tk.Frame(self, bg="#f0f0f0")
+        header.pack(fill=tk.X)
+        tk.Label(header, text=f"{session.port}  {session.name}", font=("Arial", 10, "bold"), bg="#f0f0f0").pack(side=tk.LEFT)
+        tk.Button(header, text="Open", command=session.open_window).pack(side=tk.RIGHT)
+        tk.Button(header, text="Reconnect", command=session.connect).pack(side=tk.RIGHT, padx=4)
+        self.minimap = tk.Canvas(self, width=140, height=110, bg="#333333", highlightthickness=0)
+        self.minimap.pack(pady=2)
+        self.minimap.bind("<Double-Button-1>", lambda event: session.open_window())
+        self.game_label = tk.Label(self, font=("Arial", 9), bg="#f0f0f0", anchor="w")
+        self.game_label.pack(fill=tk.X)
+        self.link_label = tk.Label(self, font=("Consolas", 8), bg="#f0f0f0", anchor="w", justify="left")
+        self.link_label.pack(fill=tk.X)
+
+    def refresh(self):
+        session = self.session
+        view = session.game_view
+        tiles = bytes(view.board.tiles)
+        left = sum(1 for tile in tiles if tile)
+        clock = view.clock.seconds() if view.timer_active else 0
+        self.game_label.config(text=f"{session.status():<12} tiles {left:>2}   {clock // 60:02d}:{clock % 60:02d}")
+        stats = session.uart_worker.scheduler.stats()
+        self.link_label.config(text=f"p50 {stats['p50_ms']:.1f}  p90 {stats['p90_ms']:.1f}  max {stats['max_ms']:.0f} ms\n"
+                                    f"done {stats['completed']}  failed {stats['failed']}  queued {stats['depth']}")
+        if tiles != self.drawn:
+            self.draw_minimap(tiles)
+
+    def draw_minimap(self, tiles):
+        self.drawn = tiles
+        canvas = self.minimap
+        canvas.delete("all")
+        layout = get_layout(getattr(self.session.game_view, 'layout_id', 0))
+        positions = layout.screen_positions(int(canvas["width"]) / 2, int(canvas["height"]) / 2, MINI_W, MINI_H, MINI_SHADOW)
+        for idx, (x, y) in enumerate(positions):
+            if idx < len(tiles) and tiles[idx]:
+                canvas.create_rectangle(x, y, x + MINI_W, y + MINI_H, fill=tile_look(tiles[idx])[0], outline="#1a1a1a")
+
+
+class Station(tk.Tk):
+    def __init__(self, uarts, names, layout_id=0, scores=None):
+        super().__init__()
+        self.title(f"STM32 Mahjong - station ({len(uarts)} boards)")
+        self.configure(bg="#f0f0f0")
+        self.ui_events = queue.Queue()
+        self.scores = scores if scores is not None else ScoreStore()
+        self.sessions = [BoardSession(self, uart, name, layout_id) for uart, name in zip(uarts, names)]
+        self.cards = []
+        for i, session in enumerate(self.sessions):
+            card = BoardCard(self, session)
+            card.grid(row=i // COLUMNS, column=i % COLUMNS, padx=4, pady=4, sticky="nsew")
+            self.cards.append(card)
+        self.protocol("WM_DELETE_WINDOW", self.shutdown)
+        for session in self.sessions:
+            session.connect()
+        self.process_uart_events()
+        self.refresh_overview()
+
+    def dispatch(self, callback, result):
+        # Called on the boards' worker threads
+        self.ui_events.put((callback, result))
+
+    process_uart_events = MahjongApp.process_uart_events
+
+    def refresh_overview(self):
+        for card in self.cards:
+            card.refresh()
+        self.after(OVERVIEW_REFRESH_MS, self.refresh_overview)
+
+    def shutdown(self):
+        for session in self.sessions:
+            session.stop()  # Each worker closes its own port on the way out
+        self.destroy()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive several Mahjong boards from one PC.")
+    parser.add_argument("ports", nargs="*", help="serial ports of the boards")
+    parser.add_argument("--names", nargs="+", default=[], help="player per board, in port order")
+    parser.add_argument("--layout", type=int, default=0, choices=range(len(LAYOUTS)))
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--emulators", type=int, default=0, help="add this many in-process virtual boards")
+    parser.add_argument("--latency", type=float, default=0.0, help="emulators: seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="emulators: extra random delay, up to this")
+    args = parser.parse_args(argv)
+
+    uarts = [UARTHandler(port, args.baud) for port in args.ports]
+    if args.emulators:
+        from Mahjong_emulator import EmulatedUART, Faults, VirtualDevice
+        uarts += [EmulatedUART(VirtualDevice(seed=n), Faults(args.latency, args.jitter, seed=n), port=f"EMULATOR{n + 1}")
+                  for n in range(args.emulators)]
+    if not uarts:
+        parser.error("give at least one port or --emulators N")
+    names = args.names + [f"Table{n + 1}" for n in range(len(args.names), len(uarts))]
+    Station(uarts, names, args.layout).mainloop()
+
+
+if __name__ == "__main__":
+    main()
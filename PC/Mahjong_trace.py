@@ -0,0 +1,147 @@
+# Lightweight instrumentation for the PC client: counters and timing spans around the hot paths
+# (serial writes/reads, worker requests, canvas redraws, clicks, the clock poll).
+# Off by default; while off every hook is a single attribute check. Spans are kept in a bounded
+# buffer and can be written out as a Chrome trace (chrome://tracing, ui.perfetto.dev).
+#
+#   MAHJONG_TRACE=session.json python Mahjong_Game.py
+
+import atexit
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+MAX_EVENTS = 200000  # Spans kept for export; the oldest are dropped first
+
+
+class _NoSpan:
+    # Shared do-nothing context manager handed out while tracing is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = collections.Counter()
+        self.spans = {}  # name -> [count, total seconds, max seconds]
+        self.events = collections.deque(maxlen=MAX_EVENTS)
+
+    def enable(self, on=True):
+        self.enabled = on
+
+    # --- Hooks ---
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += amount
+
+    def span(self, name, **args):
+        # `with tracer.span("name"):` times the block
+        return _Span(self, name, args) if self.enabled else _NO_SPAN
+
+    def mark(self):
+        # Start of a span that ends somewhere else (e.g. in a callback); None while tracing is off
+        return time.perf_counter() if self.enabled else None
+
+    def finish(self, name, start, **args):
+        if start is not None and self.enabled:
+            self.record(name, start, time.perf_counter() - start, args)
+
+    def record(self, name, start, duration, args=None):
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += duration
+            if duration > stats[2]: stats[2] = duration
+            self.events.append((name, start, duration, threading.get_ident(), args or None))
+
+    # --- Output ---
+
+    def summary(self):
+        with self._lock:
+            spans = {name: {"count": count, "total_ms": round(total * 1000.0, 3),
+                            "mean_ms": round(total / count * 1000.0, 3), "max_ms": round(peak * 1000.0, 3)}
+                     for name, (count, total, peak) in self.spans.items()}
+            return {"counters": dict(self.counters), "spans": spans}
+
+    def overlay_text(self):
+        # One-line digest for the in-game stats label
+        summary = self.summary()
+        parts = [f"{name} {row['mean_ms']:.1f}/{row['max_ms']:.1f}ms x{row['count']}"
+                 for name, row in sorted(summary["spans"].items())]
+        parts += [f"{name} {value}" for name, value in sorted(summary["counters"].items())]
+        return "  |  ".join(parts) or "no samples yet"
+
+    def export_chrome(self, path):
+        # Complete ("X") events in microseconds, one track per thread, counters as final totals
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+        trace = [{"name": name, "ph": "X", "pid": pid, "tid": tid, "ts": (start - self.origin) * 1e6,
+                  "dur": duration * 1e6, **({"args": args} if args else {})}
+                 for name, start, duration, tid, args in events]
+        end = (time.perf_counter() - self.origin) * 1e6
+        trace += [{"name": name, "ph": "C", "pid": pid, "tid": 0, "ts": end, "args": {"value": value}}
+                  for name, value in counters.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+tracer = Tracer()
+
+
+def traced(name):
+    # Decorator: time every call of the function as span `name`
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with _Span(tracer, name, None):
+                return func(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def enable_from_env(variable="MAHJONG_TRACE"):
+    # Turns tracing on when the variable names a file; the trace is written there on exit
+    path = os.environ.get(variable)
+    if path:
+        tracer.enable()
+        atexit.register(tracer.export_chrome, path)
+    return path
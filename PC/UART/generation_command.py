@@ -1,5 +1,13 @@
+import os
+import sys
+
 import serial
-import time
+
+# The protocol codec lives in PC/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from UART_codec import Board, decode_packet
+from UART_framing import FrameEncoder
+from UART_protocol import CMD_START
 
 # --- CONFIGURATION ---
 SERIAL_PORT = 'COM3'  # Change this to your STM32 Port (e.g., /dev/ttyUSB0 on Linux)
@@ -11,11 +19,8 @@ def test_level_generation():
         ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=2)
         print(f"Connected to {SERIAL_PORT} at {BAUD_RATE} baud.")
         
-        # 2. Construct Command
-        # CMD = 0x01 (Start)
-        # DATA = 0x00 (Dummy)
-        # CRC = 0x01 ^ 0x00 = 0x01
-        cmd_packet = bytes([0x01, 0x00, 0x01])
+        # 2. Construct Command: [CMD_START, layout 0, CRC]
+        cmd_packet = bytes(FrameEncoder().request(CMD_START, 0x00))
         
         print(f"Sending: {cmd_packet.hex(' ')}")
         ser.write(cmd_packet)
@@ -29,14 +34,16 @@ def test_level_generation():
             print(f"Raw rx: {response.hex(' ')}")
             return
 
-        # 4. Parse Response
-        rx_cmd = response[0]
-        rx_data = response[1:51]
-        rx_crc = response[51]
+        # 4. Parse Response (checks the echo and the CRC)
+        board = decode_packet(response, CMD_START)
+        if not isinstance(board, Board):
+            print(f"Error: bad echo or CRC. Raw rx: {response.hex(' ')}")
+            return
+        rx_data = board.tiles
         
         print("\n--- RESPONSE RECEIVED ---")
-        print(f"Command Echo: 0x{rx_cmd:02X} (Expected 0x01)")
-        print(f"CRC Byte:     0x{rx_crc:02X}")
+        print(f"Command Echo: 0x{board.cmd:02X} (Expected 0x{CMD_START:02X})")
+        print(f"CRC Byte:     0x{response[-1]:02X}")
         
         print("\n--- GENERATED TILES ---")
         groups = ["Bamboo", "Chars", "Circles", "Winds", "Dragons", "Flowers", "Seasons"]
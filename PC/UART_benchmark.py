@@ -0,0 +1,219 @@
+# Protocol benchmark: round-trip latency per command, back-to-back throughput and the time it takes
+# to get from "Connect" to the first board, through UARTHandler exactly as the game uses it.
+# Runs against a real port or the emulator; results go to JSON and can be compared with a baseline.
+#
+#   python UART_benchmark.py --emulator --out base.json
+#   python UART_benchmark.py --port COM3 --iterations 200 --compare base.json
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from Mahjong_dealer import new_seed, solvable_deal
+from UART_discovery import wait_ready
+from UART_handler import NAME_PAYLOAD_DELAY, UARTHandler
+from UART_protocol import (CMD_START, CMD_RESET, CMD_SHUFFLE, CMD_SELECT, CMD_MATCH, CMD_HINT, CMD_SET_NAME,
+                           CMD_GET_TIME, CMD_GET_LEADERS, CMD_LOAD_BOARD, RESPONSE_LENGTHS)
+
+SHUFFLES_PER_GAME = 5  # CMD_SHUFFLE is re-armed with a RESET before the device starts refusing
+
+# name -> (cmd, data, timeout). SELECT + MATCH of the same tile is always refused, so the board never changes.
+COMMANDS = {
+    "start": (CMD_START, 0x00, 10.0),
+    "reset": (CMD_RESET, 0x00, 1.0),
+    "shuffle": (CMD_SHUFFLE, 0x00, 4.0),
+    "select": (CMD_SELECT, 0, 1.0),
+    "match": (CMD_MATCH, 0, 1.0),
+    "hint": (CMD_HINT, 0x00, 1.0),
+    "set_name": (CMD_SET_NAME, "bench", 1.0),
+    "load_board": (CMD_LOAD_BOARD, None, 2.0),
+    "get_time": (CMD_GET_TIME, 0x00, 0.5),
+    "get_leaders": (CMD_GET_LEADERS, 0x00, 2.0),
+}
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered: return None
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarise(samples, failures):
+    ordered = sorted(samples)
+    ms = lambda value: None if value is None else round(value * 1000.0, 3)
+    return {
+        "count": len(samples),
+        "failures": failures,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": ms(percentile(ordered, 0.50)),
+        "p90_ms": ms(percentile(ordered, 0.90)),
+        "p99_ms": ms(percentile(ordered, 0.99)),
+        "max_ms": ms(ordered[-1]) if ordered else None,
+    }
+
+
+def send(uart, cmd, data, timeout):
+    # One request/response the way pipeline() sends it (name and board payloads included)
+    return uart.pipeline([(cmd, data, timeout)])[0]
+
+
+def bench_commands(uart, names, iterations):
+    results = {}
+    send(uart, CMD_START, 0x00, 10.0)
+    for name in names:
+        cmd, data, timeout = COMMANDS[name]
+        samples, failures = [], 0
+        for n in range(iterations):
+            # Untimed preparation so every timed request gets its normal (full) answer
+            if cmd == CMD_SHUFFLE and n % SHUFFLES_PER_GAME == 0: send(uart, CMD_RESET, 0x00, 1.0)
+            if cmd == CMD_MATCH: send(uart, CMD_SELECT, data, 1.0)
+            if cmd == CMD_LOAD_BOARD: data = (0, solvable_deal(n)[0])
+
+            started = time.perf_counter()
+            response = send(uart, cmd, data, timeout)
+            elapsed = time.perf_counter() - started
+            if response is None: failures += 1
+            else: samples.append(elapsed)
+        results[name] = summarise(samples, failures)
+        results[name]["response_bytes"] = max(RESPONSE_LENGTHS[cmd])
+    return results
+
+
+def bench_throughput(uart, name, duration):
+    # Back-to-back exchanges for `duration` seconds
+    cmd, data, timeout = COMMANDS[name]
+    done = failures = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        if uart.exchange(cmd, data, timeout) is None: failures += 1
+        else: done += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "command": name,
+        "seconds": round(elapsed, 3),
+        "exchanges": done,
+        "failures": failures,
+        "exchanges_per_s": round(done / elapsed, 1),
+        "bytes_per_s": round(done * (3 + max(RESPONSE_LENGTHS[cmd])) / elapsed, 1),
+    }
+
+
+def bench_first_board(uart, layout_id=0):
+    # start_device() step by step, each step timed on its own
+    phases = {}
+
+    def phase(label, action):
+        started = time.perf_counter()
+        result = action()
+        phases[label + "_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+        return result
+
+    uart.close_port()
+    total = time.perf_counter()
+    if not phase("open", uart.open_port): return {"failed": "open"}
+    phase("dtr_reset", uart.dtr_reset)
+    phase("reset_buffer", uart.reset_buffer)
+    ready = phase("ready", lambda: wait_ready(uart))
+    tiles = phase("deal", lambda: solvable_deal(new_seed(), layout_id)[0])
+    name_ack = phase("set_name", lambda: send(uart, CMD_SET_NAME, "bench", 1.0))
+    reset_ack = phase("reset", lambda: send(uart, CMD_RESET, 0x00, 1.0))
+    board = phase("load_board", lambda: send(uart, CMD_LOAD_BOARD, (layout_id, tiles), 2.0))
+    phases["total_ms"] = round((time.perf_counter() - total) * 1000.0, 3)
+    phases["ok"] = None not in (ready, name_ack, reset_ack, board)
+    phases["fixed_waits_ms"] = round(NAME_PAYLOAD_DELAY * 1000.0, 3)
+    return phases
+
+
+def print_results(results, out=sys.stdout):
+    first = results["first_board"]
+    out.write(f"time to first board: {first.get('total_ms')} ms ({first.get('fixed_waits_ms')} ms of fixed waits)\n")
+    out.write(f"{'command':<14}{'bytes':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'failed':>8}\n")
+    for name, row in results["commands"].items():
+        out.write(f"{name:<14}{row['response_bytes']:>6}" + "".join(
+            f"{row[key]:>10.3f}" if row[key] is not None else f"{'-':>10}" for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"))
+            + f"{row['failures']:>8}\n")
+    rate = results["throughput"]
+    out.write(f"throughput ({rate['command']}): {rate['exchanges_per_s']} exchanges/s, {rate['bytes_per_s']} B/s\n")
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict): flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool): flat[prefix + key] = value
+    return flat
+
+
+def compare(current, baseline, threshold, out=sys.stdout):
+    # Prints every timing that moved; returns the metrics that got worse by more than `threshold`
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    regressions = []
+    out.write(f"{'metric':<40}{'baseline':>12}{'current':>12}{'change':>10}\n")
+    for key in sorted(now.keys() & before.keys()):
+        old, new = before[key], now[key]
+        if not (key.endswith("_ms") or key.endswith("_per_s")) or not old: continue
+        change = (new - old) / old
+        worse = change < -threshold if key.endswith("_per_s") else change > threshold
+        if worse: regressions.append(key)
+        out.write(f"{key:<40}{old:>12.3f}{new:>12.3f}{change:>+9.1%}{' !' if worse else ''}\n")
+    return regressions
+
+
+def make_uart(args):
+    if args.port:
+        return UARTHandler(args.port, args.baud)
+    from Mahjong_emulator import EmulatedUART, Faults, VirtualDevice
+    faults = Faults(args.latency, args.jitter, args.drop, args.corrupt, seed=0)
+    return EmulatedUART(VirtualDevice(seed=0), faults, baudrate=args.baud)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Mahjong UART protocol.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--port", help="serial port of a real board")
+    target.add_argument("--emulator", action="store_true", help="use the in-process emulator (default)")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--latency", type=float, default=0.0, help="emulator: seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="emulator: extra random delay, up to this")
+    parser.add_argument("--drop", type=float, default=0.0, help="emulator: per-byte loss probability")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="emulator: per-byte bit flip probability")
+    parser.add_argument("--commands", nargs="+", default=list(COMMANDS), choices=list(COMMANDS))
+    parser.add_argument("--iterations", type=int, default=100, help="timed round trips per command")
+    parser.add_argument("--throughput", default="get_time", choices=list(COMMANDS),
+                        help="command sent back-to-back for the throughput run")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds of the throughput run")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    uart = make_uart(args)
+    results = {"first_board": bench_first_board(uart)}
+    if not uart.is_connected():
+        sys.exit(f"Could not open {args.port}")
+    results["commands"] = bench_commands(uart, args.commands, args.iterations)
+    results["throughput"] = bench_throughput(uart, args.throughput, args.duration)
+    uart.close_port()
+
+    report = {
+        "target": args.port or "emulator",
+        "settings": {key: value for key, value in vars(args).items() if key not in ("out", "compare")},
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    print_results(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
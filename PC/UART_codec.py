@@ -0,0 +1,118 @@
+# Typed view of the wire protocol: one small class per response shape, decoded once from the
+# frame with the precompiled layouts in UART_framing (which also encodes the requests). Shared by
+# the game, the tools and the debug scripts, so the byte format is parsed in exactly one place.
+
+from dataclasses import dataclass
+
+from UART_framing import BOARD, LEADERS, RESPONSE_STRUCTS, TIME, HINT, xor_crc
+from UART_protocol import CMD_MATCH, NO_HINT, SHORT_ERROR
+
+EMPTY_SCORE = 999999  # Time of an unused leaderboard slot
+
+
+@dataclass(slots=True, frozen=True)
+class Ack:
+    # RESET, SELECT, MATCH, GIVE_UP, SET_NAME, and the short SHUFFLE / LOAD_BOARD / RESTORE_BOARD refusal
+    cmd: int
+    status: int
+
+    @property
+    def ok(self):
+        return self.status == 0x00
+
+    @property
+    def matched(self):
+        return self.cmd == CMD_MATCH and self.status == 0x01
+
+    @property
+    def refused(self):
+        return self.status == SHORT_ERROR
+
+
+@dataclass(slots=True, frozen=True)
+class Board:
+    # START, SHUFFLE, LOAD_BOARD, RESTORE_BOARD: the 50 packed tiles
+    cmd: int
+    tiles: bytes
+
+
+@dataclass(slots=True, frozen=True)
+class Hint:
+    first: int
+    second: int
+
+    @property
+    def found(self):
+        return self.first != NO_HINT
+
+    @property
+    def pair(self):
+        return (self.first, self.second) if self.found else None
+
+
+@dataclass(slots=True, frozen=True)
+class Time:
+    seconds: int
+
+
+@dataclass(slots=True, frozen=True)
+class LeaderEntry:
+    name: str
+    seconds: int
+
+    @property
+    def empty(self):
+        return self.seconds >= EMPTY_SCORE
+
+
+@dataclass(slots=True, frozen=True)
+class Leaderboard:
+    entries: tuple
+
+
+def _name(raw):
+    # C string in a fixed 16-byte field: everything after the first NUL is leftover
+    return raw.split(b"\0", 1)[0].decode("utf-8", errors="ignore")
+
+
+def _decode_board(fields):
+    return Board(fields[0], fields[1])
+
+
+def _decode_leaders(fields):
+    return Leaderboard(tuple(LeaderEntry(_name(fields[i]), fields[i + 1]) for i in range(1, len(fields), 2)))
+
+
+# layout -> how its fields become a response object
+_BUILDERS = {
+    BOARD: _decode_board,
+    HINT: lambda fields: Hint(fields[1], fields[2]),
+    TIME: lambda fields: Time(fields[1]),
+    LEADERS: _decode_leaders,
+}
+
+
+def decode(frame, cmd=None):
+    # Response object for a frame as UARTHandler returns it (no CRC byte), or None if the frame is
+    # missing, belongs to another command or doesn't have one of the command's lengths
+    if not frame or (cmd is not None and frame[0] != cmd):
+        return None
+    layout = RESPONSE_STRUCTS.get(frame[0], {}).get(len(frame))
+    if layout is None:
+        return None
+    fields = layout.unpack(frame)
+    build = _BUILDERS.get(layout)
+    return build(fields) if build else Ack(*fields)
+
+
+def decode_packet(packet, cmd=None):
+    # Same for a raw frame read straight off the port (CRC byte included); None on a CRC mismatch
+    if not packet or xor_crc(packet) != 0:
+        return None
+    return decode(bytes(packet[:-1]), cmd)
+
+
+def decode_as(frame, cmd, kind):
+    # decode() that also insists on the response type (e.g. a Board, not the short refusal)
+    response = decode(frame, cmd)
+    return response if isinstance(response, kind) else None
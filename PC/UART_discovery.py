@@ -0,0 +1,155 @@
+# Port discovery off the UI thread: enumerates serial ports in the background, notices ports
+# appearing and disappearing, and probes every new ST-LINK port (several at once) to find out
+# whether an STM32 board answers on it. The probe is CMD_SET_NAME with an empty name: the firmware
+# answers it immediately and changes nothing, but another device on the port would get the bytes,
+# so ports of other vendors are only listed unless probe_all is set. The same probe tells
+# start_device() when a board that was just reset is ready, instead of sleeping for a fixed time.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import serial.tools.list_ports
+
+from UART_codec import Ack, decode_as
+from UART_protocol import CMD_SET_NAME
+
+SCAN_INTERVAL = 1.0    # Hotplug check period
+PROBE_WORKERS = 8      # Ports probed at the same time
+PROBE_TIMEOUT = 0.1    # Wait for one probe answer
+PROBE_WINDOW = 0.5     # How long a newly found port is probed before it counts as "not a board"
+BOOT_GRACE = 0.02      # After a DTR reset: nothing is sent until the firmware had time to arm its receiver
+READY_TIMEOUT = 3.0    # After a DTR reset: give up waiting for the first answer
+STM32_VID = 0x0483     # ST-LINK virtual COM ports: the only ones probed by default
+STLINK_PIDS = {0x374B, 0x374E, 0x374F, 0x3752, 0x3753, 0x3754, 0x3757}  # ST-LINK/V2-1 and V3 with a VCP
+
+
+def is_stlink(vid, pid):
+    return vid == STM32_VID and pid in STLINK_PIDS
+
+
+def probe(uart, timeout=PROBE_TIMEOUT):
+    # True if an open port answers like the Mahjong firmware
+    return decode_as(uart.exchange(CMD_SET_NAME, 0x00, timeout), CMD_SET_NAME, Ack) is not None
+
+
+def wait_ready(uart, timeout=READY_TIMEOUT):
+    # Probes a board that was just reset until it answers; seconds it took, or None
+    started = time.monotonic()
+    time.sleep(BOOT_GRACE)
+    while time.monotonic() - started < timeout:
+        if probe(uart):
+            return time.monotonic() - started
+        if not uart.is_connected():
+            return None
+    return None
+
+
+@dataclass(slots=True)
+class PortInfo:
+    device: str
+    description: str = ""
+    vid: int | None = None
+    pid: int | None = None
+    is_board: bool | None = None  # None until the probe finished, or for good if it is not probed
+    probed: bool = True  # False: not an ST-LINK port and probe_all is off, so nothing is written to it
+
+
+class PortDiscovery(threading.Thread):
+    # `uart` is the app's handler: its list_available_ports() decides what exists and
+    # uart.sibling(port) makes the short-lived handles used for probing. `on_change(ports)` is
+    # called from the discovery threads with a fresh snapshot whenever anything changed.
+    # `probe_all` also probes ports that are not ST-LINK (USB-serial adapters, virtual ports).
+    def __init__(self, uart, on_change=None, interval=SCAN_INTERVAL, probe_all=False):
+        super().__init__(name="port-discovery", daemon=True)
+        self.uart = uart
+        self.on_change = on_change
+        self.interval = interval
+        self.probe_all = probe_all
+        self.ports = {}
+        self.in_use = set()  # Ports the app has open; never probed
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(PROBE_WORKERS, thread_name_prefix="port-probe")
+
+    def snapshot(self):
+        # Boards first, then ports still being probed, then the rest
+        with self._lock:
+            ports = list(self.ports.values())
+        rank = {True: 0, None: 1, False: 2}
+        return sorted(ports, key=lambda info: (rank[info.is_board], info.device))
+
+    def boards(self):
+        return [info.device for info in self.snapshot() if info.is_board]
+
+    def claim(self, port):
+        with self._lock:
+            self.in_use.add(port)
+
+    def release(self, port):
+        with self._lock:
+            self.in_use.discard(port)
+
+    def rescan(self):
+        # Ask for a scan now (the ↻ button) instead of at the next interval
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        while not self._stopped:
+            self.scan()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def scan(self):
+        try:
+            present = self.uart.list_available_ports()
+        except Exception:
+            return
+        details = {}
+        try:
+            details = {p.device: p for p in serial.tools.list_ports.comports()}
+        except Exception:
+            pass
+
+        with self._lock:
+            gone = [device for device in self.ports if device not in present]
+            for device in gone:
+                del self.ports[device]
+            new = [PortInfo(device, getattr(details.get(device), "description", "") or "",
+                            getattr(details.get(device), "vid", None), getattr(details.get(device), "pid", None))
+                   for device in present if device not in self.ports]
+            for info in new:
+                info.probed = self.probe_all or is_stlink(info.vid, info.pid)
+                self.ports[info.device] = info
+        for info in sorted(new, key=lambda info: not is_stlink(info.vid, info.pid)):
+            if info.probed: self._pool.submit(self._probe_port, info)
+        if gone or new: self._notify()
+
+    def _probe_port(self, info):
+        with self._lock:
+            busy = info.device in self.in_use
+        if busy:
+            info.is_board = True  # The app is talking to it
+        else:
+            handle = self.uart.sibling(info.device)
+            found = False
+            if handle.open_port():
+                try:
+                    deadline = time.monotonic() + PROBE_WINDOW
+                    while not found and time.monotonic() < deadline and handle.is_connected():
+                        found = probe(handle)
+                finally:
+                    handle.close_port()
+            info.is_board = found
+        self._notify()
+
+    def _notify(self):
+        if self.on_change is not None and not self._stopped:
+            self.on_change(self.snapshot())
@@ -0,0 +1,170 @@
+# Frame encoding/decoding for the wire protocol in UART_protocol: the XOR checksum computed in
+# bulk, a precompiled struct.Struct for every request and response layout, requests packed into
+# buffers allocated once, and the incremental decoder that cuts response frames out of the stream.
+
+import struct
+
+from UART_protocol import (CMD_START, CMD_RESET, CMD_SHUFFLE, CMD_SELECT, CMD_MATCH, CMD_GIVE_UP, CMD_HINT,
+                           CMD_SET_NAME, CMD_GET_TIME, CMD_GET_LEADERS, CMD_LOAD_BOARD, CMD_RESTORE_BOARD, PACKET_SIZE,
+                           RESPONSE_LENGTHS, SHORT_ERROR)
+
+BOARD_BYTES = PACKET_SIZE - 2  # 50 packed tiles
+MAX_SCORES = 10                # Leaderboard entries in a CMD_GET_LEADERS answer
+FOLD_MIN_BYTES = 64            # From this size on the integer fold beats the byte loop
+
+
+def xor_crc(data):
+    # XOR of all bytes. Long frames are read as one integer and folded in halves (the XOR of
+    # the two halves keeps the XOR of all bytes) until a single byte is left.
+    size = len(data)
+    if size < FOLD_MIN_BYTES:
+        crc = 0
+        for byte in data:
+            crc ^= byte
+        return crc
+    value = int.from_bytes(data, "little")
+    while size > 1:
+        half = (size + 1) >> 1
+        bits = half << 3
+        value = (value >> bits) ^ (value & ((1 << bits) - 1))
+        size = half
+    return value
+
+
+# --- Layouts (responses without their CRC byte, as FrameDecoder returns them) ---
+
+REQUEST = struct.Struct("BBB")                           # [CMD, DATA, CRC]
+RESTORE = struct.Struct(f">{BOARD_BYTES}sIB")            # CMD_RESTORE_BOARD payload: [50 tiles, seconds, shuffles used]
+ACK = struct.Struct("BB")                                # [CMD, status]
+HINT = struct.Struct("BBB")                              # [CMD, index1 | 100, index2]
+BOARD = struct.Struct(f"B{BOARD_BYTES}s")                # [CMD, 50 tiles]
+TIME = struct.Struct(f">BI{BOARD_BYTES - 4}x")           # [CMD, seconds (big-endian), padding]
+LEADERS = struct.Struct("<B" + "16sI" * MAX_SCORES)      # [CMD, 10 x (name, seconds little-endian)]
+
+# cmd -> {frame length without CRC: layout}
+RESPONSE_STRUCTS = {
+    CMD_START: {BOARD.size: BOARD},
+    CMD_RESET: {ACK.size: ACK},
+    CMD_SHUFFLE: {BOARD.size: BOARD, ACK.size: ACK},
+    CMD_SELECT: {ACK.size: ACK},
+    CMD_MATCH: {ACK.size: ACK},
+    CMD_GIVE_UP: {ACK.size: ACK},
+    CMD_HINT: {HINT.size: HINT},
+    CMD_SET_NAME: {ACK.size: ACK},
+    CMD_GET_TIME: {TIME.size: TIME},
+    CMD_GET_LEADERS: {LEADERS.size: LEADERS},
+    CMD_LOAD_BOARD: {BOARD.size: BOARD, ACK.size: ACK},
+    CMD_RESTORE_BOARD: {BOARD.size: BOARD, ACK.size: ACK},
+}
+
+
+def unpack_response(frame):
+    # Tuple of the frame's fields, or None if the frame doesn't fit a layout of its command
+    layout = RESPONSE_STRUCTS.get(frame[0], {}).get(len(frame)) if frame else None
+    return layout.unpack(frame) if layout else None
+
+
+class FrameEncoder:
+    # Outgoing frames are packed into buffers allocated once. A returned buffer is only valid
+    # until the next call (serial writes copy it right away).
+    def __init__(self):
+        self._request = bytearray(REQUEST.size)
+        self._payload = bytearray(RESTORE.size + 1)
+        self._payload_view = memoryview(self._payload)
+
+    def request(self, cmd, data):
+        REQUEST.pack_into(self._request, 0, cmd, data, cmd ^ data)
+        return self._request
+
+    def payload(self, data):
+        # Name or board bytes followed by their own CRC (what goes after a SET_NAME / LOAD_BOARD / RESTORE_BOARD header)
+        size = len(data)
+        self._payload[:size] = data
+        self._payload[size] = xor_crc(data)
+        return self._payload_view[:size + 1]
+
+
+class FrameDecoder:
+    # Incremental response parser. Bytes are read straight into a preallocated bytearray,
+    # frames are cut out of it as soon as they are complete. A byte that can't start a valid
+    # frame (unknown CMD, bad CRC) is skipped, so after line noise the very next frame parses again.
+    def __init__(self, capacity=1024):
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self.dropped = 0  # Bytes thrown away while resynchronising
+
+    def pending(self):
+        return self._end - self._start
+
+    def clear(self):
+        self.dropped += self._end - self._start
+        self._start = self._end = 0
+
+    def _reserve(self, count):
+        # Make room for `count` more bytes at the end of the buffer
+        if self._end + count <= len(self._buf):
+            return
+        size = self._end - self._start
+        if size + count > len(self._buf):
+            grown = bytearray(max(len(self._buf) * 2, size + count))
+            grown[:size] = self._view[self._start:self._end]
+            self._view.release()
+            self._buf = grown
+            self._view = memoryview(self._buf)
+        else:
+            self._buf[:size] = bytes(self._view[self._start:self._end])
+        self._start, self._end = 0, size
+
+    def feed(self, data):
+        self._reserve(len(data))
+        self._buf[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def read_from(self, ser):
+        # Pull whatever the port has (at least one byte, bounded by the port timeout)
+        count = max(1, ser.in_waiting)
+        self._reserve(count)
+        received = ser.readinto(self._view[self._end:self._end + count])
+        self._end += received or 0
+        return received or 0
+
+    def _valid(self, start, length):
+        # XOR over the data and its CRC byte is 0 for an intact frame
+        return xor_crc(self._view[start:start + length]) == 0
+
+    def _match(self, cmd):
+        # Length of a valid frame at the head, 0 if the head can't be a frame, None if more bytes are needed
+        available = self._end - self._start
+        lengths = RESPONSE_LENGTHS[cmd]
+        incomplete = False
+        for length in sorted(lengths):
+            if available < length:
+                incomplete = True
+                continue
+            if length < max(lengths) and self._buf[self._start + 1] != SHORT_ERROR:
+                continue
+            if self._valid(self._start, length):
+                return length
+        return None if incomplete else 0
+
+    def next_frame(self, expected=None):
+        # Returns the next complete frame without its CRC byte, or None if it hasn't fully arrived.
+        # With `expected` set, only frames of that command are accepted; anything else is skipped.
+        while self._end > self._start:
+            cmd = self._buf[self._start]
+            if cmd in RESPONSE_LENGTHS and (expected is None or cmd == expected):
+                length = self._match(cmd)
+                if length is None:
+                    return None
+                if length:
+                    frame = bytes(self._view[self._start:self._start + length - 1])
+                    self._start += length
+                    if self._start == self._end:
+                        self._start = self._end = 0
+                    return frame
+            self._start += 1
+            self.dropped += 1
+        self._start = self._end = 0
+        return None
@@ -1,7 +1,53 @@
 import serial
 import serial.tools.list_ports
-import struct
 import time
+from UART_framing import RESTORE, FrameDecoder, FrameEncoder
+from UART_protocol import (CMD_SELECT, CMD_HINT, CMD_SET_NAME, CMD_GET_TIME, CMD_GET_LEADERS,
+                           CMD_RESTORE_BOARD)
+from Mahjong_trace import tracer, traced
+
+# A frame that stops arriving halfway is broken: give up after this much silence instead of the full timeout
+FRAME_GAP_SEC = 0.05
+# The STM32 only starts its blocking receive of the name after it has handled the header frame,
+# which takes microseconds; a few ms keeps the payload out of the header's USB transfer.
+NAME_PAYLOAD_DELAY = 0.005
+
+# Adaptive timeouts: the wait for an answer is derived from the round trips seen so far for that
+# command (smoothed RTT + 4 x deviation, as in TCP), never below RTT_MIN_TIMEOUT and never above
+# the timeout the caller passed, which is used as is until RTT_MIN_SAMPLES answers have been timed.
+RTT_ALPHA = 0.125
+RTT_BETA = 0.25
+RTT_MIN_SAMPLES = 3
+RTT_MIN_TIMEOUT = 0.15  # Covers the flash write the device does on a winning CMD_MATCH
+# Commands that may simply be sent again when the answer doesn't come (same request, same effect).
+# Not CMD_LOAD_BOARD / CMD_RESTORE_BOARD: every copy restarts the device timer and its shuffle count.
+IDEMPOTENT_COMMANDS = {CMD_SELECT, CMD_HINT, CMD_SET_NAME, CMD_GET_TIME, CMD_GET_LEADERS}
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 0.01  # First pause before a resend, doubled for every further attempt
+RETRY_BACKOFF_MAX = 0.2
+# After an unplug, reconnect() waits this long for the port to show up again
+REPLUG_WAIT_SEC = 5.0
+PORT_POLL_SEC = 0.2
+
+
+class RttTracker:
+    def __init__(self):
+        self.srtt = {}
+        self.rttvar = {}
+        self.samples = {}
+
+    def sample(self, cmd, rtt):
+        if cmd not in self.srtt:
+            self.srtt[cmd], self.rttvar[cmd] = rtt, rtt / 2
+        else:
+            self.rttvar[cmd] += RTT_BETA * (abs(rtt - self.srtt[cmd]) - self.rttvar[cmd])
+            self.srtt[cmd] += RTT_ALPHA * (rtt - self.srtt[cmd])
+        self.samples[cmd] = self.samples.get(cmd, 0) + 1
+
+    def timeout(self, cmd, ceiling):
+        if self.samples.get(cmd, 0) < RTT_MIN_SAMPLES:
+            return ceiling
+        return min(ceiling, max(RTT_MIN_TIMEOUT, self.srtt[cmd] + 4 * self.rttvar[cmd]))
 
 class UARTHandler:
     def __init__(self, port="COM3", baudrate=115200):
@@ -9,21 +55,58 @@ class UARTHandler:
         self.baudrate = baudrate
         self.ser = None
         self.is_open = False
+        self.decoder = FrameDecoder()
+        self.encoder = FrameEncoder()
+        self.rtt = RttTracker()
+        self.unplugged = False  # Set when a failed request finds the port gone from the system
+        # cmd -> expiry times of answers that earlier sends may still bring (a timed-out request,
+        # the extra copies of a resent one). The device answers in order, so these come before the
+        # answer to anything sent later: a frame of `cmd` that arrives while one is owed is stale.
+        self.late = {}
+        self.last_rtt = None  # Send -> answer time of the last request (its last copy), None if unanswered
 
     @staticmethod
     def list_available_ports():
         return [p.device for p in serial.tools.list_ports.comports()]
 
+    def port_present(self):
+        # Enumeration is the quickest way to tell an unplugged cable from a slow device
+        try:
+            return self.port_name in self.list_available_ports()
+        except Exception:
+            return True
+
+    def device_key(self):
+        # Stable name for the board behind the port: the USB serial number when there is one
+        try:
+            for info in serial.tools.list_ports.comports():
+                if info.device == self.port_name and info.serial_number:
+                    return info.serial_number
+        except Exception:
+            pass
+        return self.port_name
+
+    def sibling(self, port):
+        # Separate handler for another port with the same settings (port probing)
+        return UARTHandler(port, self.baudrate)
+
     def open_port(self):
         try:
             # Basic timeout of 0.1s for read operations, to prevent blocking indefinitely
-            self.ser = serial.Serial(self.port_name, self.baudrate, timeout=0.1)
-            self.is_open = True
-            return True
+            return self.attach(serial.Serial(self.port_name, self.baudrate, timeout=0.1))
         except Exception:
             self.is_open = False
             return False
 
+    def attach(self, ser):
+        # Use an already open serial.Serial (or anything with the same interface, e.g. the emulator's port)
+        self.ser = ser
+        self.is_open = True
+        self.unplugged = False
+        self.decoder.clear()
+        self.late.clear()
+        return True
+
     def close_port(self):
         if self.ser and self.ser.is_open:
             try: self.ser.close()
@@ -33,84 +116,186 @@ class UARTHandler:
     def is_connected(self):
         return self.ser is not None and self.ser.is_open
 
-    def reconnect(self):
+    def reconnect(self, wait_sec=REPLUG_WAIT_SEC):
+        # Reopens the port; if it has disappeared (cable pulled), waits a bounded time for it to come back
         self.close_port()
+        deadline = time.monotonic() + wait_sec
+        while not self.port_present():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(PORT_POLL_SEC)
         return self.open_port()
 
-    def _calculate_crc(self, data: bytes):
-        crc = 0
-        for byte in data:
-            crc ^= byte
-        return crc
-
+    @traced("uart.send_packet")
     def send_packet(self, cmd, data_byte):
         if not self.is_connected(): return False
         try:
-            payload = struct.pack("BB", cmd, data_byte)
-            crc = self._calculate_crc(payload)
-            self.ser.write(payload + struct.pack("B", crc))
+            self.ser.write(self.encoder.request(cmd, data_byte))
             self.ser.flush()
             return True
         except:
             self.is_open = False
             return False
 
-    def send_name_packet(self, cmd, name_str):
+    @traced("uart.send_payload")
+    def _send_with_payload(self, cmd, data_byte, payload):
+        # Header frame [cmd, data_byte, CRC], then the payload with its own CRC
         if not self.is_connected(): return False
         try:
-            # Converting the name string to bytes, ensuring it's ASCII and max 10 bytes long
-            name_bytes = name_str.encode('ascii', errors='ignore')[:10]
-            name_len = len(name_bytes)
-
-            # Sending the header (cmd + name length) with its own CRC
-            header = struct.pack("BB", cmd, name_len)
-            header_crc = self._calculate_crc(header)
-            self.ser.write(header + struct.pack("B", header_crc))
+            self.ser.write(self.encoder.request(cmd, data_byte))
             self.ser.flush()
 
-            # Critical pause: Give STM32 50 ms, to prepare for string receive
-            time.sleep(0.05) 
+            # Critical pause: Give STM32 time to prepare for the payload receive
+            time.sleep(NAME_PAYLOAD_DELAY)
 
-            # Sending the name bytes with its own CRC
-            payload_crc = self._calculate_crc(name_bytes)
-            self.ser.write(name_bytes + struct.pack("B", payload_crc))
+            self.ser.write(self.encoder.payload(payload))
             self.ser.flush()
-            
+
             return True
         except:
             self.is_open = False
             return False
 
-    def read_packet_strictly(self, count, timeout_sec=2.0):
+    def send_name_packet(self, cmd, name_str):
+        # Converting the name string to bytes, ensuring it's ASCII and max 10 bytes long;
+        # the header carries the name length
+        name_bytes = name_str.encode('ascii', errors='ignore')[:10]
+        return self._send_with_payload(cmd, len(name_bytes), name_bytes)
+
+    def send_board_packet(self, cmd, layout_id, tiles):
+        # CMD_LOAD_BOARD: the header carries the layout id, the payload is the 50 packed tiles
+        return self._send_with_payload(cmd, layout_id, tiles)
 
+    def send_restore_packet(self, cmd, layout_id, tiles, seconds, shuffles_used):
+        # CMD_RESTORE_BOARD: like CMD_LOAD_BOARD, plus the game time and shuffles the device should continue from
+        return self._send_with_payload(cmd, layout_id, RESTORE.pack(bytes(tiles), seconds, shuffles_used))
+
+    @traced("uart.read_frame")
+    def read_frame(self, cmd, timeout_sec=2.0):
+        # Waits for the response to `cmd` (length comes from the protocol table).
+        # Returns the frame without its CRC byte, or None on timeout / broken frame.
         if not self.is_connected(): return None
-        
-        start_time = time.time()
-        buffer = b""
+
+        deadline = time.monotonic() + timeout_sec
+        last_rx = time.monotonic()
         
         try:
-            while len(buffer) < count:
-                # Checking, if waiting time isn't over
-                if (time.time() - start_time) > timeout_sec:
-                    return None 
-                
-                # Reading the buffer (or wait 0.1s timeout in open_port)
-                remaining = count - len(buffer)
-                chunk = self.ser.read(remaining)
-                if chunk:
-                    buffer += chunk
-            
-            # Check CRC
-            if len(buffer) == count:
-                if self._calculate_crc(buffer[:-1]) == buffer[-1]:
-                    return buffer[:-1] # Returning data without CRC byte
-            return None
+            while True:
+                frame = self.decoder.next_frame(cmd)
+                if frame is not None:
+                    if self._is_late(cmd):
+                        continue
+                    self.late.clear()  # Whatever was owed before this answer came, or was lost
+                    return frame
+
+                now = time.monotonic()
+                if now > deadline:
+                    tracer.count("uart.timeouts")
+                    return None
+                # Part of a frame is sitting in the buffer but the line went quiet: it will never complete
+                if self.decoder.pending() and now - last_rx > FRAME_GAP_SEC:
+                    self.decoder.clear()
+                    tracer.count("uart.broken_frames")
+                    return None
+
+                # Reading what has arrived (or wait 0.1s timeout in open_port)
+                if self.decoder.read_from(self.ser):
+                    last_rx = time.monotonic()
             
         except (serial.SerialException, AttributeError):
             self.is_open = False
             return None
 
+    def _send(self, cmd, data):
+        # data: a byte, the name string for CMD_SET_NAME, (layout_id, tiles) for CMD_LOAD_BOARD or
+        # (layout_id, tiles, seconds, shuffles_used) for CMD_RESTORE_BOARD
+        if isinstance(data, str):
+            return self.send_name_packet(cmd, data)
+        if cmd == CMD_RESTORE_BOARD:
+            return self.send_restore_packet(cmd, *data)
+        if isinstance(data, tuple):
+            return self.send_board_packet(cmd, *data)
+        return self.send_packet(cmd, data)
+
+    def request(self, cmd, data, timeout_sec=2.0):
+        # One command with an adaptive wait. Idempotent commands are sent again (with backoff)
+        # when the answer is late; for the others the wait just goes on up to timeout_sec, since a
+        # second copy could be applied twice. A port that vanished from the system fails at once.
+        self.last_rtt = None
+        ceiling = timeout_sec
+        wait = self.rtt.timeout(cmd, ceiling)
+        attempts = MAX_ATTEMPTS if cmd in IDEMPOTENT_COMMANDS else 1
+        for attempt in range(attempts):
+            if attempt:
+                tracer.count("uart.retries")
+                time.sleep(min(RETRY_BACKOFF * 2 ** (attempt - 1), RETRY_BACKOFF_MAX))
+                wait = min(wait * 2, ceiling)
+            if not self._send(cmd, data):
+                return self._drop_port()  # The write itself failed: the port is gone or broken
+            sent_at = time.monotonic()
+            frame = self.read_frame(cmd, wait)
+            if frame is None and attempts == 1 and wait < ceiling and self.is_connected() and self.port_present():
+                frame = self.read_frame(cmd, ceiling - wait)
+            if frame is not None:
+                self.last_rtt = time.monotonic() - sent_at
+                if attempt == 0:
+                    self.rtt.sample(cmd, self.last_rtt)  # Resent requests give ambiguous times
+                else:
+                    self._owe(cmd, attempt, ceiling)  # The first answer may only have been late: the other copies answer too
+                return frame
+            if not self.is_connected() or not self.port_present():
+                return self._drop_port()
+        self._owe(cmd, attempts, ceiling)
+        return None
+
+    def _owe(self, cmd, count, timeout_sec):
+        # `count` answers to `cmd` may still arrive; after timeout_sec they count as lost
+        expiry = time.monotonic() + timeout_sec
+        self.late.setdefault(cmd, []).extend([expiry] * count)
+
+    def _is_late(self, cmd):
+        # True (and one fewer owed) if a frame of `cmd` that just arrived answers an earlier send
+        owed = self.late.get(cmd)
+        if not owed: return False
+        now = time.monotonic()
+        while owed and owed[0] < now:
+            owed.pop(0)
+        if not owed: return False
+        owed.pop(0)
+        tracer.count("uart.stale_frames")
+        return True
+
+    def _drop_port(self):
+        self.unplugged = not self.port_present()
+        if self.unplugged: tracer.count("uart.unplugged")
+        self.close_port()
+        return None
+
+    def exchange(self, cmd, data_byte, timeout_sec=2.0):
+        # One full request/response cycle: send, wait for the reply (None on any failure).
+        # No flush needed: the decoder skips corrupted bytes and frames of other commands, and
+        # read_frame() drops the late answers of the same command that earlier sends still owe.
+        return self.request(cmd, data_byte, timeout_sec)
+
+    def pipeline(self, commands, timeout_sec=2.0):
+        # Runs several commands as one burst: (cmd, data) or (cmd, data, timeout_sec) tuples,
+        # data being the name string for CMD_SET_NAME and (layout_id, tiles) for CMD_LOAD_BOARD. Each
+        # command goes out the moment the previous answer is decoded (the firmware re-arms its receiver
+        # only after replying, so writing further ahead would overrun it). Returns the responses in
+        # order, None where one failed.
+        responses = []
+        for command in commands:
+            if not self.is_connected():
+                break
+            cmd, data = command[0], command[1]
+            timeout = command[2] if len(command) > 2 else timeout_sec
+            responses.append(self.request(cmd, data, timeout))
+        return responses + [None] * (len(commands) - len(responses))
+
     def reset_buffer(self):
+        # Only for a fresh connection (after a reset nothing owed will ever be answered)
+        self.decoder.clear()
+        self.late.clear()
         if self.is_connected():
             try:
                 self.ser.reset_input_buffer()
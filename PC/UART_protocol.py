@@ -0,0 +1,42 @@
+# Wire protocol shared with the STM32 firmware (see Core/Src/main.c).
+# Every frame is [CMD, DATA..., CRC] where CRC is the XOR of all preceding bytes.
+# Byte-level encoding and decoding of the frames lives in UART_framing.
+
+CMD_START = 0x01
+CMD_RESET = 0x02
+CMD_SHUFFLE = 0x03
+CMD_SELECT = 0x04
+CMD_MATCH = 0x05
+CMD_GIVE_UP = 0x07
+CMD_HINT = 0x08
+CMD_SET_NAME = 0x09
+CMD_GET_TIME = 0x0B
+CMD_GET_LEADERS = 0x0C
+CMD_LOAD_BOARD = 0x0D  # Like CMD_START, but the PC sends the 50 tiles (after the header frame)
+CMD_RESTORE_BOARD = 0x0E  # A game in progress after the device lost it: tiles, elapsed seconds, shuffles used
+
+COMMAND_NAMES = {value: name[4:] for name, value in list(globals().items()) if name.startswith("CMD_")}
+
+PACKET_SIZE = 52  # 50 tiles + 1 byte CMD + 1 byte CRC
+
+# Full response length (CMD + data + CRC) for every command the device answers.
+# CMD_SHUFFLE answers with a board, or with a short [CMD, 0xFF, CRC] once the limit is reached;
+# CMD_LOAD_BOARD echoes the board, or answers short if it rejected it (bad CRC, tiles
+# that aren't in the deck); CMD_RESTORE_BOARD answers the same way.
+RESPONSE_LENGTHS = {
+    CMD_START: (PACKET_SIZE,),
+    CMD_RESET: (3,),
+    CMD_SHUFFLE: (PACKET_SIZE, 3),
+    CMD_SELECT: (3,),
+    CMD_MATCH: (3,),
+    CMD_GIVE_UP: (3,),
+    CMD_HINT: (4,),
+    CMD_SET_NAME: (3,),
+    CMD_GET_TIME: (PACKET_SIZE,),
+    CMD_GET_LEADERS: (202,),
+    CMD_LOAD_BOARD: (PACKET_SIZE, 3),
+    CMD_RESTORE_BOARD: (PACKET_SIZE, 3),
+}
+SHORT_ERROR = 0xFF  # Data byte of the short CMD_SHUFFLE / CMD_LOAD_BOARD answer
+NO_HINT = 100       # First index of a CMD_HINT answer when no pair is left
+
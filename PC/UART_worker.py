@@ -0,0 +1,188 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+from Mahjong_trace import tracer
+from UART_protocol import COMMAND_NAMES
+
+# Lower value = served first. User actions (and open/close, which must keep their order
+# relative to them) always overtake background polls.
+PRIORITY_USER = 0        # SELECT, MATCH, HINT, SHUFFLE, open/close...
+PRIORITY_BACKGROUND = 1  # GET_TIME and other polls
+LATENCY_WINDOW = 200     # Recent service times kept for the percentiles in stats()
+
+
+class UARTRequest:
+    # One unit of work for the I/O thread: either a protocol command (cmd/data, reply size comes from the protocol table)
+    # or an arbitrary action on the handler (open, close, name registration...)
+    __slots__ = ("cmd", "data", "timeout_sec", "action", "callbacks", "priority", "coalesce", "queued_at", "rtt")
+
+    def __init__(self, cmd=None, data=0x00, timeout_sec=2.0, action=None, callback=None,
+                 priority=PRIORITY_USER, coalesce=False):
+        self.cmd = cmd
+        self.data = data
+        self.timeout_sec = timeout_sec
+        self.action = action
+        self.callbacks = [callback] if callback is not None else []
+        self.priority = priority
+        self.coalesce = coalesce
+        self.queued_at = 0.0
+        self.rtt = None  # Send -> answer time of its (last) command on the line, set before the callbacks run
+
+    def key(self):
+        return (self.cmd, self.data)
+
+    def execute(self, uart):
+        if self.action is not None:
+            return self.action(uart)
+        return uart.exchange(self.cmd, self.data, self.timeout_sec)
+
+
+class RequestScheduler:
+    # Priority queue of pending UART requests with in-flight tracking.
+    # Requests marked `coalesce` are merged with an identical one that is still waiting,
+    # so a slow line never piles up a backlog of clock polls.
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pending_polls = {}
+        self._closed = False
+        self.in_flight = None
+        self.submitted = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.failed = 0
+        self.service = collections.deque(maxlen=LATENCY_WINDOW)
+        self.max_service = 0.0
+
+    def put(self, request):
+        with self._cond:
+            if request.coalesce:
+                pending = self._pending_polls.get(request.key())
+                if pending is not None:
+                    pending.callbacks.extend(request.callbacks)
+                    self.coalesced += 1
+                    return pending
+                self._pending_polls[request.key()] = request
+            request.queued_at = time.monotonic()
+            heapq.heappush(self._heap, (request.priority, next(self._seq), request))
+            self.submitted += 1
+            self._cond.notify()
+            return request
+
+    def get(self):
+        # Blocks until a request is available; returns None once the scheduler is closed
+        with self._cond:
+            while not self._heap and not self._closed:
+                self._cond.wait()
+            if not self._heap:
+                return None
+            request = heapq.heappop(self._heap)[2]
+            if request.coalesce:
+                self._pending_polls.pop(request.key(), None)
+            wait = time.monotonic() - request.queued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.in_flight = request
+            return request
+
+    def done(self, request, elapsed=0.0, ok=True):
+        # `elapsed`: time the request held the line; `ok`: it produced a result
+        with self._cond:
+            if self.in_flight is request:
+                self.in_flight = None
+            self.completed += 1
+            if not ok: self.failed += 1
+            self.service.append(elapsed)
+            self.max_service = max(self.max_service, elapsed)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def depth(self):
+        with self._cond:
+            return len(self._heap)
+
+    def is_idle(self):
+        with self._cond:
+            return not self._heap and self.in_flight is None
+
+    def stats(self):
+        with self._cond:
+            started = self.submitted - len(self._heap)
+            recent = sorted(self.service)
+            pick = lambda fraction: recent[min(len(recent) - 1, int(fraction * len(recent)))] * 1000.0 if recent else 0.0
+            return {
+                "depth": len(self._heap),
+                "in_flight": self.in_flight.cmd if self.in_flight is not None else None,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "coalesced": self.coalesced,
+                "avg_wait_ms": (self.total_wait / started * 1000.0) if started else 0.0,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "failed": self.failed,
+                "p50_ms": pick(0.50),
+                "p90_ms": pick(0.90),
+                "max_ms": self.max_service * 1000.0,
+            }
+
+
+class UARTWorker(threading.Thread):
+    # Owns the UARTHandler (and therefore the serial.Serial handle). Every read/write happens here,
+    # one request on the wire at a time, in scheduler order. Results are handed to
+    # `dispatch(callback, result)`, which must bring them back to the UI thread.
+    def __init__(self, uart, dispatch):
+        super().__init__(name="uart-worker", daemon=True)
+        self.uart = uart
+        self.dispatch = dispatch
+        self.scheduler = RequestScheduler()
+
+    def submit(self, request):
+        return self.scheduler.put(request)
+
+    def command(self, cmd, data=0x00, timeout_sec=2.0, callback=None, priority=PRIORITY_USER):
+        return self.submit(UARTRequest(cmd, data, timeout_sec, callback=callback, priority=priority))
+
+    def poll(self, cmd, data=0x00, timeout_sec=2.0, callback=None):
+        # Background request: lowest priority, merged with an identical poll that is still queued
+        return self.submit(UARTRequest(cmd, data, timeout_sec, callback=callback,
+                                       priority=PRIORITY_BACKGROUND, coalesce=True))
+
+    def transaction(self, commands, callback=None, timeout_sec=2.0):
+        # Several commands back-to-back on the wire; `callback` gets the list of responses
+        return self.call(lambda uart: uart.pipeline(commands, timeout_sec), callback)
+
+    def call(self, action, callback=None):
+        return self.submit(UARTRequest(action=action, callback=callback, priority=PRIORITY_USER))
+
+    def stop(self):
+        self.scheduler.close()
+
+    def run(self):
+        while True:
+            request = self.scheduler.get()
+            if request is None:
+                break
+            started = tracer.mark()
+            waited = time.monotonic() - request.queued_at if started is not None else 0.0
+            begun = time.monotonic()
+            self.uart.last_rtt = None
+            try:
+                result = request.execute(self.uart)
+            except Exception:
+                result = None
+            request.rtt = self.uart.last_rtt
+            if started is not None:
+                name = COMMAND_NAMES.get(request.cmd, "action") if request.cmd is not None else "action"
+                tracer.finish("worker." + name, started, wait_ms=round(waited * 1000.0, 3))
+            self.scheduler.done(request, time.monotonic() - begun, result is not None)
+            for callback in request.callbacks:
+                self.dispatch(callback, result)
+        self.uart.close_port()
@@ -1,18 +1,17 @@
+import os
+import sys
+
 import serial
-import struct
-import time
+
+# Кодек протоколу лежить у PC/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from UART_codec import Leaderboard, decode_packet
+from UART_framing import FrameEncoder, xor_crc
+from UART_protocol import CMD_GET_LEADERS
 
 # Налаштування (зміни COM-порт на свій)
 SERIAL_PORT = "COM5" 
 BAUD_RATE = 115200
-CMD_GET_LEADERS = 0x0C
-
-def calculate_xor_crc(data):
-    """Розрахунок CRC за логікою: CMD ^ DATA[0] ^ DATA[1] ^ ..."""
-    crc = 0
-    for byte in data:
-        crc ^= byte
-    return crc
 
 def test_read_leaderboard():
     try:
@@ -22,8 +21,7 @@ def test_read_leaderboard():
 
         # 1. Формуємо пакет запиту [CMD, DATA, CRC]
         # Для запиту дані зазвичай 0x00
-        request_packet = bytearray([CMD_GET_LEADERS, 0x00])
-        request_packet.append(calculate_xor_crc(request_packet))
+        request_packet = bytes(FrameEncoder().request(CMD_GET_LEADERS, 0x00))
         
         print(f"Відправка запиту: {request_packet.hex().upper()}")
         ser.write(request_packet)
@@ -38,36 +36,21 @@ def test_read_leaderboard():
             print(f"Помилка: Отримано лише {len(raw_response)} байт. Перевір код STM32.")
             return
 
-        # 3. Перевірка CRC
-        received_data_for_crc = raw_response[:-1]
-        received_crc = raw_response[-1]
-        calculated_crc = calculate_xor_crc(received_data_for_crc)
-
-        if received_crc != calculated_crc:
-            print(f"Помилка CRC! Отримано: {hex(received_crc)}, Очікувалось: {hex(calculated_crc)}")
-            # Продовжимо для тесту, щоб побачити, що прийшло
-        else:
-            print("CRC підтверджено!")
+        # 3. Перевірка CRC і розбір (16 байт імені + uint32 часу на кожного лідера)
+        board = decode_packet(raw_response, CMD_GET_LEADERS)
+        if not isinstance(board, Leaderboard):
+            print(f"Помилка CRC або формату! Отримано CRC {hex(raw_response[-1])}, "
+                  f"очікувалось {hex(xor_crc(raw_response[:-1]))}")
+            return
+        print("CRC підтверджено!")
 
-        # 4. Парсинг даних
-        # Структура: 16 байт (рядок) + 4 байти (uint32)
-        payload = raw_response[1:-1] # Відрізаємо CMD та CRC
-        
         print("\n=== ТАБЛИЦЯ ЛІДЕРІВ (STM32) ===")
         print(f"{'№':<3} | {'Імя':<16} | {'Час (сек)':<10}")
         print("-" * 35)
 
-        for i in range(10):
-            chunk = payload[i*20 : (i+1)*20]
-            # <16sI: Little-endian, рядок 16 байт, unsigned int 4 байти
-            name_raw, play_time = struct.unpack('<16sI', chunk)
-            
-            # Декодуємо ім'я, видаляючи нульові байти \x00
-            name = name_raw.decode('utf-8').strip('\x00')
-            
-            # Виводимо результат
-            display_time = play_time if play_time < 999999 else "---"
-            print(f"{i+1:<3} | {name:<16} | {display_time:<10}")
+        for i, entry in enumerate(board.entries):
+            display_time = "---" if entry.empty else entry.seconds
+            print(f"{i+1:<3} | {entry.name:<16} | {display_time:<10}")
 
     except Exception as e:
         print(f"Помилка: {e}")
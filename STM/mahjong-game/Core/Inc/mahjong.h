@@ -18,6 +18,10 @@
 #define CMD_SET_NAME    0x09
 #define CMD_GET_TIME    0x0B
 #define CMD_GET_LEADERS 0x0C
+#define CMD_LOAD_BOARD  0x0D
+#define CMD_RESTORE_BOARD 0x0E
+
+#define RESTORE_PAYLOAD (TOTAL_PIECES + 5) // Плитки, час гри (4 байти, big-endian), використані перемішування
 
 typedef struct {
     char name[16];
@@ -31,12 +35,14 @@ extern uint8_t current_layout;
 // Функції ядра та логіки
 void Mahjong_Init(void);
 void Mahjong_Generate_New_Layout(uint8_t layout_type);
+uint8_t Mahjong_Load_Board(uint8_t layout_type, const uint8_t *tiles);
 uint8_t* Mahjong_Get_Board_State(void);
 void Mahjong_SetPlayerName(const char* name);
 char* Mahjong_GetPlayerName(void);
 
 // Команди гри
 void cmd_reset(void);
+void cmd_board_loaded(uint8_t shuffles_used);
 void cmd_give_up(void);
 uint8_t cmd_shuffle(void);
 uint8_t cmd_select(uint8_t index);
@@ -45,6 +51,7 @@ uint8_t cmd_hint(uint8_t *idx1, uint8_t *idx2);
 
 // Таймер та Збереження
 void Timer_Start(void);
+void Timer_Resume(uint32_t seconds);
 uint32_t Timer_GetSeconds(void);
 void Timer_Tick(void);
 void Load_HighScores(void);
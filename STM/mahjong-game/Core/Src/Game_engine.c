@@ -14,12 +14,21 @@ volatile uint32_t hardware_seconds = 0;      // Лічильник секунд
 static uint8_t hw_timer_running = 0;         // Статус таймера (активний/зупинений)
 
 /* --- Допоміжна функція додавання плиток --- */
-// idx - вказівник на поточну позицію в масиві board_state
+// deck - масив, який заповнюється, idx - вказівник на поточну позицію в ньому
 // grp - категорія плиток, start - початкове значення, count - кількість типів, copies - скільки копій кожної
-static void add_tiles(uint8_t *idx, uint8_t grp, int start, int count, int copies) {
+static void add_tiles(uint8_t *deck, uint8_t *idx, uint8_t grp, int start, int count, int copies) {
     for (int v = 0; v < count; v++)
         for (int c = 0; c < copies; c++)
-            board_state[(*idx)++] = PACK_TILE(grp, start + v);
+            deck[(*idx)++] = PACK_TILE(grp, start + v);
+}
+
+// Наповнення колоди згідно з правилами маджонгу (спрощено), без перемішування
+static void fill_deck(uint8_t *deck) {
+    uint8_t idx = 0;
+    add_tiles(deck, &idx, 0, 1, 6, 4); // Бамбук: 6 видів по 4 копії
+    add_tiles(deck, &idx, 2, 1, 4, 4); // Кола: 4 види по 4 копії
+    add_tiles(deck, &idx, 4, 1, 1, 2); // Дракони: 1 вид, 2 копії
+    add_tiles(deck, &idx, 5, 1, 4, 2); // Квіти/Сезони: 4 види по 2 копії
 }
 
 // Очищення ігрового поля
@@ -30,13 +39,7 @@ void Mahjong_Init(void) {
 // Генерація нового набору плиток та їх перемішування
 void Mahjong_Generate_New_Layout(uint8_t layout_type) {
     current_layout = layout_type;
-    uint8_t idx = 0;
-
-    // Наповнення колоди згідно з правилами маджонгу (спрощено):
-    add_tiles(&idx, 0, 1, 6, 4); // Бамбук: 6 видів по 4 копії
-    add_tiles(&idx, 2, 1, 4, 4); // Кола: 4 види по 4 копії
-    add_tiles(&idx, 4, 1, 1, 2); // Дракони: 1 вид, 2 копії
-    add_tiles(&idx, 5, 1, 4, 2); // Квіти/Сезони: 4 види по 2 копії
+    fill_deck(board_state);
 
     // Перемішування плиток (Shuffle), щоб вони стояли на випадкових місцях
     for (int i = TOTAL_PIECES - 1; i > 0; i--) {
@@ -47,6 +50,26 @@ void Mahjong_Generate_New_Layout(uint8_t layout_type) {
     }
 }
 
+// Завантаження готового розкладу з ПК (CMD_LOAD_BOARD).
+// Приймаються лише плитки з колоди fill_deck (нова роздача або гра, що триває, 0 = порожня клітинка),
+// інакше поле не змінюється.
+uint8_t Mahjong_Load_Board(uint8_t layout_type, const uint8_t *tiles) {
+    uint8_t deck[TOTAL_PIECES];
+    uint8_t counts[256] = {0};
+
+    fill_deck(deck);
+    for (int i = 0; i < TOTAL_PIECES; i++) counts[deck[i]]++;
+    for (int i = 0; i < TOTAL_PIECES; i++) {
+        if (!tiles[i]) continue;
+        if (counts[tiles[i]] == 0) return 0; // Зайва або невідома плитка
+        counts[tiles[i]]--;
+    }
+
+    current_layout = layout_type;
+    memcpy(board_state, tiles, TOTAL_PIECES);
+    return 1;
+}
+
 /* --- Геттери та Сеттери --- */
 
 // Повертає вказівник на масив поля для передачі по UART або аналізу
@@ -71,6 +94,12 @@ void Timer_Start(void) {
     hw_timer_running = 1;
 }
 
+// Продовження відліку з часу, який пам'ятає ПК (відновлення сесії після перезапуску плати)
+void Timer_Resume(uint32_t seconds) {
+    hardware_seconds = seconds;
+    hw_timer_running = 1;
+}
+
 uint32_t Timer_GetSeconds(void) {
     return hardware_seconds;
 }
@@ -48,26 +48,45 @@ static void get_coord(uint8_t idx, int* l, int* r, int* c) {
     }
 }
 
+// --- Таблиці сусідів ---
+// Будуються один раз при зміні лейауту, щоб перевірка плитки була простим переглядом таблиці
+// замість повторного розрахунку координат (-1 = сусіда немає)
+static int8_t above_tbl[TOTAL_PIECES][4]; // Плитки верхнього шару, що накривають дану
+static int8_t left_tbl[TOTAL_PIECES];
+static int8_t right_tbl[TOTAL_PIECES];
+static uint8_t tables_layout = 0xFF;      // Для якого лейауту побудовані таблиці
+
+static void build_layout_tables(void) {
+    for (uint8_t i = 0; i < TOTAL_PIECES; i++) {
+        int l, r, c; get_coord(i, &l, &r, &c);
+        int next_l = l + 1;
+
+        // Прямокутний лейаут: 4 точки зверху, трикутний — 2
+        above_tbl[i][0] = get_index(next_l, r-1, c-1);
+        above_tbl[i][1] = get_index(next_l, r-1, c);
+        above_tbl[i][2] = (current_layout == 0) ? get_index(next_l, r, c-1) : -1;
+        above_tbl[i][3] = (current_layout == 0) ? get_index(next_l, r, c) : -1;
+
+        left_tbl[i] = get_index(l, r, c-1);
+        right_tbl[i] = get_index(l, r, c+1);
+    }
+    tables_layout = current_layout;
+}
+
 // Перевірка, чи "відкрита" плитка (чи можна її брати)
 // Згідно з правилами: зверху не повинно бути плиток, і хоча б один бік (лівий чи правий) має бути вільним
 static int is_tile_exposed(uint8_t index) {
     if (!is_tile_present(index)) return 0;
-    int l, r, c; get_coord(index, &l, &r, &c);
+    if (tables_layout != current_layout) build_layout_tables();
 
     // 1. Перевірка зверху (чи не заблокована плитка верхнім шаром)
-    int next_l = l + 1;
-    if (current_layout == 0) {
-        // У прямокутному лейауті перевіряємо 4 сусідні точки зверху
-        int b[] = {get_index(next_l, r-1, c-1), get_index(next_l, r-1, c), get_index(next_l, r, c-1), get_index(next_l, r, c)};
-        for(int i=0; i<4; i++) if (b[i] != -1 && is_tile_present(b[i])) return 0;
-    } else {
-        // У трикутному — 2 точки
-        int b[] = {get_index(next_l, r-1, c-1), get_index(next_l, r-1, c)};
-        for(int i=0; i<2; i++) if (b[i] != -1 && is_tile_present(b[i])) return 0;
+    for (int i = 0; i < 4; i++) {
+        if (above_tbl[index][i] != -1 && is_tile_present(above_tbl[index][i])) return 0;
     }
 
     // 2. Перевірка боків (заблокована, якщо і зліва, і справа є сусіди)
-    if (is_tile_present(get_index(l, r, c-1)) && is_tile_present(get_index(l, r, c+1))) return 0;
+    if (left_tbl[index] != -1 && right_tbl[index] != -1 &&
+        is_tile_present(left_tbl[index]) && is_tile_present(right_tbl[index])) return 0;
 
     return 1; // Плитка вільна для ходу
 }
@@ -80,6 +99,13 @@ void cmd_reset(void) {
     Mahjong_Generate_New_Layout(current_layout);
 }
 
+// Розклад прийнято від ПК: нова гра (CMD_LOAD_BOARD, 0 перемішувань) або відновлена сесія
+// (CMD_RESTORE_BOARD, скільки перемішувань гравець уже використав)
+void cmd_board_loaded(uint8_t shuffles_used) {
+    active_selection = -1;
+    shuffle_count = shuffles_used;
+}
+
 void cmd_give_up(void) { cmd_reset(); }
 
 // Перемішування плиток, що залишилися на полі (якщо гра зайшла у глухий кут)
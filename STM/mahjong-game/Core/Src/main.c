@@ -130,6 +130,37 @@ int main(void) {
                         tx_packet[1] = 0x00;
                         break;
 
+                    case CMD_LOAD_BOARD: {
+                        // Як CMD_START, але розклад (50 байт + CRC) надсилає ПК; data — тип розкладки
+                        uint8_t board_buf[TOTAL_PIECES + 1];
+                        __HAL_UART_CLEAR_OREFLAG(&huart1);
+                        if (HAL_UART_Receive(&huart1, board_buf, TOTAL_PIECES + 1, 500) == HAL_OK
+                                && Calc_CRC(board_buf, TOTAL_PIECES) == board_buf[TOTAL_PIECES]
+                                && Mahjong_Load_Board(data, board_buf)) {
+                            cmd_board_loaded(0);               // Скидання вибору та лічильника перемішувань
+                            Timer_Start();
+                            memcpy(&tx_packet[1], Mahjong_Get_Board_State(), 50);
+                            tx_len = 52;
+                        } else tx_packet[1] = 0xFF; // Розклад не прийнято
+                        break;
+                    }
+                    case CMD_RESTORE_BOARD: {
+                        // Відновлення гри, що триває: розклад, час і перемішування надсилає ПК, таймер
+                        // продовжує відлік (а не стартує з нуля), тож рекорд у flash буде чесним
+                        uint8_t restore_buf[RESTORE_PAYLOAD + 1];
+                        __HAL_UART_CLEAR_OREFLAG(&huart1);
+                        if (HAL_UART_Receive(&huart1, restore_buf, RESTORE_PAYLOAD + 1, 500) == HAL_OK
+                                && Calc_CRC(restore_buf, RESTORE_PAYLOAD) == restore_buf[RESTORE_PAYLOAD]
+                                && restore_buf[TOTAL_PIECES + 4] <= MAX_SHUFFLES
+                                && Mahjong_Load_Board(data, restore_buf)) {
+                            uint8_t *t = &restore_buf[TOTAL_PIECES];
+                            cmd_board_loaded(t[4]);
+                            Timer_Resume(((uint32_t)t[0] << 24) | ((uint32_t)t[1] << 16) | ((uint32_t)t[2] << 8) | t[3]);
+                            memcpy(&tx_packet[1], Mahjong_Get_Board_State(), 50);
+                            tx_len = 52;
+                        } else tx_packet[1] = 0xFF; // Сесію не прийнято
+                        break;
+                    }
                     case CMD_GET_TIME: {
                         uint32_t elapsed = Timer_GetSeconds();
                         // Розбиття 32-бітного числа на 4 байти для передачі